@@ -0,0 +1,84 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+"""
+Benchmark: CPU time that reggie itself consumes while it waits on a long-running external program.
+
+The dummy binary is a shell loop that prints a line every --interval seconds for --duration seconds. The CPU time of the reggie
+process (user + system, without the child) is measured for ExternalCommand.execute_cmd() and, for comparison, for the busy-polling
+loop that was used before (select() with zero timeout while the child is running).
+
+Usage: python3 benchmarks/externalcommand_cpu_time.py [--duration 10] [--interval 0.5]
+"""
+
+import argparse
+import os
+import resource
+import select
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from reggie.externalcommand import ExternalCommand
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def busy_polling(cmd, directory):
+    """Previous implementation: poll the child and the pipes without blocking"""
+    (pipeOut_r, pipeOut_w) = os.pipe()
+    (pipeErr_r, pipeErr_w) = os.pipe()
+    process = subprocess.Popen(cmd, stdout=pipeOut_w, stderr=pipeErr_w, cwd=directory)
+    stdout = []
+    while process.poll() is None:
+        while len(select.select([pipeOut_r], [], [], 0)[0]) == 1:
+            stdout.append(os.read(pipeOut_r, 1024))
+        while len(select.select([pipeErr_r], [], [], 0)[0]) == 1:
+            os.read(pipeErr_r, 1024)
+    for pipe in (pipeOut_r, pipeOut_w, pipeErr_r, pipeErr_w):
+        os.close(pipe)
+    return process.returncode
+
+
+def event_driven(cmd, directory):
+    """Current implementation: ExternalCommand.execute_cmd() sleeps until data is available or the child exits"""
+    return ExternalCommand().execute_cmd(cmd, directory, string_info=None, displayOnFailure=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU time of reggie while waiting on a long-running external program.')
+    parser.add_argument('--duration', help='Run time of the dummy binary in seconds (default: 10).', type=float, default=10.0)
+    parser.add_argument('--interval', help='Time between two lines of output of the dummy binary in seconds (default: 0.5).', type=float, default=0.5)
+    args = parser.parse_args()
+
+    steps = max(1, int(args.duration / args.interval))
+    cmd = ['sh', '-c', 'i=0; while [ $i -lt %s ]; do echo "step $i"; sleep %s; i=$((i+1)); done' % (steps, args.interval)]
+
+    print("Dummy binary: %s lines of output within %.1f sec" % (steps, steps * args.interval))
+    print("%-30s %12s %12s %12s" % ("implementation", "wall [sec]", "CPU [sec]", "CPU / wall"))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, function in (("busy polling (previous)", busy_polling), ("event-driven (execute_cmd)", event_driven)):
+            cpu_start = cpu_time()
+            start = timer()
+            function(cmd, directory)
+            wall = timer() - start
+            cpu = cpu_time() - cpu_start
+            print("%-30s %12.2f %12.2f %11.1f%%" % (name, wall, cpu, 100.0 * cpu / wall))
+
+
+if __name__ == '__main__':
+    main()
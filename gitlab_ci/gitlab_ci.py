@@ -14,9 +14,12 @@ from __future__ import print_function  # required for print() function with line
 from timeit import default_timer as timer
 import os
 import re
+import atexit
 import logging
 import argparse
 import shutil
+import collections
+import concurrent.futures
 import tools
 import gitlab_ci_tools
 
@@ -32,6 +35,24 @@ reggie_exe_path = os.path.join(settings.absolute_reggie_path, 'reggie.py')
 if not os.path.exists(reggie_exe_path):
     print("Reggie main file not found in reggie repository under: '%s'" % reggie_exe_path)
     exit(1)
+from reggie import check
+from reggie import combinations
+from reggie import compilercache
+from reggie import resources
+from reggie.buildcache import BuildCache
+from reggie.externalcommand import ExternalCommand
+from reggie.outputdirectory import OutputDirectory
+
+# options of a case that change its builds (or skip building), such cases are not considered in the planning phase and compile their builds themselves
+PLANNING_EXCLUDED_OPTIONS = ('-e', '--exe', '-r', '--run', '-c', '--carryon', '-n', '--singledir', '--incremental', '-o', '--coverage', '-t', '--compiletype', '-y', '--dummy')
+
+# directories of the planning phase in the output directory of this tool (builds that cannot be compiled in the directory of their cases and the build cache)
+PLANNING_OUTPUT_DIR = 'output_dir_planning'
+PLANNING_BUILD_CACHE = 'build_cache'
+
+# size limit of the build cache of the planning phase in bytes: large enough for all unique builds, none of them must be evicted before
+# the cases have restored it
+PLANNING_BUILD_CACHE_SIZE = 1e12
 
 
 def CheckBinaryCall(c):
@@ -58,6 +79,89 @@ def CheckBinaryCall(c):
     return c.strip()
 
 
+def GetCaseOptions(case):
+    """Extract the reggie options of a case from its command in the .gitlab-ci.yml, the first option is the check directory"""
+    c = case.command[case.command.find("reggie.py") + 9 :].strip()
+    c = c[c.find("/regressioncheck/checks") :].strip()
+    c = str(basedir + c).strip()  # add basedir to reggie-checks folder
+    return [str(x).strip() for x in c.split(" ")]
+
+
+def PlanBuilds(cases, build_cache, build_jobs, dryrun, directory):
+    """
+    Planning phase: read the builds.ini of all cases and compile each unique build configuration only once (build_jobs builds at the
+    same time) and store it in the build cache, from which the cases restore them (reggie --build-cache) instead of compiling the same
+    binary again. Each build is compiled in the directory in which most of its cases restore it ([directory]/output_dir/build_[number]),
+    because the RPATH of the build tree points there; a second build for the same directory is compiled in PLANNING_OUTPUT_DIR. The
+    directories are removed afterwards.
+    """
+    # 1. collect the unique build configurations of all cases
+    unique = {}  # build configuration: numbers of the cases that use it
+    source_directories = {}  # build configuration: check directory of the first case that uses it
+    numbers = collections.Counter()  # (build configuration, number of the build in a case): number of cases
+    number_of_builds = 0
+    for i, case in enumerate(cases, start=1):
+        options = GetCaseOptions(case)
+        if i < args.begin or any(option in PLANNING_EXCLUDED_OPTIONS for option in options[1:]):
+            continue
+        builds_ini = os.path.join(options[0], 'builds.ini')
+        if not os.path.exists(builds_ini):
+            continue
+        combis, _ = combinations.getCombinations(builds_ini, OverrideOptionKey='CMAKE_BUILD_TYPE', OverrideOptionValue=args.compiletype)
+        for number, combi in enumerate(combis, start=1):
+            number_of_builds += 1
+            key = tuple(sorted(combi.items()))
+            unique.setdefault(key, []).append(i)
+            source_directories.setdefault(key, options[0])
+            numbers[key, number] += 1
+    print(tools.blue("Planning: %s builds of all cases, %s unique build configurations" % (number_of_builds, len(unique))))
+    if dryrun or len(unique) == 0:
+        return
+
+    # 2. compile the unique builds concurrently (the cmake and make output is displayed in a single block per command)
+    start_planning = timer()
+    locations = {}  # build configuration: (output directory, number of the build)
+    for key, number in (key_number for key_number, _ in numbers.most_common()):
+        if key not in locations and (OutputDirectory.output_dir, number) not in locations.values():
+            locations[key] = (OutputDirectory.output_dir, number)
+    for number, key in enumerate(unique, start=1):
+        locations.setdefault(key, (PLANNING_OUTPUT_DIR, number))
+    output_dir = OutputDirectory.output_dir
+    ExternalCommand.concurrent = True
+    try:
+        launcher = compilercache.getLauncher('auto')  # same default as reggie, the compiler launcher is part of the cmake command
+        builds = []
+        for key in unique:
+            OutputDirectory.output_dir = os.path.join(directory, locations[key][0])
+            builds.append(check.Build(basedir, source_directories[key], dict(key), locations[key][1], launcher=launcher))
+        # the CPUs and the available memory are shared by the builds that are compiled at the same time
+        cores = max(1, (os.cpu_count() or 1) // build_jobs)
+        jobs = min(cores, max(1, resources.getBuildJobs()[0] // build_jobs))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=build_jobs) as pool:
+            results = list(pool.map(lambda build: CompileBuild(build, build_cache, jobs), builds))
+        for number, (build, result, used_by) in enumerate(zip(builds, results, unique.values()), start=1):  # noqa: B905 same length by construction (strict requires python >= 3.10)
+            print("[%5d] %s %s (cases %s)" % (number, result, " ".join(build.cmake_cmd), ", ".join(str(i) for i in used_by)))
+    finally:
+        ExternalCommand.concurrent = False
+        OutputDirectory.output_dir = output_dir
+        shutil.rmtree(os.path.join(directory, PLANNING_OUTPUT_DIR), ignore_errors=True)
+        shutil.rmtree(os.path.join(directory, output_dir), ignore_errors=True)
+    print(tools.blue("Planning: compiled %s unique builds in [%.2f sec]" % (len(builds), timer() - start_planning)))
+    print('=' * 132)
+
+
+def CompileBuild(build, build_cache, jobs):
+    """Compile a build of the planning phase and store it in the build cache, a failed build is compiled (and reported) again by its cases"""
+    if build_cache.contains(build):
+        return tools.yellow("in build cache")
+    try:
+        build.compile(jobs)
+    except check.BuildFailedException:
+        return tools.red("Failed")
+    build_cache.store(build)
+    return tools.blue("Successful")
+
+
 def DisplayInitMessage(Bool, Message):
     if Bool:
         print("\n%s\n" % Message)
@@ -91,6 +195,8 @@ parser.add_argument('-i', '--info', type=int, default=1, help='Debug level for t
 parser.add_argument('-o', '--only', action='store_true',help='Only run one case and exit afterwards (from the list that this tools creates).')
 parser.add_argument('-n', '--dryrun', action='store_true',help='Simply list all possible cases without performing any run.')
 parser.add_argument('-t', '--compiletype', help='Override all CMAKE_BUILD_TYPE settings by ignoring the value set in builds.ini (e.g. DEBUG or RELEASE).')
+parser.add_argument('-j', '--build-jobs', type=int, default=2, help='Number of unique builds that are compiled at the same time in the planning phase (default: 2).')
+parser.add_argument('--no-planning', action='store_true', help='Skip the planning phase, in which each unique build configuration of all cases is compiled only once, and let each case compile its own builds.')
 # fmt: on
 
 # get reggie command line arguments
@@ -194,20 +300,32 @@ else:
     print("List of possible cases from gitlab-ci.yml are")
 
 print(" ")
+
+# planning phase: the builds that are shared by several cases are compiled only once and handed to the cases via a build cache
+build_cache = None
+if not args.no_planning and not os.getenv('CODE_COVERAGE'):
+    if not args.dryrun:
+        build_cache = BuildCache(os.path.join(target_directory, PLANNING_BUILD_CACHE), PLANNING_BUILD_CACHE_SIZE)
+        # the builds of the planning phase are only needed by the cases of this execution (also removed when exiting after a failed case)
+        atexit.register(shutil.rmtree, build_cache.path, ignore_errors=True)
+    PlanBuilds(cases, build_cache, max(1, args.build_jobs), args.dryrun, os.getcwd())
+
 i = 1
 nErrors = 0
 for case in cases:
     # extract the reggie case from the command in the gitlay-ci.yml line by looking for "reggie.py" and "/regressioncheck/checks"
-    c = case.command[case.command.find("reggie.py") + 9 :].strip()
-    c = c[c.find("/regressioncheck/checks") :].strip()
-    c = str(basedir + c).strip()  # add basedir to reggie-checks folder
-    case_dir = c.split(" ")[0]
+    options = GetCaseOptions(case)
+    case_dir = options[0]
     if not os.path.exists(case_dir):  # Sanity check if folder exists: use only the part of the string up to the first (whitespace (" ")
         print(tools.red("case directory not found under: '%s'" % case_dir))
         exit(1)
 
     # set the command line "cmd"
-    cmd = ["python", reggie_path] + [str(x).strip() for x in c.split(" ")]
+    cmd = ["python", reggie_path] + options
+
+    # restore the builds of the planning phase
+    if build_cache:
+        cmd += ["--build-cache", build_cache.path]
 
     # add debug level to gitlab-ci command line
     if args.info:
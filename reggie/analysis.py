@@ -449,8 +449,13 @@ def getAnalyzes(path, example, args):
 
 
 class Analyze:  # main class from which all analyze functions are derived
-    total_errors = 0  # errors gathered during run
-    total_infos = 0  # information/warnings gathered during run
+    total_errors = tools.SharedCounter()  # errors gathered during run (thread-safe, examples might be analyzed concurrently)
+    total_infos = tools.SharedCounter()  # information/warnings gathered during run
+    per_run = False  # True if each run is analyzed independently of the other runs of the command line
+
+    def is_per_run(self):
+        """Check if perform() may be called for each run as soon as it has finished (not possible when each run uses its own diff)"""
+        return self.per_run and not getattr(self, 'one_diff_per_run', False)
 
 
 # ==================================================================================================
@@ -499,6 +504,8 @@ class Clean_up_files:
 class Analyze_L2_file(Analyze):
     """Read the L2 error norms from std.out and compare with pre-defined upper barrier"""
 
+    per_run = True
+
     def __init__(self, L2ErrorFile):
         self.file = L2ErrorFile.file
         self.L2_tolerance = L2ErrorFile.tolerance
@@ -604,6 +611,8 @@ class Analyze_L2_file(Analyze):
 class Analyze_L2(Analyze):
     """Read the L2 error norms from std.out and compare with pre-defined upper barrier"""
 
+    per_run = True
+
     def __init__(self, L2Error):
         self.L2_tolerance = L2Error.tolerance  # tolerance value for comparison with the L_2 error from std.out
         self.error_name = L2Error.error_name  # string name of the L2 error in the std.out file (default is "L_2")
@@ -1206,6 +1215,8 @@ class Analyze_Convtest_p(Analyze):
 
 
 class Analyze_h5diff(Analyze, ExternalCommand):
+    per_run = True
+
     def __init__(self, h5diff):
         # Set number of diffs per run [True/False]
         self.one_diff_per_run = h5diff.one_diff_per_run in ('True', 'true', 't', 'T')
@@ -1917,6 +1928,8 @@ class Analyze_h5diff(Analyze, ExternalCommand):
 class Analyze_vtudiff(Analyze, ExternalCommand):
     # Improvement: https://discourse.vtk.org/t/introducing-a-new-data-comparison-utility-in-vtk/12549/9
     # Comparison of two vtk arrays directly in python so that converting in numpy arrays is not necessary, currently only in C++ and not yet as python utility function
+    per_run = True
+
     def __init__(self, vtudiff):
         # Set number of diffs per run [True/False]
         self.one_diff_per_run = vtudiff.one_diff_per_run in ('True', 'true', 't', 'T')
@@ -2455,6 +2468,8 @@ class Analyze_vtudiff(Analyze, ExternalCommand):
 
 
 class Analyze_check_hdf5(Analyze):
+    per_run = True
+
     def __init__(self, CheckHDF5):
         # fmt: off
         self.file                = CheckHDF5.file
@@ -2572,6 +2587,8 @@ class Analyze_check_hdf5(Analyze):
 
 
 class Analyze_compare_data_file(Analyze):
+    per_run = True
+
     def __init__(self, CompareDataFile):
         # Set number of diffs per run [True/False]
         if isinstance(CompareDataFile.one_diff_per_run, bool):  # check if default value is still set
@@ -2812,6 +2829,8 @@ class Analyze_compare_data_file(Analyze):
 
 
 class Analyze_integrate_line(Analyze):
+    per_run = True
+
     def __init__(self, IntegrateLine):
         # fmt: off
         self.file                = IntegrateLine.file
@@ -2948,6 +2967,8 @@ class Analyze_integrate_line(Analyze):
 
 
 class Analyze_compare_column(Analyze):
+    per_run = True
+
     def __init__(self, CompareColumn, example):
         # Set number of diffs per restart file [True/False]
         if isinstance(CompareColumn.one_diff_per_restart_file, bool):  # check if default value is still set
@@ -12,12 +12,16 @@
 # ==================================================================================================================================
 import argparse
 import os
+import tempfile
+import logging
 from sys import platform
 import socket
 import re
 import subprocess
 from reggie import tools
 from reggie import check
+from reggie import scheduler
+from reggie import compilercache
 from reggie.outputdirectory import OutputDirectory
 
 try:
@@ -82,7 +86,6 @@ def getMaxCPUCores():
                         physical_cores[(physical_id, core_id)] = True
 
         # Count unique (physical_id, core_id) pairs
-        print(len(physical_cores))
         return len(physical_cores)
     except Exception:
         pass
@@ -108,10 +111,15 @@ def getArgsAndBuilds():
     parser.add_argument('-e', '--exe'        , help='Path to executable of code that should be tested.')
     parser.add_argument('-m', '--MPIexe'     , help='Path to mpirun executable. The correct MPI lib must be used, i.e. the one which which the executable (e.g. flexi) was compiled, e.g., /opt/openmpi/2.0.2/bin/mpirun.', default='mpirun')  # noqa: E501
     parser.add_argument('-d', '--debug'      , help='Debug level.', type=int, default=0)
-    parser.add_argument('-j', '--buildprocs' , help='Number of processors used for compiling (make -j XXX).', type=int, default=0)
+    parser.add_argument('-j', '--buildprocs' , help='Number of processors used for compiling (make -j XXX). Default: 0, i.e., chosen automatically from the CPUs (cgroup quota), the available memory and the peak memory per compile job of previous builds. Use -1 for unlimited make -j.', type=int, default=0)  # noqa: E501
     parser.add_argument('-b', '--basedir'    , help='Path to basedir of code that should be tested (contains CMakeLists.txt).')
     parser.add_argument('-y', '--dummy'      , help='Use dummy_basedir and dummy_checks for fast testing on dummy code.', action='store_true')
     parser.add_argument('-n', '--singledir'  , help='Use a single build directory for all combinations', action='store_true')
+    parser.add_argument('--smoke'            , help='Smoke tier: only compile a minimal subset of the build combinations in builds.ini, such that each example is still executed with at least one build that is not excluded in its excludeBuild.ini. The dropped builds are listed in the summary.', action='store_true')  # noqa: E501
+    parser.add_argument('--incremental'      , help='Compile all combinations in a single build tree, which is reconfigured in place and built incrementally, with the combinations ordered such that as few options as possible change between consecutive builds. The binary of each build is copied into its own build directory.', action='store_true')  # noqa: E501
+    parser.add_argument('--staging'          , help="Strategy for copying the example directories into the run directories: 'reflink' clones the files (copy-on-write) where the file system supports it, 'hardlink' additionally hard-links the files declared via 'hardlink' in the staging.ini of an example (WARNING: these files are shared with the example directory, a run that modifies them in place modifies the example for all following runs and builds), 'copy' copies all files. Permission bits and modification times are preserved. Unsupported methods fall back to copying (default: reflink).", choices=['reflink', 'hardlink', 'copy'], default='reflink')  # noqa: E501
+    parser.add_argument('--scratch'          , help='Execute each run (and its externals) in a node-local scratch directory in DIR (default: $TMPDIR or /tmp if no DIR is given, e.g. /dev/shm for tmpfs) instead of output_dir. Afterwards, the files referenced in analyze.ini and the *.out/*.err files (all files of failed runs) are copied back into output_dir.', nargs='?', const=tempfile.gettempdir(), default=None, metavar='DIR')  # noqa: E501
+    parser.add_argument('--no-run-dedup'     , help='Execute the examples of each build, also when the build has produced the same binaries (object files and link commands, except for the userblock) as a previous build. By default, the runs of such a build are skipped and the results of the previous build are displayed for both builds.', action='store_true')  # noqa: E501
     parser.add_argument('-r', '--run'        , help='Run all binaries for all examples with all run-combinations for all existing binaries.', action='store_true' )
     parser.add_argument('-s', '--save'       , help='Do not remove output directories buildsXXXX in output_dir after successful run.', action='store_true')
     parser.add_argument('-t', '--compiletype', help='Override all CMAKE_BUILD_TYPE settings by ignoring the value set in builds.ini (e.g. DEBUG or RELEASE).')
@@ -121,10 +129,28 @@ def getArgsAndBuilds():
     parser.add_argument('-i', '--noMPI'      , help='Run program without "mpirun" (single thread execution).', action='store_true')
     parser.add_argument('-p', '--stop'       , help='Stop on first error.', action='store_true')
     parser.add_argument('-l', '--limitprocs' , help='Limit the number of processes to be used for the rune.', type=int, default=0)
-    parser.add_argument('check', help='Path to check-/example-directory.')
+    parser.add_argument('check', help='Path to check-/example-directory.', nargs='?')
     parser.add_argument('-o', '--coverage'   , help='Compile code with code coverage option, always returns output in json format. Additional values (resulting in additional output formats): 1=HTML output, 2=Cobertura XML, also allows 12 for both. Default=0 if flag used without value.', nargs='?', const='0', default=None) # noqa: E501
     parser.add_argument('--gcovr_extra'      , help='Extra arguments (string) to pass to gcovr (e.g. --exclude-lines-by-pattern <pattern> or --include-internal-functions). Additional arguments can be obtained from the gcovr documentation.', default=None) # noqa: E501
     parser.add_argument('--meshesdir'        , help='When hopr is used as external: Only run hopr once for each example and store meshes in separate directory to use symbolic links.', action='store_true')
+    parser.add_argument('--jobs'             , help='Number of runs that are executed concurrently (default: 1). Use "auto" to fill all cores of the core budget. Each run reserves as many cores as it uses MPI threads from the budget, which is given by -l/--limitprocs or the number of physical cores.', default='1')  # noqa: E501
+    parser.add_argument('--concurrent-examples', help='Process the examples of a build concurrently (together with --jobs), each with its own command lines, runs and analyses. All examples share the same core budget.', action='store_true')  # noqa: E501
+    parser.add_argument('--pipeline-builds'  , help='Configure and compile up to N builds ahead in the background while the examples of the current build are running (default: 0, i.e., off).', type=int, default=0)
+    parser.add_argument('--compile-share'    , help='Share of the core budget (0 < x <= 1) that is reserved for compiling in the background with --pipeline-builds (default: 0.5).', type=float, default=0.5)
+    parser.add_argument('--schedule'         , help='Order of concurrently executed runs (--jobs): "longest" packs the runs into the core budget with the longest runs (wall time history) first, "fifo" starts them in the order of the examples (default: longest).', choices=['longest', 'fifo'], default='longest')  # noqa: E501
+    parser.add_argument('--history'          , help='JSON file in which the wall times of runs and builds are stored for predicting the duration of the runs (default: ~/.cache/reggie/walltimes.json). Use "" to disable.', default=os.path.join(os.path.expanduser('~'), '.cache', 'reggie', 'walltimes.json'))  # noqa: E501
+    parser.add_argument('--redirect-output'  , help='Let the external programs write their output directly into the .out/.err files and only keep the first and last lines in memory (the output is only displayed with -d 2).', action='store_true')  # noqa: E501
+    parser.add_argument('--executor'         , help='Execute the runs and externals locally (default) or submit each of them as a job to a batch system ("slurm": sbatch/squeue) and poll for its completion. "fake-batch" is a local stand-in for testing. Combine with --jobs to submit several jobs at the same time.', choices=['local', 'slurm', 'fake-batch'], default='local')  # noqa: E501
+    parser.add_argument('--batch-options'    , help='Additional options for submitting the batch jobs (--executor), e.g. "--partition=compute --time=01:00:00".', default='')
+    parser.add_argument('--batch-poll-interval', help='Interval in seconds for polling the completion of batch jobs (--executor, default: 5).', type=float, default=5.0)
+    parser.add_argument('--coordinator'      , help='Put the runs and externals into a job queue in the directory DIR on a shared file system, from where they are pulled by workers (--worker DIR) on other nodes. Combine with --jobs to queue several jobs at the same time.', metavar='DIR')  # noqa: E501
+    parser.add_argument('--worker'           , help='Execute the jobs of a coordinator (--coordinator DIR) from the job queue in DIR until the coordinator has finished (up to --jobs jobs at the same time). No check directory is required.', metavar='DIR')  # noqa: E501
+    parser.add_argument('--build-cache'      , help='Reuse the builds of previous executions with the same cmake configuration, compilers and source tree (git commit and changes) from the build cache in DIR (default: ~/.cache/reggie/builds if no DIR is given). The cache can be shared by concurrent reggie executions.', nargs='?', const=os.path.join(os.path.expanduser('~'), '.cache', 'reggie', 'builds'), default=None, metavar='DIR')  # noqa: E501
+    parser.add_argument('--build-cache-size' , help='Maximum size of the build cache in GB, the least recently used builds are removed (default: 20).', type=float, default=20.0)
+    parser.add_argument('--external-cache'   , help='Reuse the meshes of the mesh generators (hopr, pyhope) of previous executions and other examples with the same binary, parameter file and input files from the cache in DIR (default: ~/.cache/reggie/externals if no DIR is given). The meshes are hard-linked (or symlinked) into the run directories.', nargs='?', const=os.path.join(os.path.expanduser('~'), '.cache', 'reggie', 'externals'), default=None, metavar='DIR')  # noqa: E501
+    parser.add_argument('--external-cache-size', help='Maximum size of the external cache in GB, the least recently used meshes are removed (default: 10).', type=float, default=10.0)
+    parser.add_argument('--initial-cache'    , help='Configure the builds with an initial cache (cmake -C) from DIR (default: ~/.cache/reggie/initial_cache if no DIR is given) that contains the results of the compiler checks and library lookups (e.g. MPI, HDF5) of the first build that was configured with the same compilers, cmake version and environment. A new initial cache is written when the toolchain changes.', nargs='?', const=os.path.join(os.path.expanduser('~'), '.cache', 'reggie', 'initial_cache'), default=None, metavar='DIR')  # noqa: E501
+    parser.add_argument('--compiler-launcher', help="Compiler launcher (e.g. ccache or sccache) that is set via CMAKE_<LANG>_COMPILER_LAUNCHER for all builds, the hits and misses of the compiler cache are displayed in the summary. 'auto' uses ccache or sccache when found, 'none' disables the launcher (default: auto).", default='auto')  # noqa: E501
     parser.add_argument('--gitlab-ci'        , help='Activated automatically when running gitlab-ci pipelines via environment variable REGGIE_GITLAB_CI to print Running [...] + Successful/Failed [x.xx sec] in a single line instead of breaking the last part into a new line.', action='store_true')  # noqa: E501
     # fmt: on
     # parser.set_defaults(carryon=False)
@@ -139,6 +165,14 @@ def getArgsAndBuilds():
     # get reggie command line arguments
     args = parser.parse_args()
 
+    # worker mode (--worker): only the jobs of a coordinator are executed, hence, no builds are required
+    if args.worker:
+        args.CoreBudget = args.limitprocs if args.limitprocs > 0 else max(1, getMaxCPUCores())
+        args.jobs = scheduler.getJobs(args.jobs, args.CoreBudget)
+        return args, []
+    if args.check is None and not args.dummy:
+        parser.error("the following arguments are required: check")
+
     # Set default values
     args.noMPIautomatic = False
 
@@ -216,10 +250,15 @@ def getArgsAndBuilds():
     if not args.carryon and not args.run:
         tools.remove_folder(OutputDirectory.output_dir)
 
+    # the coverage data of the builds would be mixed up in the shared build tree
+    if args.incremental and (args.coverage or os.getenv('CODE_COVERAGE')):
+        print(tools.yellow("--incremental cannot be used with code coverage: compiling each build from scratch"))
+        args.incremental = False
+
     # get builds from checks directory if no executable is supplied
     if args.exe is None:  # if not exe is supplied, get builds
         # read build combinations from checks/XX/builds.ini
-        builds = check.getBuilds(args.basedir, args.check, args.compiletype, args.singledir, args.coverage)
+        builds = check.getBuilds(args.basedir, args.check, args.compiletype, args.singledir, args.coverage, compilercache.getLauncher(args.compiler_launcher), args.incremental)
     else:
         if not os.path.exists(args.exe):  # check if executable exists
             print(tools.red("No executable found under '%s'" % args.exe))
@@ -230,6 +269,13 @@ def getArgsAndBuilds():
             args.run = True  # set 'run-mode' do not compile the code
             args.basedir = None  # since code will not be compiled, the basedir is not required
 
+    # smoke tier: only compile the builds that are required for executing each example at least once
+    args.dropped_builds = []
+    if args.smoke and args.exe is None:
+        builds, dropped = check.getSmokeBuilds(builds, args.check, logging.getLogger('logger'))
+        args.dropped_builds = [" ".join("%s=%s" % item for item in build.configuration.items()) for build in dropped]
+        print(tools.yellow("Smoke tier (--smoke): compiling %s of %s builds, each example is executed with at least one build" % (len(builds), len(builds) + len(args.dropped_builds))))
+
     # Try to detect MPICH
     args.detectedMPICH = False
     try:
@@ -250,6 +296,16 @@ def getArgsAndBuilds():
         args.MaxCores = getMaxCPUCores()
         print(tools.yellow('WARNING: MPICH detected, which limits the total number of processes that can be used to %s as over-subscription results in a massive performance drop' % args.MaxCores))
 
+    # Set the core budget for concurrently executed runs (--jobs): each run reserves the number of its MPI threads from this budget
+    if args.MaxCores > 0:
+        args.CoreBudget = args.MaxCores
+    else:
+        args.CoreBudget = max(1, getMaxCPUCores())
+    args.jobs = scheduler.getJobs(args.jobs, args.CoreBudget)
+    if not 0.0 < args.compile_share <= 1.0:
+        print(tools.red("Invalid value for --compile-share: '%s'. Supply a value 0 < x <= 1." % args.compile_share))
+        exit(1)
+
     if args.run:
         print("args.run -> skip building")
         # in 'run-mode' remove all build from list of builds if their binaries do not exist (build.binary_exists() == False)
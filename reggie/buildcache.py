@@ -0,0 +1,255 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import subprocess
+import threading
+from contextlib import contextmanager, suppress
+
+from reggie import tools
+from reggie.outputdirectory import OutputDirectory
+
+# files of a build directory that are not stored in the cache (object files, module files and the examples of the runs)
+IGNORE = shutil.ignore_patterns('examples', 'CMakeFiles', '*.o', '*.obj', '*.mod', '*.smod')
+
+
+class BuildCache:
+    """
+    Persistent cache of build directories (binaries, libraries and CMakeCache.txt, without object files), which is shared by all reggie
+    executions on a machine, i.e., also across different check directories and invocations that remove the output directory.
+
+    The entries are stored under [path]/entries/[key], where the key is a hash of the cmake command (without the path of the basedir),
+    the compilers and the state of the source tree (see getKey()). The least recently used entries are removed when the total size
+    exceeds max_size. The cache is locked via flock() on [path]/lock: shared while an entry is restored and exclusive while entries are
+    added or removed, hence, concurrent reggie processes can use the same cache.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = os.path.abspath(path)
+        self.entries = os.path.join(self.path, 'entries')
+        self.max_size = max_size
+        self.sources = {}  # hash of the source tree of each basedir (computed once per reggie execution)
+        self.sources_lock = threading.Lock()
+        tools.create_folder(self.entries)
+
+    @contextmanager
+    def lock(self, operation):
+        with open(os.path.join(self.path, 'lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def getKey(self, build):
+        """Hash of the cmake command, the compilers and the state of the source tree"""
+        with self.sources_lock:
+            if build.basedir not in self.sources:
+                self.sources[build.basedir] = getSourceHash(build.basedir, [self.path])
+            sources = self.sources[build.basedir]
+        cmake_cmd = sorted(c for c in build.cmake_cmd if c != build.basedir)  # the same options in builds.ini of different checks in any order
+        data = json.dumps({'cmake': cmake_cmd, 'binary': os.path.relpath(build.binary_path, build.target_directory), 'compilers': getCompilers(build), 'sources': sources})
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    def contains(self, build):
+        return os.path.isdir(os.path.join(self.entries, self.getKey(build), 'build'))
+
+    def restore(self, build):
+        """Copy the cached build directory into the (empty) build directory, returns True if the build has been restored"""
+        key = self.getKey(build)
+        entry = os.path.join(self.entries, key)
+        with self.lock(fcntl.LOCK_SH):
+            if not os.path.isdir(os.path.join(entry, 'build')):
+                return False
+            shutil.rmtree(build.target_directory, ignore_errors=True)
+            shutil.copytree(os.path.join(entry, 'build'), build.target_directory, symlinks=True)
+            os.utime(os.path.join(entry, 'meta.json'))  # last use for the LRU eviction
+            directory = None  # build directory from which the entry has been stored
+            with suppress(OSError, ValueError), open(os.path.join(entry, 'meta.json')) as f:
+                directory = json.load(f).get('directory')
+        if directory:
+            relocate(build.target_directory, directory)
+        if not build.binary_exists() or not libraries_found(build.binary_path, build.target_directory):
+            print(tools.yellow("Build cache entry [%s] cannot be used (missing binary or libraries outside of the build directory), building instead" % key))
+            shutil.rmtree(build.target_directory, ignore_errors=True)
+            return False
+        return True
+
+    def store(self, build):
+        """Copy the build directory into the cache (unless an entry for the same key exists) and remove the least recently used entries"""
+        key = self.getKey(build)
+        entry = os.path.join(self.entries, key)
+        if os.path.exists(entry):
+            return
+        # copy into a temporary directory first, which is renamed (atomic) while the cache is locked
+        tmp = os.path.join(self.path, 'tmp-%s' % uuid.uuid4().hex)
+        try:
+            shutil.copytree(build.target_directory, os.path.join(tmp, 'build'), symlinks=True, ignore=IGNORE)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'cmake': build.cmake_cmd, 'directory': os.path.abspath(build.target_directory), 'size': getSize(tmp), 'created': time.time()}, f, indent=1)
+            with self.lock(fcntl.LOCK_EX):
+                if not os.path.exists(entry):
+                    os.rename(tmp, entry)
+                self.evict()
+        except OSError as e:
+            print(tools.yellow("Could not store the build in the build cache [%s] (%s)" % (self.path, e)))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the total size is below max_size (called while the cache is locked)"""
+        evict(self.entries, self.max_size)
+
+
+def evict(entries_directory, max_size):
+    """Remove the least recently used entries (last use: modification time of meta.json) until the total size is below max_size"""
+    entries = []
+    for key in os.listdir(entries_directory):
+        meta = os.path.join(entries_directory, key, 'meta.json')
+        try:
+            with open(meta) as f:
+                size = json.load(f)['size']
+            entries.append((os.path.getmtime(meta), size, key))
+        except (OSError, ValueError, KeyError):
+            entries.append((0.0, 0, key))  # incomplete entry
+    total = sum(entry[1] for entry in entries)
+    for last_used, size, key in sorted(entries):
+        if total <= max_size and last_used > 0.0:
+            break
+        shutil.rmtree(os.path.join(entries_directory, key), ignore_errors=True)
+        total -= size
+
+
+def getSize(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files if not os.path.islink(os.path.join(root, f)))
+
+
+def getCompilers(build):
+    """Paths, sizes and modification times of the compilers (from the cmake configuration or the environment variables FC, CC and CXX)"""
+    compilers = {key: value for key, value in build.configuration.items() if key.endswith('_COMPILER')}
+    for variable, default in (('FC', 'gfortran'), ('CC', 'cc'), ('CXX', 'c++'), ('MPIFC', 'mpif90')):
+        compilers.setdefault(variable, os.getenv(variable, default))
+    state = {}
+    for key, compiler in sorted(compilers.items()):
+        path = shutil.which(compiler)
+        if path:
+            stat = os.stat(os.path.realpath(path))
+            state[key] = [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+        else:
+            state[key] = None
+    return state
+
+
+def getSourceHash(basedir, excluded=()):
+    """
+    Hash of the state of the source tree: the git commit, the uncommitted changes and the untracked files. Without git, the paths,
+    sizes and modification times of all files are used. Build directories (containing a CMakeCache.txt), the output directory of
+    reggie, the working directory (if it is a subdirectory of basedir, e.g., output_dir_gitlab_tool) and the excluded directories
+    are skipped in both cases.
+    """
+    excluded = {os.path.abspath(directory) for directory in excluded}
+    excluded.add(os.path.abspath(OutputDirectory.output_dir))
+    if os.getcwd() != os.path.abspath(basedir):
+        excluded.add(os.getcwd())
+    build_directories = {}
+
+    def skip(directory):
+        if directory not in build_directories:
+            parent = os.path.dirname(directory)
+            # fmt: off
+            build_directories[directory] = (directory in excluded or
+                                            os.path.basename(directory) == '.git' or
+                                            os.path.exists(os.path.join(directory, 'CMakeCache.txt')) or
+                                            (parent != directory and len(parent) >= len(basedir) and skip(parent)))
+            # fmt: on
+        return build_directories[directory]
+
+    basedir = os.path.abspath(basedir)
+    sha = hashlib.sha256()
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=basedir, capture_output=True, text=True, check=True).stdout
+        diff = subprocess.run(['git', 'diff', 'HEAD', '--binary'], cwd=basedir, capture_output=True, check=True).stdout
+        untracked = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard', '-z'], cwd=basedir, capture_output=True, check=True).stdout
+        sha.update(commit.encode())
+        sha.update(diff)
+        for name in sorted(filter(None, untracked.split(b'\0'))):
+            path = os.path.join(basedir, os.fsdecode(name))
+            if skip(os.path.dirname(path)):
+                continue
+            sha.update(name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    sha.update(hashlib.sha256(f.read()).digest())
+        return sha.hexdigest()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for root, dirs, files in os.walk(basedir):
+        dirs[:] = sorted(d for d in dirs if not skip(os.path.join(root, d)))
+        for f in sorted(files):
+            path = os.path.join(root, f)
+            with suppress(OSError):
+                stat = os.stat(path)
+                sha.update(("%s %s %s\n" % (os.path.relpath(path, basedir), stat.st_size, stat.st_mtime_ns)).encode())
+    return sha.hexdigest()
+
+
+def relocate(directory, original_directory):
+    """
+    Replace the original build directory in the RPATH of the restored binaries and libraries (set by cmake for the build tree) with the
+    restored directory. Requires patchelf, without it the binaries keep the RPATH of the original build directory (see libraries_found())
+    """
+    directory, original_directory = os.path.abspath(directory), os.path.abspath(original_directory)
+    patchelf = shutil.which('patchelf')
+    if not patchelf or directory == original_directory:
+        return
+    for root, _, files in os.walk(directory):
+        for f in files:
+            path = os.path.join(root, f)
+            if os.path.islink(path) or not isELF(path):
+                continue
+            result = subprocess.run([patchelf, '--print-rpath', path], capture_output=True, text=True)
+            rpath = result.stdout.strip()
+            if result.returncode == 0 and original_directory in rpath:
+                subprocess.run([patchelf, '--set-rpath', rpath.replace(original_directory, directory), path], capture_output=True)
+
+
+def isELF(path):
+    with suppress(OSError), open(path, 'rb') as f:
+        return f.read(4) == b'\x7fELF'
+    return False
+
+
+def libraries_found(binary_path, directory):
+    """
+    Check that the shared libraries of a restored binary are found and that the libraries of the build tree are loaded from the restored
+    directory, i.e., not from the (still existing) build directory that was cached, which the RPATH points to unless it has been relocated
+    """
+    try:
+        result = subprocess.run(['ldd', binary_path], capture_output=True, text=True)
+    except OSError:
+        return True  # ldd is not available
+    if 'not found' in result.stdout:
+        return False
+    directory = os.path.realpath(directory)
+    libraries = {f for _, _, files in os.walk(directory) for f in files}  # shared libraries built in the build tree
+    for line in result.stdout.splitlines():
+        name, _, path = line.strip().partition(' => ')
+        path = path.rsplit(' (', 1)[0].strip()
+        if name in libraries and path and os.path.commonpath([os.path.realpath(path), directory]) != directory:
+            return False
+    return True
@@ -11,19 +11,36 @@
 # You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
 # ==================================================================================================================================
 from __future__ import print_function  # required for print() function with line break via "end=' '"
+import functools
+import hashlib
 import os
 import re
 import shutil
+import struct
 import subprocess
 from typing import cast
 import tempfile
+from types import SimpleNamespace
+from contextlib import suppress
+from timeit import default_timer as timer
 
 from reggie import combinations
 from reggie import tools
 from reggie import summary
+from reggie import scheduler
+from reggie import history
+from reggie import buildcache
+from reggie import externalcache
+from reggie import compilercache
+from reggie import resources
+from reggie import compileprofile
+from reggie import initialcache
+from reggie import staging
+from reggie import scratch
 from reggie.analysis import Analyze, getAnalyzes, Clean_up_files, Analyze_compare_across_commands
 from reggie.outputdirectory import OutputDirectory
 from reggie.externalcommand import ExternalCommand
+from reggie.executor import LocalExecutor, getExecutor
 
 # import h5 I/O routines
 try:
@@ -35,7 +52,7 @@ except ImportError:
 
 
 class Build(OutputDirectory, ExternalCommand):
-    def __init__(self, basedir, source_directory, configuration, number, name='build', binary_path=None, coverage=None):
+    def __init__(self, basedir, source_directory, configuration, number, name='build', binary_path=None, coverage=None, launcher=None, build_tree=None):
         # fmt: off
         self.basedir          = basedir
         self.source_directory = source_directory
@@ -48,6 +65,25 @@ class Build(OutputDirectory, ExternalCommand):
         # initialize result as empty list
         self.result = tools.yellow("skipped building")
 
+        # compiler launcher (ccache/sccache) and its statistics of the compilation
+        self.launcher = launcher
+        self.compiler_cache = None
+
+        # configure, compile and link times of the build (only if compiled)
+        self.profile = None
+
+        # peak memory of make/ninja and its compile jobs (only if compiled), stored in the history for choosing the number of compile jobs
+        self.compile_peak_rss = None
+
+        # failure of a build that has been compiled in the background (--pipeline-builds), raised when the build is due (see PerformCheck)
+        self.compile_error = None
+
+        # build tree that is shared by all builds and reconfigured in place (--incremental), the binary is copied into target_directory
+        self.build_tree = build_tree
+
+        # initial cache (cmake -C) that is shared by all builds (--initial-cache), set by PerformCheck
+        self.initial_cache = None
+
         # initialize examples as empty list
         self.examples = []
 
@@ -82,46 +118,114 @@ class Build(OutputDirectory, ExternalCommand):
             self.cmake_cmd.append('-DCMAKE_Fortran_FLAGS=' + coverage_flags)
             self.cmake_cmd_color.append(tools.blue("-D") + "CMAKE_Fortran_FLAGS=" + '%s' % coverage_flags)
 
+        # add the compiler launcher for all languages unless set in 'builds.ini'
+        if self.launcher:
+            for language in compilercache.LANGUAGES:
+                key = "CMAKE_%s_COMPILER_LAUNCHER" % language
+                if key not in self.configuration:
+                    self.cmake_cmd.append("-D%s=%s" % (key, self.launcher))
+                    self.cmake_cmd_color.append(tools.blue("-D") + "%s=%s" % (key, self.launcher))
+
         self.cmake_cmd.append(self.basedir)  # add basedir to the cmake command
         self.cmake_cmd_color.append(self.basedir)  # add basedir to the cmake command
 
-    def compile(self, buildprocs):
+    def compile(self, buildprocs, cores=0, peak_rss=None):
+        """
+        Configure and compile the build. The number of compile jobs is given by buildprocs (> 0), unlimited (< 0) or chosen automatically
+        (0) from the CPUs (at most 'cores' if > 0), the available memory and the peak memory of a compile job (peak_rss) of a previous
+        build (see resources.getBuildJobs()). The peak memory of the make/ninja process and its compile jobs is stored in compile_peak_rss.
+        """
         # don't compile if build directory already exists
         if self.binary_exists():  # if the binary exists, return
             print("skipping")
             return
+        elif self.build_tree:  # incremental: reconfigure the shared build tree of the previous build instead of building from scratch
+            print("reconfiguring [%s], " % self.build_tree, end=' ')  # skip linebreak
+            tools.create_folder(self.target_directory)
+            tools.create_folder(self.build_tree)
         else:  # for build carryon: when a binary is missing remove all examples (re-run all examples)
             print("removing folder, ", end=' ')  # skip linebreak
             shutil.rmtree(self.target_directory, ignore_errors=True)
             os.makedirs(self.target_directory)
             tools.create_folder(self.target_directory)
         print("building")
+        directory = self.build_tree or self.target_directory
 
         # CMAKE: execute cmd in build directory
         # fmt: off
+        cmake_cmd = self.cmake_cmd
         s_Color   = "C-making with [%s] ..." % (" ".join(self.cmake_cmd_color))
         s_NoColor = "C-making with [%s] ..." % (" ".join(self.cmake_cmd))
         # fmt: on
-
-        if self.execute_cmd(self.cmake_cmd, self.target_directory, string_info=s_Color) != 0:  # use uncolored string for cmake
+        if self.build_tree:
+            # options of the previous build that are not set by this build are removed from the CMakeCache.txt of the shared build tree
+            unset = ["-U%s" % key for key in readCMakeKeys(self.build_tree) if key not in getCMakeKeys(self.cmake_cmd)]
+            cmake_cmd = self.cmake_cmd[:-1] + unset + self.cmake_cmd[-1:]
+            s_Color = "C-making with [%s] ..." % (" ".join(self.cmake_cmd_color[:-1] + unset + self.cmake_cmd_color[-1:]))
+
+        # seed the configure with the compiler checks and library lookups of the first build with the same toolchain (--initial-cache)
+        initial_cache = None
+        if self.initial_cache and not self.build_tree:
+            initial_cache = self.initial_cache.getFile(self)
+            if initial_cache:
+                cmake_cmd = cmake_cmd[:1] + ["-C", initial_cache] + cmake_cmd[1:]
+                s_Color = "C-making with [%s] ..." % (" ".join(self.cmake_cmd_color[:1] + [tools.blue("-C"), initial_cache] + self.cmake_cmd_color[1:]))
+
+        self.profile = compileprofile.CompileProfile()
+        start = timer()
+        if self.execute_cmd(cmake_cmd, directory, string_info=s_Color) != 0:  # use uncolored string for cmake
             raise BuildFailedException(self)  # "CMAKE failed"
-
-        # MAKE: default with '-j'
-        if not os.path.exists(os.path.join(self.target_directory, "build.ninja")):
+        self.profile.configure = timer() - start
+        if self.build_tree:
+            writeCMakeKeys(self.build_tree, getCMakeKeys(self.cmake_cmd))
+        elif self.initial_cache and not initial_cache:
+            self.initial_cache.store(self, directory, getCMakeKeys(self.cmake_cmd))
+
+        # MAKE: default with '-j' (the number of jobs and the load limit are chosen automatically if buildprocs is 0)
+        info = None
+        load = None
+        if buildprocs == 0:
+            buildprocs, load, info = resources.getBuildJobs(cores, peak_rss)
+        if not os.path.exists(os.path.join(directory, "build.ninja")):
             self.make_cmd = ["make", "-j"]
             if buildprocs > 0:
                 self.make_cmd.append(str(buildprocs))
         else:
             self.make_cmd = ["ninja"]
-            if buildprocs == 0:
-                self.make_cmd.append("-j0")
-            elif buildprocs > 0:
+            if buildprocs > 0:
                 self.make_cmd.append("-j" + str(buildprocs))
+        if load:
+            self.make_cmd += ["-l", str(load)]
         # execute cmd in build directory
         s_NoColor = "Building with [%s] ..." % (" ".join(self.make_cmd))
-
-        if self.execute_cmd(self.make_cmd, self.target_directory, string_info=s_NoColor) != 0:
+        if info:
+            s_NoColor = "Building with [%s] (%s) ..." % (" ".join(self.make_cmd), info)
+
+        # collect the hits and misses of the compiler cache
+        environment = None
+        if self.launcher:
+            self.compiler_cache = compilercache.CompilerCacheStats(self.launcher, self.target_directory)
+            self.compiler_cache.start()
+            environment = self.compiler_cache.environment()
+
+        self.profile.start(directory)
+        start = timer()
+        return_code = self.execute_cmd(self.make_cmd + self.profile.make_arguments, directory, string_info=s_NoColor, environment=environment)
+        self.compile_peak_rss = self.peak_rss
+        if self.compiler_cache:
+            self.compiler_cache.stop()
+        if return_code != 0:
             raise BuildFailedException(self)  # "MAKE failed"
+        self.profile.finish(directory, timer() - start)
+
+        # keep the binary of this build in its own directory, the build tree is overwritten by the next build
+        if self.build_tree:
+            try:
+                tools.create_folder(os.path.dirname(self.binary_path))
+                shutil.copy2(os.path.join(self.build_tree, os.path.relpath(self.binary_path, self.target_directory)), self.binary_path)
+            except OSError as e:
+                print(tools.red("Could not copy the binary from the build tree [%s]: %s" % (self.build_tree, e)))
+                raise BuildFailedException(self) from e
         print('-' * 132)
 
     def __str__(self):
@@ -136,7 +240,7 @@ class Standalone(Build):
     def __init__(self, binary_path, source_directory):
         Build.__init__(self, None, source_directory, {}, -1, "standalone", os.path.abspath(binary_path))
 
-    def compile(self, buildprocs):
+    def compile(self, buildprocs, cores=0, peak_rss=None):
         pass
 
     def __str__(self):
@@ -279,17 +383,144 @@ def StandaloneAutomaticMPIDetection(binary_path):
     return MPIifOFF
 
 
-def getBuilds(basedir, source_directory, CMAKE_BUILD_TYPE, singledir, coverage):
+def getBuilds(basedir, source_directory, CMAKE_BUILD_TYPE, singledir, coverage, launcher=None, incremental=False):
     combis, digits = combinations.getCombinations(os.path.join(source_directory, 'builds.ini'), OverrideOptionKey='CMAKE_BUILD_TYPE', OverrideOptionValue=CMAKE_BUILD_TYPE)
 
     # create Builds
-    if singledir:
-        builds = [Build(basedir, source_directory, b, 0, coverage=coverage) for b in combis]
+    if incremental:
+        # all builds are compiled in the same build tree, ordered such that as few options as possible change from one build to the next
+        build_tree = os.path.join(OutputDirectory.output_dir, "build_tree")
+        builds = [Build(basedir, source_directory, b, i, coverage=coverage, launcher=launcher, build_tree=build_tree) for i, b in enumerate(getIncrementalOrder(combis), start=1)]
+    elif singledir:
+        builds = [Build(basedir, source_directory, b, 0, coverage=coverage, launcher=launcher) for b in combis]
     else:
-        builds = [Build(basedir, source_directory, b, i, coverage=coverage) for i, b in enumerate(combis, start=1)]
+        builds = [Build(basedir, source_directory, b, i, coverage=coverage, launcher=launcher) for i, b in enumerate(combis, start=1)]
     return builds
 
 
+def getIncrementalOrder(combis):
+    """Order the build combinations greedily, such that each build differs in as few options as possible from the previous build"""
+
+    def distance(a, b):
+        return sum(1 for key in set(a) | set(b) if a.get(key) != b.get(key))
+
+    remaining = list(combis)
+    ordered = [remaining.pop(0)] if remaining else []
+    while remaining:
+        nearest = min(range(len(remaining)), key=lambda i: distance(ordered[-1], remaining[i]))
+        ordered.append(remaining.pop(nearest))
+    return ordered
+
+
+def getCMakeKeys(cmake_cmd):
+    """Names of the cache entries that are set via -D in a cmake command"""
+    return [c[2:].split('=')[0].split(':')[0] for c in cmake_cmd if c.startswith('-D')]
+
+
+def readCMakeKeys(build_tree):
+    """Names of the cache entries that were set by the previous build in the shared build tree (--incremental)"""
+    try:
+        with open(os.path.join(build_tree, 'reggie_cmake_keys.txt')) as f:
+            return f.read().split()
+    except OSError:
+        return []
+
+
+def writeCMakeKeys(build_tree, keys):
+    with open(os.path.join(build_tree, 'reggie_cmake_keys.txt'), 'w') as f:
+        f.write("\n".join(keys) + "\n")
+
+
+# file in the build directory that keeps the fingerprint of the binaries, because the objects are not stored in the build cache
+FINGERPRINT_FILE = 'reggie_fingerprint.txt'
+
+
+def getBinaryFingerprint(build):
+    """
+    Fingerprint of the binaries of a build: a hash of the names and contents of the compiled objects (*.o, *.obj) and of the link
+    commands (link.txt or the LINK_* variables in build.ninja, with the build directory replaced) in the build tree, or None if the
+    binary or the objects do not exist. The executables and libraries themselves cannot be compared, because they embed the
+    userblock (see userblock.txt), which contains the configuration and, hence, differs for all build combinations. The objects of
+    the userblock are excluded, the binaries are linked deterministically from the other objects with the link commands. The debug
+    sections of the objects are not hashed, because they contain the build directory (DW_AT_comp_dir, see getObjectSections()).
+    """
+    if not build.binary_exists():
+        return None
+    directory = os.path.abspath(build.build_tree or build.target_directory)
+    sha = hashlib.sha256()
+    objects = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d != 'examples')
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, directory)
+            if name.endswith(('.o', '.obj')) and 'userblock' not in name.lower():
+                objects += 1
+                sha.update(("%s\n" % relpath).encode())
+                for chunk in getObjectSections(path):
+                    sha.update(chunk)
+            elif name in ('link.txt', 'build.ninja'):
+                with open(path, errors='replace') as f:
+                    lines = [line.strip() for line in f if name == 'link.txt' or line.strip().startswith('LINK_')]
+                sha.update(("%s\n" % relpath).encode())
+                sha.update("\n".join(lines).replace(directory, '<build>').encode())
+    return sha.hexdigest() if objects > 0 else None
+
+
+def getObjectSections(path):
+    """
+    Names and contents of the sections of an ELF object file without the debug sections (.debug_*, .zdebug_* and their relocations),
+    which differ for identical code compiled in different build directories (-g). Other object files are returned as a whole.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'\x7fELF':
+        return [data]
+    try:
+        endian = '<' if data[5] == 1 else '>'
+        if data[4] == 2:  # 64 bit
+            (shoff,) = struct.unpack_from(endian + 'Q', data, 0x28)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', data, 0x3A)
+            header = endian + 'IIQQQQIIQQ'  # name, type, flags, addr, offset, size, link, info, addralign, entsize
+        else:
+            (shoff,) = struct.unpack_from(endian + 'I', data, 0x20)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', data, 0x2E)
+            header = endian + 'IIIIIIIIII'
+        sections = [struct.unpack_from(header, data, shoff + i * shentsize) for i in range(shnum)]
+        names = sections[shstrndx][4]
+    except (struct.error, IndexError):
+        return [data]  # e.g. more than 0xff00 sections (extended numbering)
+    chunks = []
+    for name, kind, _, _, offset, size, _, _, _, _ in sections:
+        name = data[names + name : data.index(b'\0', names + name)]
+        if re.match(rb'\.(rela?\.)?z?debug', name):
+            continue
+        chunks += [name, b'\0', str(size).encode()]
+        if kind != 8:  # SHT_NOBITS (.bss) has no content in the file
+            chunks.append(data[offset : offset + size])
+    return chunks
+
+
+def storeBinaryFingerprint(build):
+    """Write the fingerprint of a build that has been compiled into FINGERPRINT_FILE, where it is also kept by the build cache"""
+    path = os.path.join(build.target_directory, FINGERPRINT_FILE)
+    fingerprint = getBinaryFingerprint(build)
+    if fingerprint:
+        with open(path, 'w') as f:
+            f.write(fingerprint + "\n")
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def readBinaryFingerprint(build):
+    """Fingerprint of the binaries of a build from FINGERPRINT_FILE (e.g. restored from the build cache) or from the build tree"""
+    path = os.path.join(build.target_directory, FINGERPRINT_FILE)
+    if build.binary_exists() and os.path.exists(path):
+        with open(path) as f:
+            return f.read().strip() or None
+    return getBinaryFingerprint(build)
+
+
 class BuildFailedException(Exception):
     def __init__(self, build):
         self.build = build
@@ -298,6 +529,12 @@ class BuildFailedException(Exception):
         return "build.compile failed in directory '%s'." % (self.build.target_directory)
 
 
+class StopOnFirstError(Exception):
+    """Raised when a run, an external or an analysis has failed and stop on first error (-p, --stop) is activated"""
+
+    pass
+
+
 # ==================================================================================================
 
 
@@ -306,19 +543,27 @@ class Example(OutputDirectory):
         self.source_directory = source_directory
         OutputDirectory.__init__(self, build, os.path.join("examples", os.path.basename(self.source_directory)))
 
+        # initialize command lines as empty list, they are read when the tasks of the example are added (see PerformCheck.add_example_tasks)
+        self.command_lines = []
+
     def __str__(self):
         s = tools.yellow("EXAMPLE in: " + self.source_directory)
         return tools.indent(s, 1)
 
 
 def getExamples(path, build, log):
+    return [Example(p, build) for p in getExamplePaths(path, build, log)]
+
+
+def getExamplePaths(path, build, log):
+    """Paths of the examples in the check directory that are not excluded for the build.configuration via 'excludeBuild.ini'"""
     # checks directory with 'builds.ini'
     if os.path.exists(os.path.join(build.source_directory, 'builds.ini')):
         example_paths = [os.path.join(path, p) for p in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, p))]
     else:
         example_paths = [path]
 
-    examples = []  # list of examples for each build
+    paths = []  # list of examples for each build
     # iterate over all example paths (directories of the examples)
     for p in example_paths:
         log.info('-' * 132)
@@ -337,8 +582,29 @@ def getExamples(path, build, log):
             # Skip this example for the build.configuration
             else:
                 log.info(tools.yellow("  not skipping"))
-        examples.append(Example(p, build))
-    return examples
+        paths.append(p)
+    return paths
+
+
+def getSmokeBuilds(builds, path, log):
+    """
+    Smoke tier (--smoke): select a small subset of the builds, such that each example is still executed with at least one build that
+    is not excluded in its 'excludeBuild.ini' (greedy set cover, i.e., the build that covers most of the remaining examples is selected
+    first). Returns the selected builds and the dropped builds, whose build directories are removed if they are empty (i.e., created
+    by getBuilds()), the directories of builds that have been compiled by a previous execution (--carryon) are kept.
+    """
+    compatible = [set(getExamplePaths(path, build, log)) for build in builds]
+    uncovered = set().union(*compatible)
+    selected = set()
+    while uncovered:
+        best = max(range(len(builds)), key=lambda i: len(compatible[i] & uncovered))
+        selected.add(best)
+        uncovered -= compatible[best]
+    dropped = [build for i, build in enumerate(builds) if i not in selected]
+    for build in dropped:
+        with suppress(OSError):
+            os.rmdir(build.target_directory)  # fails for a non-empty directory
+    return [build for i, build in enumerate(builds) if i in selected], dropped
 
 
 # ==================================================================================================
@@ -433,6 +699,24 @@ def SetMPIrun(build, args, MPIthreads):
     return cmd
 
 
+def getNumberOfCores(cmd, MPIthreads, args):
+    """Number of cores that are occupied when executing with the command prefix 'cmd' returned by SetMPIrun(): the MPI threads or 1 (single execution)"""
+    if not cmd or not MPIthreads:
+        return 1
+    cores = int(MPIthreads)
+    if args.MaxCores > 0:
+        cores = min(cores, args.MaxCores)
+    return cores
+
+
+def getExpectedNumberOfCores(build, command_line, args):
+    """Number of cores that a run of the command line is expected to occupy before it is executed (without limiting the MPI threads by the mesh)"""
+    MPIthreads = command_line.parameters.get('MPI')
+    if not build.MPIbuilt or args.noMPI or args.noMPIautomatic:
+        return 1
+    return getNumberOfCores([args.MPIexe], MPIthreads, args)
+
+
 # ==================================================================================================
 def copyRestartFile(path, path_target):
     """Copy new restart file into example folder"""
@@ -567,13 +851,14 @@ def getExternals(path, example, build):
 
 # ==================================================================================================
 class ExternalRun(OutputDirectory, ExternalCommand):
-    total_errors = 0
-    total_number_of_runs = 0
+    total_errors = tools.SharedCounter()
+    total_number_of_runs = tools.SharedCounter()
 
     def __init__(self, parameters, parameterfilepath, external, number, digits, externalruns=True):  # noqa: ARG002
         # fmt: off
         self.successful         = True
         self.globalnumber       = -1
+        self.cores              = 1
         self.analyze_results    = []
         self.analyze_successful = True
         self.parameters         = parameters
@@ -587,13 +872,15 @@ class ExternalRun(OutputDirectory, ExternalCommand):
         # external folders already there
         self.skip = False
 
-    def execute(self, build, external, args, meshes_directory=None, mesh_generator=None):
+    def execute(self, build, external, args, meshes_directory=None, mesh_generator=None, executor=None, external_cache=None):
         ''' '
         Arguments:  - build
                     - external
                     - args
                     - meshes_directory:     directory where meshes are stored
                     - mesh_generator:       name of the external which creates meshes (defaults in PerformCheck.__init__())
+                    - executor:             executor of the external (LocalExecutor: reserves the MPI threads from the core budget, or a batch system)
+                    - external_cache:       cache of the outputs of the mesh generators (--external-cache), from which they are linked
         '''
         # set path to parameter file (single combination of values for execution "parameter.ini" for example)
         self.parameter_path = os.path.join(external.directory, external.parameterfile)
@@ -606,6 +893,10 @@ class ExternalRun(OutputDirectory, ExternalCommand):
 
         # check MPI built binary (only possible for reggie-compiled binaries)
         cmd = SetMPIrun(build, args, MPIthreads)
+        cores = getNumberOfCores(cmd, MPIthreads, args)
+
+        if executor is None:
+            executor = LocalExecutor()
 
         # Get binary path
         binary_path = external.parameters.get('binary_path')
@@ -664,9 +955,22 @@ class ExternalRun(OutputDirectory, ExternalCommand):
                             self.successful = False
                             return
                 # execute hopr in meshes_directory
-                self.execute_cmd(cmd, meshes_directory, name=tail, string_info=tools.indent(s, 3))  # run the code
+                directory = meshes_directory
             else:
-                self.execute_cmd(cmd, external.directory, name=tail, string_info=tools.indent(s, 3))  # run the code
+                directory = external.directory
+
+            # link the outputs of a previous execution with the same binary, parameter file and input files (--external-cache)
+            ending = external_cache.getOutputEnding(binary_path) if external_cache and not cmd_pre_execute else None
+            key = external_cache.getKey(binary_path, self.parameter_path, self.parameters, cmd_suffix) if ending else None
+            if key and external_cache.restore(key, directory):
+                print(tools.indent(tools.blue("Linked the output of [%s] from the external cache [%s]" % (cmdstr, external_cache.path)), 3))
+            else:
+                if key:
+                    external_cache.unlinkOutputs(directory, ending)
+                    before = external_cache.getOutputs(directory, ending)
+                executor.execute(self, cmd, directory, cores, name=tail, string_info=tools.indent(s, 3))  # run the code
+                if key and self.return_code == 0:
+                    external_cache.store(key, directory, ending, before)
 
         if self.return_code != 0:
             self.successful = False
@@ -711,13 +1015,16 @@ def getExternalRuns(parameterfilepath, external):
 
 # ==================================================================================================
 class Run(OutputDirectory, ExternalCommand):
-    total_errors = 0
-    total_number_of_runs = 0
+    total_errors = tools.SharedCounter()
+    total_number_of_runs = tools.SharedCounter()
+    staging = staging.Staging()  # strategy for copying the example into the run directories (--staging), set in PerformCheck.main()
+    scratch = None  # node-local directory in which the runs are executed (--scratch), set in PerformCheck.main()
 
     def __init__(self, parameters, path, command_line, number, digits):
         # fmt: off
         self.successful         = True
         self.globalnumber       = -1
+        self.cores              = 1
         self.analyze_results    = []
         self.analyze_successful = True
         self.parameters         = parameters
@@ -728,27 +1035,39 @@ class Run(OutputDirectory, ExternalCommand):
         OutputDirectory.__init__(self, command_line, 'run', number, mkdir=False)
         ExternalCommand.__init__(self)
 
+        # set by execute_run(), also required for the summary of runs that have not been started (-p, --stop)
+        self.externals_time = 0
+        self.externals_errors = []
+
         self.skip = os.path.exists(self.target_directory)
         if self.skip:
             return
 
         tools.create_folder(self.target_directory)
 
+        # with --scratch, the example is staged into the scratch directory when the run is executed
+        if not Run.scratch:
+            self.stage(self.target_directory)
+
+    def stage(self, directory):
+        """Copy the example into the directory in which the run is executed"""
         # copy all files in the source directory (example) to the target directory: always overwrite
+        # (the files are symlinked or copied as given by the staging.ini of the example, otherwise they are cloned, hard-linked or copied
+        # depending on the staging strategy and the file system, see --staging)
         for f in os.listdir(self.source_directory):
             src = os.path.abspath(os.path.join(self.source_directory, f))
-            dst = os.path.abspath(os.path.join(self.target_directory, f))
+            dst = os.path.abspath(os.path.join(directory, f))
             if os.path.isdir(src):  # check if file or directory needs to be copied
                 if not os.path.basename(src) == 'output_dir':  # do not copy the output_dir recursively into itself! (infinite loop)
-                    shutil.copytree(src, dst)  # copy tree
+                    Run.staging.stage(src, dst, self.source_directory)  # copy tree
             else:
                 # Check for symbolic links
                 if os.path.islink(src):
                     # Do not copy broken symbolic links
                     if os.path.exists(src):
-                        shutil.copyfile(src, dst)  # copy symbolic link
+                        Run.staging.stage(src, dst, self.source_directory)  # copy symbolic link
                 else:
-                    shutil.copyfile(src, dst)  # copy file
+                    Run.staging.stage(src, dst, self.source_directory)  # copy file
 
     def rename_failed(self):
         """
@@ -760,9 +1079,9 @@ class Run(OutputDirectory, ExternalCommand):
         shutil.move(self.target_directory, self.target_directory + "_failed")  # rename folder (non-existent folder fails)
         self.target_directory = self.target_directory + "_failed"  # set new name for summary of errors
 
-    def execute(self, build, command_line, args, external_failed):
-        Run.total_number_of_runs += 1
-        self.globalnumber = Run.total_number_of_runs
+    def execute(self, build, command_line, args, external_failed, executor=None):
+        if self.globalnumber < 0:  # runs might already have been numbered before execution
+            self.globalnumber = Run.total_number_of_runs.increment()
 
         # Check if a possible pre-processing step has failed.
         # If so, do not run the code as the assumption is that it depends on a positive output of the (pre) external
@@ -815,6 +1134,10 @@ class Run(OutputDirectory, ExternalCommand):
 
         # check MPI built binary (only possible for reggie-compiled binaries)
         cmd = SetMPIrun(build, args, MPIthreads)
+        cores = getNumberOfCores(cmd, MPIthreads, args)
+        self.cores = cores
+        if executor is None:
+            executor = LocalExecutor()
 
         cmd.append(build.binary_path)
         if 'python' not in build.binary_path:
@@ -850,7 +1173,8 @@ class Run(OutputDirectory, ExternalCommand):
             print(s)
         else:
             s = "Running [%s] ..." % (" ".join(cmd))
-            self.execute_cmd(cmd, self.target_directory, string_info=tools.indent(s, 2))  # run the code
+            # the local executor reserves the cores for all MPI threads (after the number of threads has been limited by the number of elements)
+            executor.execute(self, cmd, self.target_directory, cores, string_info=tools.indent(s, 2))  # run the code
 
         # Copy restart file if required
         if cmd_restart_file and args.restartcopy:
@@ -900,7 +1224,9 @@ class Run(OutputDirectory, ExternalCommand):
                 s = tools.yellow("Run(OutputDirectory, ExternalCommand): performed restart file copy!")
                 print(s)
 
-        if self.return_code != 0:
+        if self.cancelled:
+            self.successful = False
+        elif self.return_code != 0:
             self.successful = False
             self.rename_failed()
 
@@ -942,55 +1268,68 @@ class PerformCheck:
     def __init__(self):
         # Definition looks like: self.MeshGeneration = {'external': 'end of created filename', ...}
         self.MeshGeneration = {'pyhope': '_mesh.h5', 'hopr': '_mesh.h5'}
+        # number of cores reserved for compiling the next builds in the background (--pipeline-builds)
+        self.compile_cores = None
+        # wall times of previous executions (--history)
+        self.history = None
+        self.executor = None
+        self.build_cache = None
+        # outputs of the mesh generators of previous executions (--external-cache)
+        self.external_cache = None
+        # first build for each binary fingerprint and MPI setting, whose runs are shared by builds with identical binaries (None: --no-run-dedup)
+        self.fingerprints = None
 
     ###################################################################################
     ############################ Single external functions ############################
     ###################################################################################
-    def mesh_external(self, run, external, externalrun, build, args):
+    def mesh_external(self, example, run, external, externalrun, build, args, counts):
         '''
         This function executes all externals for the first run of the first command line and creates a dictionary with symbolic links to the created files
         This is (currently) only used for the mesh generation with pyhope (or originally hopr) to create all meshes only once and reuse them in later runs
         Extension for other mesh generators or generally externals (following the same pattern to use symbolic links) can be done with the self.MeshGeneration dictionary
         Note that the name in the self.MeshGeneration dictionary has to appear in the name of the externalbinary
+        The loop counters of the current command line, run, external, parameter file and external run as well as the name of the matched
+        mesh generator are supplied via 'counts', because runs may be executed concurrently (--jobs). The meshes directory and the dictionary of
+        created meshes are stored in the example, because examples may be executed concurrently as well (--concurrent-examples)
         '''
 
-        if not os.path.exists(self.meshes_dir_path):
-            os.makedirs(self.meshes_dir_path)
-            print(tools.indent(tools.yellow(f'Meshes will be stored in directory: {self.meshes_dir_path}'), 3))
+        if not os.path.exists(example.meshes_dir_path):
+            os.makedirs(example.meshes_dir_path)
+            print(tools.indent(tools.yellow(f'Meshes will be stored in directory: {example.meshes_dir_path}'), 3))
 
         # dummy return for externalrun which should be skipped
         externalcmd = ''
         # execute all external runs for first run of first command line (since loop iterates over each externalrun anyway)
-        if self.command_line_count == 1 and self.RunCount == 1:
+        if counts.command_line == 1 and counts.run == 1:
             # execute external
-            externalcmd = externalrun.execute(build, external, args, meshes_directory=self.meshes_dir_path, mesh_generator=self.Matched_Generator_Name)
-            # collect all mesh names which have been created in the directory 'self.meshes_dir_path' (since name of the mesh is not part of externalrun.parameters)
-            for file in os.listdir(self.meshes_dir_path):
+            externalcmd = externalrun.execute(build, external, args, meshes_directory=example.meshes_dir_path, mesh_generator=counts.generator, executor=self.executor, external_cache=self.external_cache)
+            # collect all mesh names which have been created in the directory 'example.meshes_dir_path' (since name of the mesh is not part of externalrun.parameters)
+            for file in os.listdir(example.meshes_dir_path):
                 # create identifier of external, externalparameterfile and externalrun to check if mesh for given combination of these there has been build already
                 # external_count and externalparameterfiel_count prevent from using the same mesh even hopr/pyhope is listed twice as external with separate .ini files
-                dict_identifier = f'{self.external_count}' + f'{self.externalparameterfile_count}'
-                # we use the self.Matched_Generator_Name to get the corresponding file ending of our MeshGenerator from MeshGeneration
-                if file.endswith(self.MeshGeneration[self.Matched_Generator_Name]):
-                    full_path = os.path.join(self.meshes_dir_path, file)
+                dict_identifier = f'{counts.external}' + f'{counts.parameterfile}'
+                # we use the counts.generator to get the corresponding file ending of our MeshGenerator from MeshGeneration
+                if file.endswith(self.MeshGeneration[counts.generator]):
+                    full_path = os.path.join(example.meshes_dir_path, file)
                     if os.path.isfile(full_path):
-                        if full_path not in self.created_mesh_files.values():
-                            dict_identifier = dict_identifier + f'{self.externalrun_count}'
+                        if full_path not in example.created_mesh_files.values():
+                            dict_identifier = dict_identifier + f'{counts.externalrun}'
                             # save directory where mesh is stored for current combination to set symbolic link in next run/command_line run
-                            self.created_mesh_files[dict_identifier] = os.path.join(self.meshes_dir_path, file)
+                            example.created_mesh_files[dict_identifier] = os.path.join(example.meshes_dir_path, file)
 
         # neither the first command_line or run so the mesh should have been created already, so we create the identifier to check our dict
-        dict_identifier = f'{self.external_count}' + f'{self.externalparameterfile_count}' + f'{self.externalrun_count}'
+        dict_identifier = f'{counts.external}' + f'{counts.parameterfile}' + f'{counts.externalrun}'
         mesh_name_current_run = os.path.basename(run.parameters['MeshFile'])
 
-        # self.created_mesh_files contains dict_identifier as keys and the link to the corresponding mesh
-        mesh_name_current_externalrun = os.path.basename(self.created_mesh_files[dict_identifier])
+        # example.created_mesh_files contains dict_identifier as keys and the link to the corresponding mesh
+        mesh_name_current_externalrun = os.path.basename(example.created_mesh_files[dict_identifier])
 
         # check if mesh of current run matches mesh of current external run to set symbolic link
         if mesh_name_current_run == mesh_name_current_externalrun:
-            relative_source_path = os.path.relpath(self.created_mesh_files[dict_identifier], external.directory)
+            relative_source_path = os.path.relpath(example.created_mesh_files[dict_identifier], external.directory)
             target_mesh_path = os.path.join(external.directory, mesh_name_current_run)
             # Since external will not be executed for these runs check if pre-execution is needed (for the first run the pre_execution is done inside the externalrun execution)
-            if self.command_line_count != 1 or self.RunCount != 1:
+            if counts.command_line != 1 or counts.run != 1:
                 cmd_pre_execute = external.parameters.get('cmd_pre_execute')
                 if cmd_pre_execute:
                     cmd_pre = cmd_pre_execute.split()
@@ -1223,12 +1562,541 @@ class PerformCheck:
         s = tools.indent("Running [%s] ..." % (" ".join(cmd_combine)), 2)
         ExternalCommand().execute_cmd(cmd_combine, combined_cov_path, string_info=s)
 
+    ###################################################################################
+    ############################### Build functions ###################################
+    ###################################################################################
+    def compile_build(self, build, build_number, number_of_builds, args, log):
+        """
+        Read the examples of a build and compile it (1.1 and 1.2)
+
+        When compiling in the background (--pipeline-builds), the compiler processes reserve their share of the core budget
+        (--compile-share), which is also used as upper limit for 'make -j' unless the number of build processes is set via --buildprocs.
+        The peak memory of a compile job is taken from the history of the build for choosing the number of jobs (see resources.getBuildJobs())
+        """
+        print("Build Cmake Configuration ", build_number, " of ", number_of_builds, " ...", end=' ')  # skip linebreak
+        log.info(str(build))
+
+        # 1.1    read the example directories
+        # get example folders: run_basic/example1, run_basic/example2 from check folder
+        build.examples = getExamples(args.check, build, log)
+        log.info("build.examples" + str(build.examples))
+
+        # check if no examples are found
+        if len(build.examples) == 0:
+            s1 = tools.red("No matching examples found for this build! Create an example or exclude this build combination")
+            s2 = build.configuration.items()
+            s = s1 + '\n' + str(s2)
+            print(s)
+            exit(1)
+
+        # 1.2    compile the build if args.run is false and the binary is non-existent (or restore it from the build cache)
+        compiled = not build.binary_exists()
+        start = timer()
+        if compiled and self.build_cache and not args.run and self.build_cache.restore(build):
+            compiled = False
+            build.result = tools.blue("restored from cache")
+            build.walltime = timer() - start
+            print("restored from the build cache [%s]," % self.build_cache.path, end=' ')  # skip linebreak
+        previous = self.history.get(history.getBuildKey(build)) or {}
+        if self.compile_cores:
+            with self.budget.reserve(self.compile_cores):
+                build.compile(args.buildprocs, cores=self.compile_cores, peak_rss=previous.get('peak_rss'))
+        else:
+            build.compile(args.buildprocs, peak_rss=previous.get('peak_rss'))
+        if compiled:
+            # peak memory of the make/ninja process of this build and its compile jobs (not of the runs or of other builds)
+            entry = {'walltime': timer() - start}
+            if build.compile_peak_rss:
+                entry['peak_rss'] = build.compile_peak_rss
+            elif 'peak_rss' in previous:
+                entry['peak_rss'] = previous['peak_rss']
+            self.history.set(history.getBuildKey(build), entry)
+            if self.fingerprints is not None:
+                storeBinaryFingerprint(build)
+            if self.build_cache:
+                self.build_cache.store(build)
+
+    def compile_build_in_background(self, build, build_number, number_of_builds, args, log):
+        """
+        Compile a build ahead in the background (--pipeline-builds). A failure (BuildFailedException or exit()) is stored in the build and
+        raised by prepare_build() when the build is due, i.e., after the examples of the previous builds have finished as without
+        pipelining, instead of cancelling them
+        """
+        try:
+            self.compile_build(build, build_number, number_of_builds, args, log)
+        except (BuildFailedException, SystemExit) as e:
+            build.compile_error = e
+
+    def prepare_build(self, build, args, log):
+        """Check whether the build is using MPI (1.3) and add the tasks of all examples to the task graph (2.)"""
+        if build.compile_error:  # the build has failed in the background (--pipeline-builds)
+            raise build.compile_error
+        if not args.carryon:  # remove examples folder if not carryon, in order to re-run all examples
+            tools.remove_folder(os.path.join(build.target_directory, "examples"))
+
+        # 1.3    check whether the build is using MPI (either disabled for the whole reggie execution or because compiled without MPI)
+        if args.noMPI or args.noMPIautomatic:
+            MPIbuilt = False
+        else:
+            if args.run:
+                # If code is not compiled (ie. an executable is provided, activating MPI)
+                MPIbuilt = True
+            else:
+                # Determining how the executable has been compiled
+                LIBS_USE_MPI = build.configuration.get('LIBS_USE_MPI', 'OFF')
+                if LIBS_USE_MPI == 'ON':
+                    MPIbuilt = True
+                else:
+                    # Additionally check for variable MPI_built_flag=PICLAS_MPI (or FLEXI_MPI, depending on the executable name)
+                    MPI_built_flag = os.path.basename(build.binary_path).upper() + "_MPI"
+                    MPI_built_value = build.configuration.get(MPI_built_flag, 'OFF')
+                    if MPI_built_value == 'ON':  # PICLAS_MPI=ON specified
+                        MPIbuilt = True
+                    else:  # PICLAS_MPI=OFF or flag not specified (i.e. assuming LIBS_USE_MPI=OFF)
+                        MPIbuilt = False
+        build.MPIbuilt = MPIbuilt
+
+        # 1.4    a build with the same binaries as a previous build (e.g. when the differing options do not change the binary) shares the
+        #        examples of the previous build, which are not executed again and are displayed for both builds in the summary
+        build.identical_build = None
+        if self.fingerprints is not None:
+            build.fingerprint = readBinaryFingerprint(build)
+            if build.fingerprint:
+                build.identical_build = self.fingerprints.setdefault((build.fingerprint, MPIbuilt), build)
+        if build.identical_build is build:
+            build.identical_build = None
+        elif build.identical_build:
+            executed = {example.source_directory: example for example in build.identical_build.examples}
+            build.shared_examples = [executed[example.source_directory] for example in build.examples if example.source_directory in executed]
+            build.examples = [executed.get(example.source_directory, example) for example in build.examples]
+            print(tools.blue("Build has the same binary as [%s]: reusing the runs of %s examples" % (build.identical_build.target_directory, len(build.shared_examples))))
+
+        # 2.   loop over all example directories (concurrently when --concurrent-examples is used, otherwise one after the other)
+        example_task = None
+        for example in build.examples:
+            if build.identical_build and example in build.shared_examples:
+                continue
+            dependencies = [] if args.concurrent_examples and args.jobs > 1 else [example_task]
+            example_task = self.graph.add(example.target_directory, functools.partial(self.add_example_tasks, build, example, args, log), dependencies)
+
+    def finish_build(self, build, args):
+        """Create the coverage report and remove the build directory if all examples were successful"""
+        # create coverage report for current build
+        if args.coverage:
+            self.write_single_coverage_report(build, args)
+
+        if all(self.example_successful(example) for example in build.examples) and not args.save:
+            tools.remove_folder(build.target_directory)
+        print('=' * 132)
+
+    ###################################################################################
+    ################################ Run functions ####################################
+    ###################################################################################
+    def execute_run(self, build, example, command_line, command_line_count, run_count, run, args, log):
+        """
+        Execute a single run (run_count starts at 1): pre-externals, the binary itself, post-externals and the clean-up of unwanted files
+
+        With --scratch, the example is staged into a node-local scratch directory, in which the run and its externals are executed.
+        Afterwards, the files that are referenced in analyze.ini and the output files (all files if the run has failed) are copied back
+        into the run directory in output_dir (before the clean-up of unwanted files) and the scratch directory is removed.
+        """
+        # collect different runtimes (from externals and main run)
+        run.externals_time = 0
+        run.started = timer()
+        print(tools.indent('Run %s of %s' % (run_count, len(command_line.runs)), 1))
+        log.info(str(run))
+
+        output_directory = run.target_directory
+        if Run.scratch:
+            run.target_directory = tempfile.mkdtemp(prefix=os.path.basename(output_directory) + '_', dir=Run.scratch)
+            run.stage(run.target_directory)
+        try:
+            completed = self.execute_run_steps(build, example, command_line, command_line_count, run_count, run, args, log)
+        finally:
+            if Run.scratch:
+                self.copy_back(example, run, output_directory)
+        if not completed:
+            return
+
+        # 4.3 Remove unwanted files: run analysis directly after each run (as opposed to the normal analysis which is used for analyzing the created output)
+        for analyze in example.analyzes:
+            if isinstance(analyze, Clean_up_files):
+                analyze.execute(run)
+
+        # store the wall times for packing the runs in the next execution (failed runs might have stopped early)
+        run.finished = timer()
+        if run.successful:
+            self.history.set(run.history_key, {'walltime': run.walltime, 'externals': run.externals_time, 'cores': run.cores})
+
+    def execute_run_steps(self, build, example, command_line, command_line_count, run_count, run, args, log):
+        """Pre-externals, the binary itself and post-externals of a run (returns False if the run has been cancelled)"""
+        database_path = command_line.database_path
+        cvae_scattering_cvae = command_line.cvae_scattering_path
+        # Database linking
+        if database_path is not None and os.path.exists(run.target_directory):
+            head, tail = os.path.split(database_path)
+            os.symlink(database_path, os.path.join(run.target_directory, tail))
+            print(tools.indent(tools.green('Preprocessing: Linked database [%s] to [%s] ... ' % (database_path, run.target_directory)), 2))
+        # CVAE scattering linking
+        if cvae_scattering_cvae is not None and os.path.exists(run.target_directory):
+            head, tail = os.path.split(cvae_scattering_cvae)
+            os.symlink(cvae_scattering_cvae, os.path.join(run.target_directory, tail))
+            print(tools.indent(tools.green('Preprocessing: Linked CVAE scattering cvae file [%s] to [%s] ... ' % (cvae_scattering_cvae, run.target_directory)), 2))
+
+        # 4.1 read the external options in 'externals.ini' within each example directory (e.g. eos, hopr, posti)
+        #     distinguish between pre- and post processing
+        run.externals_pre, run.externals_post, run.externals_errors = getExternals(os.path.join(run.source_directory, 'externals.ini'), run, build)
+
+        # (pre) externals (1): loop over all externals available in external.ini
+        external_failed = False
+        if run.externals_pre is None:
+            PreprocessingActive = False
+        else:
+            if len(run.externals_pre) == 0:
+                PreprocessingActive = False
+            else:
+                PreprocessingActive = True
+                externalbinaries = [external.parameters.get("externalbinary") for external in run.externals_pre]
+                print(tools.indent(tools.green('Preprocessing: Started  %s pre-externals' % externalbinaries), 3))
+
+        for external_count, external in enumerate(run.externals_pre):
+            log.info(str(external))
+
+            # (pre) externals (1.1): get the path and the parameterfiles to the i'th external
+            externaldirectory = external.parameters.get("externaldirectory")
+            if externaldirectory.endswith('.ini'):
+                external.directory = run.target_directory
+                external.parameterfiles = [externaldirectory]
+            else:
+                external.directory = os.path.join(run.target_directory, externaldirectory)
+                external.parameterfiles = [i for i in os.listdir(external.directory) if i.endswith('.ini')]
+
+            externalbinary = external.parameters.get("externalbinary")
+
+            # (pre) externals (2): loop over all parameterfiles available for the i'th external
+            for externalparameterfile_count, external.parameterfile in enumerate(external.parameterfiles):  # noqa: B020 loop control variable external overrides iterable it iterates
+                # (pre) externals (2.1): consider combinations
+                external.runs = getExternalRuns(os.path.join(external.directory, external.parameterfile), external)
+
+                # (pre) externals (3): loop over all combinations and parameterfiles for the i'th external
+                for externalrun_count, externalrun in enumerate(external.runs, start=1):
+                    log.info(str(externalrun))
+
+                    # (pre) externals (3.1): run the external binary
+                    # check if meshes should be reused with symbolic links for each command line of example
+                    if args.meshesdir:
+                        # check if externalbinary is set in self.MeshGeneration and should be executed only once, since other externals should be executed normally
+                        # we also save which MeshGenerator is matched to get the file ending
+                        Matched_Generator_Name = next((Generator_Name for Generator_Name in self.MeshGeneration.keys() if Generator_Name in externalbinary), None)
+                        if Matched_Generator_Name:
+                            # fmt: off
+                            counts = SimpleNamespace(command_line  = command_line_count,
+                                                     run           = run_count,
+                                                     external      = external_count,
+                                                     parameterfile = externalparameterfile_count,
+                                                     externalrun   = externalrun_count,
+                                                     generator     = Matched_Generator_Name)
+                            # fmt: on
+                            externalcmd = self.mesh_external(example, run, external, externalrun, build, args, counts)
+                        # execute other externals normally and also hopr every run if hopr binary has random name
+                        else:
+                            externalcmd = externalrun.execute(build, external, args, executor=self.executor, external_cache=self.external_cache)
+                    # execute each external each run normally
+                    else:
+                        externalcmd = externalrun.execute(build, external, args, executor=self.executor, external_cache=self.external_cache)
+
+                    if externalrun.cancelled:
+                        self.cancel_run(run)
+                        return False
+                    if not externalrun.successful:
+                        external_failed = True
+                        s = tools.red('Execution (pre) external failed: %s' % externalcmd)
+                        run.externals_errors.append(s)
+                        print("ExternalRun.total_errors = %s" % (ExternalRun.total_errors))
+                        ExternalRun.total_errors += 1  # add error if externalrun fails
+                        # Check if immediate stop is activated on failure
+                        if args.stop:
+                            raise StopOnFirstError('Stop on first error (-p, --stop) is activated! Execution (pre) external failed')
+                    # add external runtime
+                    run.externals_time += externalrun.walltime
+
+        if PreprocessingActive:
+            print(tools.indent(tools.green('Preprocessing: Externals %s finished!' % externalbinaries), 3))
+
+        # 4.2    execute the binary file for one combination of parameters
+        run.execute(build, command_line, args, external_failed, executor=self.executor)
+        if run.cancelled:
+            self.cancel_run(run)
+            return False
+        if not run.successful:
+            Run.total_errors += 1  # add error if run fails
+            # Check if immediate stop is activated on failure
+            if args.stop:
+                raise StopOnFirstError('Stop on first error (-p, --stop) is activated! Execution of run failed')
+
+        # (post) externals (1): loop over all externals available in external.ini
+        if run.externals_post is None:
+            PostprocessingActive = False
+        else:
+            if len(run.externals_post) == 0:
+                PostprocessingActive = False
+            else:
+                PostprocessingActive = True
+                externalbinaries = [external.parameters.get("externalbinary") for external in run.externals_post]
+                print(tools.indent(tools.green('Postprocessing: Started  %s post-externals' % externalbinaries), 3))
+
+        for external in run.externals_post:
+            log.info(str(external))
+
+            # (post) externals (1.1): get the path and the parameterfiles to the i'th external
+            externaldirectory = external.parameters.get("externaldirectory")
+            if externaldirectory.endswith('.ini'):
+                external.directory = run.target_directory
+                external.parameterfiles = [externaldirectory]
+            else:
+                external.directory = os.path.join(run.target_directory, externaldirectory)
+                external.parameterfiles = [i for i in os.listdir(external.directory) if i.endswith('.ini')]
+
+            # externalbinary = external.parameters.get("externalbinary")
+
+            # (post) externals (2): loop over all parameterfiles available for the i'th external
+            for external.parameterfile in external.parameterfiles:  # noqa: B020 loop control variable external overrides iterable it iterates
+                # (post) externals (2.1): consider combinations
+                external.runs = getExternalRuns(os.path.join(external.directory, external.parameterfile), external)
+
+                # (post) externals (3): loop over all combinations and parameterfiles for the i'th external
+                for externalrun in external.runs:
+                    log.info(str(externalrun))
+
+                    # (post) externals (3.1): run the external binary
+                    externalcmd = externalrun.execute(build, external, args, executor=self.executor)
+                    if externalrun.cancelled:
+                        self.cancel_run(run)
+                        return False
+                    if not externalrun.successful:
+                        # print(externalrun.return_code)
+                        s = tools.red('Execution (post) external failed: %s' % externalcmd)
+                        run.externals_errors.append(s)
+                        ExternalRun.total_errors += 1  # add error if externalrun fails
+                        # Check if immediate stop is activated on failure
+                        if args.stop:
+                            raise StopOnFirstError('Stop on first error (-p, --stop) is activated! Execution (post) external failed')
+                    # add external runtime
+                    run.externals_time += externalrun.walltime
+
+        if PostprocessingActive:
+            print(tools.indent(tools.green('Postprocessing: Externals %s finished!' % externalbinaries), 3))
+        return True
+
+    def copy_back(self, example, run, output_directory):
+        """Copy the results of a run from the scratch directory into its run directory in output_dir and remove the scratch directory"""
+        scratch_directory = run.target_directory
+        failed = scratch_directory.endswith('_failed')  # renamed by Run.execute() if a (pre) external has failed
+        patterns = None if failed or not run.successful else example.copy_back_patterns
+        try:
+            size = scratch.copyBack(scratch_directory, output_directory, patterns)
+            print(tools.indent("Copied %.1f MB from the scratch directory [%s]" % (size / 1e6, scratch_directory), 2))
+        finally:
+            shutil.rmtree(scratch_directory, ignore_errors=True)
+            run.target_directory = output_directory
+            for attribute in ('stdout_filename', 'stderr_filename'):
+                path = getattr(run, attribute, None)
+                if path and path.startswith(scratch_directory):
+                    setattr(run, attribute, os.path.join(output_directory, os.path.relpath(path, scratch_directory)))
+        if failed:
+            run.rename_failed()
+
+    def cancel_run(self, run):
+        """Mark a run as cancelled, whose run or externals have been killed (or not started) because the execution is stopped"""
+        run.set_cancelled()
+        run.successful = False
+        run.finished = timer()
+
+    def analyze_runs(self, analyze, runs, iRestartFile, args):
+        """Perform an analysis for all successful runs of a command line or for a single run (5.)"""
+        runs_successful = [run for run in runs if run.successful]
+        if not runs_successful:  # do analysis only if runs_successful is not empty
+            return
+        # Set the restart file index in case of one diff per restart file (from command line)
+        analyze.iRestartFile = iRestartFile
+        # Output of the __str__ for the respective analyze routine
+        print(tools.indent(tools.blue(str(analyze)), 2))
+        # Perform the analyze for the successful runs
+        analyze.perform(runs_successful)
+        # Check if immediate stop is activated on failure
+        if args.stop and Analyze.total_errors > 0:
+            raise StopOnFirstError('Stop on first error (-p, --stop) is activated! Analysis failed')
+
+    def finalize_run(self, run):
+        """Rename the run directory if the analyze step has failed for at least one test (6.)"""
+        if run.successful and not run.analyze_successful:  # failed runs are already renamed
+            run.rename_failed()
+
+    def analyze_across_commands(self, analyze, runs_corresponding, args):
+        """Perform an analysis comparing corresponding runs from different commands (7.)"""
+        print(tools.indent(tools.blue(str(analyze)), 2))
+        analyze.perform(runs_corresponding)
+        # Check if immediate stop is activated on failure
+        if args.stop and Analyze.total_errors > 0:
+            raise StopOnFirstError('Stop on first error (-p, --stop) is activated! Analysis failed (cross-command comparisons)')
+
+    def example_successful(self, example):
+        """Returns False if any run, external or analysis has failed, i.e., the build directory must not be removed"""
+        for command_line in example.command_lines:
+            runs_successful = [run for run in command_line.runs if run.successful]
+            # Don't remove when all runs have failed
+            if not runs_successful:
+                return False
+            # Don't remove when the analysis of a run fails
+            if not all([run.analyze_successful for run in runs_successful]):
+                return False
+            # Don't remove when (pre) or (post) external fails
+            for run in runs_successful:
+                for external in run.externals_pre + run.externals_post:
+                    if not all([externalrun.successful for externalrun in external.runs]):
+                        return False
+        return True
+
+    ###################################################################################
+    ############################### Example functions #################################
+    ###################################################################################
+    def add_example_tasks(self, build, example, args, log):
+        """
+        Read the command lines, runs and analyses of an example and add the tasks that execute and analyze them to the task graph.
+
+        Each run (4.) is a task. The analyses (5.) of a command line start when all of its runs have finished, except for analyses
+        that treat each run independently (e.g. h5diff), which start as soon as their run has finished when tasks are executed
+        concurrently (--jobs). A run directory is renamed (6.) when all analyses of the run have finished and the cross-command
+        comparisons (7.) of the i-th runs start as soon as the i-th runs of all command lines are complete.
+        Without --jobs, the tasks are executed in the same order as the nested loops over command lines and runs.
+        """
+        log.info(str(example))
+        print(str(example))
+
+        # 2.1    read the command line options in 'command_line.ini' for binary execution
+        #        (e.g. number of threads for mpirun)
+        example.command_lines = getCommand_Lines(os.path.join(example.source_directory, 'command_line.ini'), example, build.MPIbuilt, MaxCores=args.MaxCores)
+
+        # 2.2   read-in restart_file parameter from command_line.ini separately
+        example.restart_file_list = getRestartFileList(example)
+
+        # 2.3    read the analyze options in 'analyze.ini' within each example directory (e.g. L2 error analyze)
+        example.analyzes = getAnalyzes(os.path.join(example.source_directory, 'analyze.ini'), example, args)
+
+        # files that are copied back from the scratch directory after each run (--scratch)
+        example.copy_back_patterns = scratch.getCopyBackPatterns(os.path.join(example.source_directory, 'analyze.ini'))
+
+        # create directory containing mesh files to set symbolic links if mesh file is already created
+        if args.meshesdir:
+            example.created_mesh_files = {}
+            example.meshes_dir_path = os.path.join(example.target_directory, 'meshes')
+
+        # analyses of single runs are split off only for concurrent execution, which keeps the serial output unchanged
+        split_analyzes = args.jobs > 1
+        mesh_task = None
+        command_line_tasks = []
+        finalize_tasks = []
+
+        # 3.   loop over all command_line options
+        for command_line_count, command_line in enumerate(example.command_lines, start=1):
+            log.info(str(command_line))
+            # Database linking
+            database_path = command_line.parameters.get('database', None)
+            if database_path is not None:
+                database_path = os.path.abspath(os.path.join(example.source_directory, database_path))
+                if not os.path.exists(database_path):
+                    s = tools.red("command_line.ini: cannot find file=[%s] " % (database_path))
+                    print(s)
+                    exit(1)
+            # CVAE scattering linking
+            cvae_scattering_cvae = command_line.parameters.get('cvae_scattering', None)
+            if cvae_scattering_cvae is not None:
+                cvae_scattering_cvae = os.path.abspath(os.path.join(example.source_directory, cvae_scattering_cvae))
+                if not os.path.exists(cvae_scattering_cvae):
+                    s = tools.red("command_line.ini: cannot find file=[%s] " % (cvae_scattering_cvae))
+                    print(s)
+                    exit(1)
+
+            # Get the index of the restart file to append to the analyze
+            if example.restart_file_list is not None:
+                iRestartFile = example.restart_file_list.index(command_line.parameters.get('restart_file', None))
+            else:
+                iRestartFile = None
+
+            # 3.1    read the executable parameter file 'parameter.ini' (e.g. flexi.ini with which
+            #        flexi will be started), N=, mesh=, etc.
+            command_line.runs = getRuns(os.path.join(example.source_directory, 'parameter.ini'), command_line)
+            command_line.database_path = database_path
+            command_line.cvae_scattering_path = cvae_scattering_cvae
+
+            # number the runs in the order of the command line (concurrent runs finish in arbitrary order)
+            # and predict their duration (including the externals) and number of cores from the wall time history
+            for run in command_line.runs:
+                run.globalnumber = Run.total_number_of_runs.increment()
+                run.history_key = history.getRunKey(build, example, command_line, run)
+                entry = self.history.get(run.history_key)
+                if entry:
+                    run.predicted_walltime = entry['walltime'] + entry.get('externals', 0.0)
+                    run.predicted_cores = entry.get('cores', 1)
+                else:
+                    run.predicted_walltime = None
+                    run.predicted_cores = getExpectedNumberOfCores(build, command_line, args)
+
+            # 4.   loop over all parameter combinations supplied in the parameter file 'parameter.ini'
+            #      restart files are copied back into the example (--restartcopy), hence, the command lines are executed one after another
+            #      and the meshes (--meshesdir) are created by the first run of the first command line
+            dependencies = command_line_tasks[-1:] if args.restartcopy else []
+            run_tasks = []
+            for run_count, run in enumerate(command_line.runs, start=1):
+                run_function = functools.partial(self.execute_run, build, example, command_line, command_line_count, run_count, run, args, log)
+                cores = run.predicted_cores if self.executor.local else 0  # batch jobs do not occupy the local cores
+                run_task = self.graph.add(run.target_directory, run_function, dependencies + [mesh_task], cores=cores, duration=run.predicted_walltime)
+                if args.meshesdir and mesh_task is None:
+                    mesh_task = run_task
+                run_tasks.append(run_task)
+
+            # 5.   perform the analyze tests for all successfully executed runs
+            #      (Clean_up_files is called in the run task under 4.3 and cross-command comparisons are performed under 7.)
+            run_analyze_tasks = [[] for run in command_line.runs]
+            analyze_tasks = []
+            for analyze in example.analyzes:
+                if isinstance(analyze, Clean_up_files) or isinstance(analyze, Analyze_compare_across_commands):
+                    continue
+                if split_analyzes and analyze.is_per_run():
+                    for run, run_task, tasks in zip(command_line.runs, run_tasks, run_analyze_tasks, strict=True):
+                        tasks.append(self.graph.add(str(analyze), functools.partial(self.analyze_runs, analyze, [run], iRestartFile, args), [run_task], exclusive=analyze))
+                else:
+                    analyze_tasks.append(self.graph.add(str(analyze), functools.partial(self.analyze_runs, analyze, command_line.runs, iRestartFile, args), run_tasks, exclusive=analyze))
+
+            # 6.   rename all run directories for which the analyze step has failed for at least one test
+            finalize_tasks.append([])
+            for run, run_task, tasks in zip(command_line.runs, run_tasks, run_analyze_tasks, strict=True):
+                finalize_tasks[-1].append(self.graph.add(run.target_directory, functools.partial(self.finalize_run, run), [run_task] + tasks + analyze_tasks))
+            command_line_tasks.append(self.graph.add(str(command_line), lambda: None, finalize_tasks[-1]))
+
+        # 7.    perform analyze tests comparing corresponding runs from different commands
+        analyzes_across_commands = [analyze for analyze in example.analyzes if isinstance(analyze, Analyze_compare_across_commands)]
+        if analyzes_across_commands:
+            for iRun in range(len(example.command_lines[0].runs)):  # loop over runs of first command
+                # collect corresponding runs from different commands, i.e. cmd_*/run_0001, cmd_*/run_0002, ...
+                runs_corresponding = [command_line.runs[iRun] for command_line in example.command_lines]
+                dependencies = [tasks[iRun] for tasks in finalize_tasks]
+                for analyze in analyzes_across_commands:
+                    self.graph.add(str(analyze), functools.partial(self.analyze_across_commands, analyze, runs_corresponding, args), dependencies, exclusive=analyze)
+
     #######################################################################
     ############################ main function ############################
     #######################################################################
+    def cancel(self):
+        """Kill the running commands (process groups and batch jobs) after the first error, the waiting tasks are dropped by the task graph"""
+        print(tools.yellow("Cancelling the running commands ..."))
+        ExternalCommand.cancel_all()
+        if self.executor:
+            self.executor.cancel_all()
+
     def main(self, start, builds, args, log):
         """
-        General workflow:
+        General workflow (each step is a task in a scheduler.TaskGraph, which is started as soon as the steps it depends on are complete):
 
         1.   loop over alls builds
         1.1    read all example directories in the check directory and exit if no examples are found
@@ -1268,320 +2136,77 @@ class PerformCheck:
             # initialize coverage
             self.init_coverage(args)
 
-            # 1.   loop over alls builds
-            for build_number, build in enumerate(builds, start=1):
-                remove_build_when_successful = True
-                print("Build Cmake Configuration ", build_number, " of ", len(builds), " ...", end=' ')  # skip linebreak
-                log.info(str(build))
-
-                # 1.1    read the example directories
-                # get example folders: run_basic/example1, run_basic/example2 from check folder
-                build.examples = getExamples(args.check, build, log)
-                log.info("build.examples" + str(build.examples))
-
-                # check if no examples are found
-                if len(build.examples) == 0:
-                    s1 = tools.red("No matching examples found for this build! Create an example or exclude this build combination")
-                    s2 = build.configuration.items()
-                    s = s1 + '\n' + str(s2)
-                    print(s)
-                    exit(1)
+            # core budget shared by all runs and externals (only limits the execution when runs are executed concurrently via --jobs)
+            self.budget = scheduler.CoreBudget(args.CoreBudget)
 
-                # 1.2    compile the build if args.run is false and the binary is non-existent
-                build.compile(args.buildprocs)
-                if not args.carryon:  # remove examples folder if not carryon, in order to re-run all examples
-                    tools.remove_folder(os.path.join(build.target_directory, "examples"))
+            # runs and externals are executed locally within the core budget or submitted to a batch system (--executor)
+            self.executor = getExecutor(args, self.budget)
 
-                # 1.3    check whether the build is using MPI (either disabled for the whole reggie execution or because compiled without MPI)
-                if args.noMPI or args.noMPIautomatic:
-                    MPIbuilt = False
-                else:
-                    if args.run:
-                        # If code is not compiled (ie. an executable is provided, activating MPI)
-                        MPIbuilt = True
-                    else:
-                        # Determining how the executable has been compiled
-                        LIBS_USE_MPI = build.configuration.get('LIBS_USE_MPI', 'OFF')
-                        if LIBS_USE_MPI == 'ON':
-                            MPIbuilt = True
-                        else:
-                            # Additionally check for variable MPI_built_flag=PICLAS_MPI (or FLEXI_MPI, depending on the executable name)
-                            MPI_built_flag = os.path.basename(build.binary_path).upper() + "_MPI"
-                            MPI_built_value = build.configuration.get(MPI_built_flag, 'OFF')
-                            if MPI_built_value == 'ON':  # PICLAS_MPI=ON specified
-                                MPIbuilt = True
-                            else:  # PICLAS_MPI=OFF or flag not specified (i.e. assuming LIBS_USE_MPI=OFF)
-                                MPIbuilt = False
-                build.MPIbuilt = MPIbuilt
-
-                # 2.   loop over all example directories
-                for example in build.examples:
-                    log.info(str(example))
-                    print(str(example))
+            # binaries of previous executions with the same cmake configuration, compilers and source tree (--build-cache)
+            if args.build_cache and not args.run and not args.singledir and not args.incremental and not (args.coverage or os.getenv('CODE_COVERAGE')):
+                self.build_cache = buildcache.BuildCache(args.build_cache, args.build_cache_size * 1e9)
 
-                    # 2.1    read the command line options in 'command_line.ini' for binary execution
-                    #        (e.g. number of threads for mpirun)
-                    example.command_lines = getCommand_Lines(os.path.join(example.source_directory, 'command_line.ini'), example, MPIbuilt, MaxCores=args.MaxCores)
+            # meshes of previous executions with the same mesh generator, parameter file and input files (--external-cache)
+            if args.external_cache:
+                self.external_cache = externalcache.ExternalCache(args.external_cache, args.external_cache_size * 1e9, self.MeshGeneration)
 
-                    # 2.2   read-in restart_file parameter from command_line.ini separately
-                    example.restart_file_list = getRestartFileList(example)
+            # results of the compiler checks and library lookups of the first configure, with which the other builds are configured (--initial-cache)
+            if args.initial_cache and not args.run and not args.incremental:
+                initial_cache = initialcache.InitialCache(args.initial_cache)
+                for build in builds:
+                    build.initial_cache = initial_cache
 
-                    # 2.3    read the analyze options in 'analyze.ini' within each example directory (e.g. L2 error analyze)
-                    example.analyzes = getAnalyzes(os.path.join(example.source_directory, 'analyze.ini'), example, args)
+            # builds with identical binaries share the runs of their examples (not for coverage, which is collected in each build directory)
+            if not args.no_run_dedup and not args.run and not args.singledir and not (args.coverage or os.getenv('CODE_COVERAGE')):
+                self.fingerprints = {}
 
-                    # 3.   loop over all command_line options
-                    # create directory containing mesh files to set symbolic links if mesh file is already created
-                    if args.meshesdir:
-                        self.created_mesh_files = {}
-                        self.meshes_dir_path = os.path.join(example.target_directory, 'meshes')
-                    for self.command_line_count, command_line in enumerate(example.command_lines, start=1):
-                        log.info(str(command_line))
-                        # Database linking
-                        database_path = command_line.parameters.get('database', None)
-                        if database_path is not None:
-                            database_path = os.path.abspath(os.path.join(example.source_directory, database_path))
-                            if not os.path.exists(database_path):
-                                s = tools.red("command_line.ini: cannot find file=[%s] " % (database_path))
-                                print(s)
-                                exit(1)
-                        # CVAE scattering linking
-                        cvae_scattering_cvae = command_line.parameters.get('cvae_scattering', None)
-                        if cvae_scattering_cvae is not None:
-                            cvae_scattering_cvae = os.path.abspath(os.path.join(example.source_directory, cvae_scattering_cvae))
-                            if not os.path.exists(cvae_scattering_cvae):
-                                s = tools.red("command_line.ini: cannot find file=[%s] " % (cvae_scattering_cvae))
-                                print(s)
-                                exit(1)
-
-                        # Get the index of the restart file to append to the analyze
-                        if example.restart_file_list is not None:
-                            iRestartFile = example.restart_file_list.index(command_line.parameters.get('restart_file', None))
-                        else:
-                            iRestartFile = None
-
-                        # 3.1    read the executable parameter file 'parameter.ini' (e.g. flexi.ini with which
-                        #        flexi will be started), N=, mesh=, etc.
-                        command_line.runs = getRuns(os.path.join(example.source_directory, 'parameter.ini'), command_line)
-
-                        # 4.   loop over all parameter combinations supplied in the parameter file 'parameter.ini'
-                        for self.RunCount, run in enumerate(command_line.runs, start=1):
-                            # collect different runtimes (from externals and main run)
-                            run.externals_time = 0
-                            print(tools.indent('Run %s of %s' % (self.RunCount, len(command_line.runs)), 1))
-                            log.info(str(run))
-                            # Database linking
-                            if database_path is not None and os.path.exists(run.target_directory):
-                                head, tail = os.path.split(database_path)
-                                os.symlink(database_path, os.path.join(run.target_directory, tail))
-                                print(tools.indent(tools.green('Preprocessing: Linked database [%s] to [%s] ... ' % (database_path, run.target_directory)), 2))
-                            # CVAE scattering linking
-                            if cvae_scattering_cvae is not None and os.path.exists(run.target_directory):
-                                head, tail = os.path.split(cvae_scattering_cvae)
-                                os.symlink(cvae_scattering_cvae, os.path.join(run.target_directory, tail))
-                                print(tools.indent(tools.green('Preprocessing: Linked CVAE scattering cvae file [%s] to [%s] ... ' % (cvae_scattering_cvae, run.target_directory)), 2))
-
-                            # 4.1 read the external options in 'externals.ini' within each example directory (e.g. eos, hopr, posti)
-                            #     distinguish between pre- and post processing
-                            run.externals_pre, run.externals_post, run.externals_errors = getExternals(os.path.join(run.source_directory, 'externals.ini'), run, build)
-
-                            # (pre) externals (1): loop over all externals available in external.ini
-                            external_failed = False
-                            if run.externals_pre is None:
-                                PreprocessingActive = False
-                            else:
-                                if len(run.externals_pre) == 0:
-                                    PreprocessingActive = False
-                                else:
-                                    PreprocessingActive = True
-                                    externalbinaries = [external.parameters.get("externalbinary") for external in run.externals_pre]
-                                    print(tools.indent(tools.green('Preprocessing: Started  %s pre-externals' % externalbinaries), 3))
-
-                            for self.external_count, external in enumerate(run.externals_pre):
-                                log.info(str(external))
-
-                                # (pre) externals (1.1): get the path and the parameterfiles to the i'th external
-                                externaldirectory = external.parameters.get("externaldirectory")
-                                if externaldirectory.endswith('.ini'):
-                                    external.directory = run.target_directory
-                                    external.parameterfiles = [externaldirectory]
-                                else:
-                                    external.directory = os.path.join(run.target_directory, externaldirectory)
-                                    external.parameterfiles = [i for i in os.listdir(external.directory) if i.endswith('.ini')]
-
-                                externalbinary = external.parameters.get("externalbinary")
-
-                                # (pre) externals (2): loop over all parameterfiles available for the i'th external
-                                for self.externalparameterfile_count, external.parameterfile in enumerate(external.parameterfiles):  # noqa: B020 loop control variable external overrides iterable it iterates
-                                    # (pre) externals (2.1): consider combinations
-                                    external.runs = getExternalRuns(os.path.join(external.directory, external.parameterfile), external)
-
-                                    # (pre) externals (3): loop over all combinations and parameterfiles for the i'th external
-                                    for self.externalrun_count, externalrun in enumerate(external.runs, start=1):
-                                        log.info(str(externalrun))
-
-                                        # (pre) externals (3.1): run the external binary
-                                        # check if meshes should be reused with symbolic links for each command line of example
-                                        if args.meshesdir:
-                                            # check if externalbinary is set in self.MeshGeneration and should be executed only once, since other externals should be executed normally
-                                            # we also save which MeshGenerator is matched to get the file ending
-                                            self.Matched_Generator_Name = next((Generator_Name for Generator_Name in self.MeshGeneration.keys() if Generator_Name in externalbinary), None)
-                                            if self.Matched_Generator_Name:
-                                                externalcmd = self.mesh_external(run, external, externalrun, build, args)
-                                            # execute other externals normally and also hopr every run if hopr binary has random name
-                                            else:
-                                                externalcmd = externalrun.execute(build, external, args)
-                                        # execute each external each run normally
-                                        else:
-                                            externalcmd = externalrun.execute(build, external, args)
-
-                                        if not externalrun.successful:
-                                            external_failed = True
-                                            s = tools.red('Execution (pre) external failed: %s' % externalcmd)
-                                            run.externals_errors.append(s)
-                                            print("ExternalRun.total_errors = %s" % (ExternalRun.total_errors))
-                                            ExternalRun.total_errors += 1  # add error if externalrun fails
-                                            # Check if immediate stop is activated on failure
-                                            if args.stop:
-                                                s = tools.red('Stop on first error (-p, --stop) is activated! Execution (pre) external failed')
-                                                print(s)
-                                                exit(1)
-                                        # add external runtime
-                                        run.externals_time += externalrun.walltime
-
-                            if PreprocessingActive:
-                                print(tools.indent(tools.green('Preprocessing: Externals %s finished!' % externalbinaries), 3))
-
-                            # 4.2    execute the binary file for one combination of parameters
-                            run.execute(build, command_line, args, external_failed)
-                            if not run.successful:
-                                Run.total_errors += 1  # add error if run fails
-                                # Check if immediate stop is activated on failure
-                                if args.stop:
-                                    s = tools.red('Stop on first error (-p, --stop) is activated! Execution of run failed')
-                                    print(s)
-                                    exit(1)
-
-                            # (post) externals (1): loop over all externals available in external.ini
-                            if run.externals_post is None:
-                                PostprocessingActive = False
-                            else:
-                                if len(run.externals_post) == 0:
-                                    PostprocessingActive = False
-                                else:
-                                    PostprocessingActive = True
-                                    externalbinaries = [external.parameters.get("externalbinary") for external in run.externals_post]
-                                    print(tools.indent(tools.green('Postprocessing: Started  %s post-externals' % externalbinaries), 3))
-
-                            for external in run.externals_post:
-                                log.info(str(external))
-
-                                # (post) externals (1.1): get the path and the parameterfiles to the i'th external
-                                externaldirectory = external.parameters.get("externaldirectory")
-                                if externaldirectory.endswith('.ini'):
-                                    external.directory = run.target_directory
-                                    external.parameterfiles = [externaldirectory]
-                                else:
-                                    external.directory = os.path.join(run.target_directory, externaldirectory)
-                                    external.parameterfiles = [i for i in os.listdir(external.directory) if i.endswith('.ini')]
-
-                                # externalbinary = external.parameters.get("externalbinary")
-
-                                # (post) externals (2): loop over all parameterfiles available for the i'th external
-                                for external.parameterfile in external.parameterfiles:  # noqa: B020 loop control variable external overrides iterable it iterates
-                                    # (post) externals (2.1): consider combinations
-                                    external.runs = getExternalRuns(os.path.join(external.directory, external.parameterfile), external)
-
-                                    # (post) externals (3): loop over all combinations and parameterfiles for the i'th external
-                                    for externalrun in external.runs:
-                                        log.info(str(externalrun))
-
-                                        # (post) externals (3.1): run the external binary
-                                        externalcmd = externalrun.execute(build, external, args)
-                                        if not externalrun.successful:
-                                            # print(externalrun.return_code)
-                                            s = tools.red('Execution (post) external failed: %s' % externalcmd)
-                                            run.externals_errors.append(s)
-                                            ExternalRun.total_errors += 1  # add error if externalrun fails
-                                            # Check if immediate stop is activated on failure
-                                            if args.stop:
-                                                s = tools.red('Stop on first error (-p, --stop) is activated! Execution (post) external failed')
-                                                print(s)
-                                                exit(1)
-                                        # add external runtime
-                                        run.externals_time += externalrun.walltime
-
-                            if PostprocessingActive:
-                                print(tools.indent(tools.green('Postprocessing: Externals %s finished!' % externalbinaries), 3))
-
-                            # 4.3 Remove unwanted files: run analysis directly after each run (as opposed to the normal analysis which is used for analyzing the created output)
-                            for analyze in example.analyzes:
-                                if isinstance(analyze, Clean_up_files):
-                                    analyze.execute(run)
-
-                        # 5.   loop over all successfully executed binary results and perform analyze tests
-                        runs_successful = [run for run in command_line.runs if run.successful]
-                        if runs_successful:  # do analysis only if runs_successful is not empty
-                            for analyze in example.analyzes:
-                                if isinstance(analyze, Clean_up_files) or isinstance(analyze, Analyze_compare_across_commands):
-                                    # skip because either already called in the "run" loop under 4.2 or called later under cross-command comparisons in 7.
-                                    continue
-                                # Set the restart file index in case of one diff per restart file (from command line)
-                                analyze.iRestartFile = iRestartFile
-                                # Output of the __str__ for the respective analyze routine
-                                print(tools.indent(tools.blue(str(analyze)), 2))
-                                # Perform the analyze for the successful runs
-                                analyze.perform(runs_successful)
-                                # Check if immediate stop is activated on failure
-                                if args.stop and Analyze.total_errors > 0:
-                                    s = tools.red('Stop on first error (-p, --stop) is activated! Analysis failed')
-                                    print(s)
-                                    exit(1)
-                        else:  # don't delete build folder after all examples/runs
-                            remove_build_when_successful = False
-
-                        # 6.   rename all run directories for which the analyze step has failed for at least one test
-                        for run in runs_successful:  # all successful runs (failed runs are already renamed)
-                            if not run.analyze_successful:  # if 1 of N analyzes fails: rename
-                                run.rename_failed()
-
-                        # Don't remove when run fails
-                        if not all([run.analyze_successful for run in runs_successful]):  # don't delete build folder after all examples/runs
-                            remove_build_when_successful = False
-
-                        # Don't remove when (pre) external fails
-                        for run in runs_successful:
-                            for external in run.externals_pre:
-                                if not all([externalrun.successful for externalrun in external.runs]):  # don't delete build folder after all examples/runs
-                                    remove_build_when_successful = False
-
-                        # Don't remove when (post) external fails
-                        for run in runs_successful:
-                            for external in run.externals_post:
-                                if not all([externalrun.successful for externalrun in external.runs]):  # don't delete build folder after all examples/runs
-                                    remove_build_when_successful = False
-
-                    # 7.    perform analyze tests comparing corresponding runs from different commands
-                    for iRun in range(len(example.command_lines[0].runs)):  # loop over runs of first command
-                        # collect corresponding runs from different commands, i.e. cmd_*/run_0001, cmd_*/run_0002, ...
-                        runs_corresponding = [command_line.runs[iRun] for command_line in example.command_lines]
-                        for analyze in example.analyzes:
-                            # perform only cross-command comparisons
-                            if isinstance(analyze, Analyze_compare_across_commands):
-                                print(tools.indent(tools.blue(str(analyze)), 2))
-                                analyze.perform(runs_corresponding)
-                                # Check if immediate stop is activated on failure
-                                if args.stop and Analyze.total_errors > 0:
-                                    s = tools.red('Stop on first error (-p, --stop) is activated! Analysis failed (cross-command comparisons)')
-                                    print(s)
-                                    exit(1)
-
-                # create coverage report for current build
-                if args.coverage:
-                    self.write_single_coverage_report(build, args)
-
-                if remove_build_when_successful and not args.save:
-                    tools.remove_folder(build.target_directory)
-                print('=' * 132)
+            # wall times of previous executions for predicting the duration of the runs
+            self.history = history.WalltimeHistory(args.history)
+
+            # all steps are tasks in a graph that are started as soon as their dependencies are complete (at most --jobs at the same time),
+            # concurrently executed runs are packed into the core budget with the longest runs first (--schedule)
+            order = args.schedule if args.jobs > 1 else 'fifo'
+            # the first error (or Ctrl+C) kills the running commands (--stop)
+            self.graph = scheduler.TaskGraph({'job': args.jobs, 'compile': 1}, cores=self.budget.total, order=order, on_error=self.cancel)
+
+            # pipelined mode: configure and compile the next builds in the background while the examples of the current build are running
+            pipeline_builds = 0
+            if args.pipeline_builds > 0 and not args.run:
+                if args.singledir or args.incremental:
+                    print(tools.yellow("--pipeline-builds cannot be used with a single build directory (--singledir/--incremental): compiling one build after the other"))
+                else:
+                    pipeline_builds = args.pipeline_builds
+                    self.compile_cores = max(1, int(round(args.compile_share * self.budget.total)))
+                    print(tools.yellow("Compiling up to %s builds ahead in the background with %s cores" % (pipeline_builds, self.compile_cores)))
+            ExternalCommand.concurrent = args.jobs > 1 or pipeline_builds > 0
+            Run.staging = staging.Staging(args.staging)
+
+            # runs are executed in a node-local scratch directory (--scratch), which must be visible to the processes of the runs
+            if args.scratch:
+                if not self.executor.local:
+                    print(tools.yellow("--scratch can only be used when the runs are executed locally (--executor local): executing the runs in output_dir"))
+                else:
+                    tools.create_folder(args.scratch)
+                    Run.scratch = tempfile.mkdtemp(prefix='reggie_', dir=args.scratch)
+                    print(tools.yellow("Executing the runs in the scratch directory [%s]" % Run.scratch))
+            ExternalCommand.redirect = args.redirect_output
+
+            # 1.   loop over alls builds: the examples of a build are started when the previous build is finished and a build is compiled
+            #      after the previous build is finished or, in pipelined mode, after the build 'pipeline_builds' ahead is finished
+            compile_task = None
+            finish_tasks = []
+            for build_number, build in enumerate(builds, start=1):
+                compile_function = functools.partial(self.compile_build, build, build_number, len(builds), args, log)
+                if pipeline_builds > 0:
+                    compile_function = functools.partial(self.compile_build_in_background, build, build_number, len(builds), args, log)
+                    ahead = len(finish_tasks) - pipeline_builds - 1
+                    dependencies = [compile_task, finish_tasks[ahead] if ahead >= 0 else None]
+                    compile_task = self.graph.add(build.target_directory, compile_function, dependencies, slot='compile')
+                else:
+                    compile_task = self.graph.add(build.target_directory, compile_function, finish_tasks[-1:])
+                prepare_task = self.graph.add(build.target_directory, functools.partial(self.prepare_build, build, args, log), [compile_task] + finish_tasks[-1:])
+                finish_tasks.append(self.graph.add(build.target_directory, functools.partial(self.finish_build, build, args), [prepare_task]))
+            self.graph.run()
 
             # check if reggie is executed directly or via gitlab: if executed by hand combine the coverage data over all builds, gitlab uses the single reports and separate stage to combine
             if not self.coverage_env and args.coverage:
@@ -1606,5 +2231,43 @@ class PerformCheck:
             print(tools.bcolors.ENDC)
 
             print("run 'reggie' with the command line option '-c/--carryon' to skip successful builds.")
-            tools.finalize(start, 1, Run.total_errors, Analyze.total_errors, Analyze.total_infos)
+            summary.finalize(start, 1, Run.total_errors, ExternalRun.total_errors, Analyze.total_errors, Analyze.total_infos)
             exit(1)
+
+        # stop on first error (-p, --stop): the commands that were running have been killed, display the summary of the runs so far
+        except StopOnFirstError as ex:
+            cancelled = 0
+            not_started = 0
+            examples_not_started = 0
+            for build in builds:
+                for example in build.examples:
+                    if len(example.command_lines) == 0:  # the tasks of the example have not been added before the stop
+                        examples_not_started += 1
+                    for command_line in example.command_lines:
+                        for run in command_line.runs:
+                            if not hasattr(run, 'started'):
+                                run.result = tools.yellow("Not started")
+                                not_started += 1
+                            elif run.cancelled:
+                                cancelled += 1
+            summary.SummaryOfErrors(builds, args)
+            print(tools.red(str(ex)))
+            print(tools.yellow("%s runs have been cancelled and %s runs have not been started" % (cancelled, not_started)))
+            if examples_not_started > 0:
+                print(tools.yellow("%s examples have not been started" % examples_not_started))
+            summary.finalize(start, 0, Run.total_errors, ExternalRun.total_errors, Analyze.total_errors, Analyze.total_infos)
+
+        finally:
+            # store the wall times of this execution (also when stopped on the first error)
+            if self.history:
+                self.history.write()
+            # configure, compile and link times of all builds (see summary.SummaryOfErrors)
+            compileprofile.writeCompileProfiles(builds, os.path.join(OutputDirectory.output_dir, 'compile_profile.json'))
+            # let the workers of the job queue exit (--coordinator)
+            if self.executor:
+                self.executor.close()
+            # remove the scratch directory of this execution (--scratch)
+            if Run.scratch:
+                shutil.rmtree(Run.scratch, ignore_errors=True)
+            # the folders removed via tools.remove_folder() are deleted in the background
+            tools.background_deletion.wait()
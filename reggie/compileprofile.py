@@ -0,0 +1,163 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import re
+import json
+
+from reggie import tools
+
+# number of the slowest translation units that are displayed in the summary (all are written to the profile file)
+SLOWEST = 3
+
+# outputs of the ninja log that are linked (executables without extension and libraries)
+LINK_OUTPUT = re.compile(r'(^|/)[^/.]+$|\.(so(\.\d+)*|a|dylib|dll|exe)$')
+
+# object file of a compile command in the make log
+MAKE_OBJECT = re.compile(r'\s-o\s+(\S+\.(o|obj))(\s|$)')
+
+# shell of make (SHELL=...), which records the start and end times (ns) and the command of the compile and link steps in the make log
+MAKE_SHELL = """#!/bin/sh
+case "$2" in
+  *cmake_echo_color*|*cmake_depends*) exec /bin/sh "$@" ;;
+  *" -c "*|*cmake_link_script*) ;;
+  *) exec /bin/sh "$@" ;;
+esac
+start=$(date +%%s%%N)
+/bin/sh "$@"
+return_code=$?
+printf '%%s\\t%%s\\t%%s\\n' "$start" "$(date +%%s%%N)" "$2" >> '%s'
+exit $return_code
+"""
+
+
+class CompileProfile:
+    """
+    Configure, compile and link times of a build. With ninja, the time of each translation unit is read from the entries that are
+    appended to .ninja_log during the build. Makefiles do not record the times of their targets, hence, make is executed with a shell
+    (SHELL=..., see make_arguments) that writes the times of the compile and link commands into CMakeFiles/reggie_make.log.
+    """
+
+    def __init__(self):
+        self.configure = None  # wall time of cmake
+        self.build = None  # wall time of make/ninja
+        self.link = None  # sum over the link steps
+        self.units = []  # (source file, seconds) of each translation unit, slowest first
+        self.ninja_log_offset = None
+        self.make_log = None
+        self.make_arguments = []  # appended to the make command
+
+    def start(self, directory):
+        """
+        Remember the end of .ninja_log before the build, only the entries that are appended during the build belong to it. For
+        Makefiles, write the shell of make that records the times into a new make log (requires GNU make and date +%N)
+        """
+        ninja_log = os.path.join(directory, '.ninja_log')
+        self.ninja_log_offset = os.path.getsize(ninja_log) if os.path.exists(ninja_log) else 0
+        if os.path.exists(os.path.join(directory, 'build.ninja')) or not os.path.isdir(os.path.join(directory, 'CMakeFiles')):
+            return
+        make_log = os.path.abspath(os.path.join(directory, 'CMakeFiles', 'reggie_make.log'))
+        shell = os.path.abspath(os.path.join(directory, 'CMakeFiles', 'reggie_make_shell.sh'))
+        if any(character.isspace() for character in shell):  # SHELL of make must not contain whitespace
+            return
+        try:
+            with open(make_log, 'w'):
+                pass
+            with open(shell, 'w') as f:
+                f.write(MAKE_SHELL % make_log.replace("'", "'\\''"))
+            os.chmod(shell, 0o755)
+        except OSError:
+            return
+        self.make_log = make_log
+        self.make_arguments = ['SHELL=%s' % shell]
+
+    def finish(self, directory, walltime):
+        self.build = walltime
+        ninja_log = os.path.join(directory, '.ninja_log')
+        if self.make_log:
+            durations, links = readMakeLog(self.make_log)
+        elif os.path.exists(os.path.join(directory, 'build.ninja')) and os.path.exists(ninja_log):
+            durations = readNinjaLog(ninja_log, self.ninja_log_offset)
+            links = [seconds for output, seconds in durations.items() if LINK_OUTPUT.search(output)]
+        else:
+            return
+        self.link = sum(links)
+        self.units = sorted(((getSourceName(output), seconds) for output, seconds in durations.items() if output.endswith(('.o', '.obj'))), key=lambda unit: -unit[1])
+
+    def __str__(self):
+        s = "configure %.1f sec, build %.1f sec" % (self.configure or 0.0, self.build or 0.0)
+        if self.units:
+            s += " (%s translation units: %.1f sec, link: %.1f sec)" % (len(self.units), sum(seconds for _, seconds in self.units), self.link)
+            s += ", slowest: " + ", ".join("%s %.1f sec" % unit for unit in self.units[:SLOWEST])
+        return s
+
+    def asDict(self):
+        return {'configure': self.configure, 'build': self.build, 'link': self.link, 'units': [{'source': source, 'seconds': seconds} for source, seconds in self.units]}
+
+
+def readNinjaLog(ninja_log, offset):
+    """Durations of the outputs (seconds) of the entries that have been appended to .ninja_log after offset"""
+    with open(ninja_log) as f:
+        if os.path.getsize(ninja_log) >= offset:  # the log is rewritten (shortened) by ninja from time to time
+            f.seek(offset)
+        lines = f.readlines()
+    durations = {}
+    for line in lines:
+        columns = line.rstrip('\n').split('\t')
+        if line.startswith('#') or len(columns) < 4:
+            continue
+        try:
+            durations[columns[3]] = (int(columns[1]) - int(columns[0])) / 1000.0  # the last entry of an output wins
+        except ValueError:
+            continue
+    return durations
+
+
+def readMakeLog(make_log):
+    """Durations of the object files (seconds) and of the link steps in the make log (start, end and command of each step)"""
+    durations = {}
+    links = []
+    try:
+        with open(make_log) as f:
+            lines = f.readlines()
+    except OSError:
+        return durations, links
+    for line in lines:
+        columns = line.rstrip('\n').split('\t', 2)
+        try:
+            seconds = (int(columns[1]) - int(columns[0])) / 1e9
+        except (ValueError, IndexError):
+            continue  # e.g. date without %N
+        output = MAKE_OBJECT.search(columns[2])
+        if output:
+            durations[output.group(1)] = seconds
+        elif 'cmake_link_script' in columns[2]:
+            links.append(seconds)
+    return durations, links
+
+
+def getSourceName(output):
+    """Source file of an object file, e.g., CMakeFiles/flexilib.dir/src/mesh/mesh.f90.o -> src/mesh/mesh.f90"""
+    output = re.sub(r'^.*CMakeFiles/[^/]+\.dir/', '', output)
+    return re.sub(r'\.(o|obj)$', '', output)
+
+
+def writeCompileProfiles(builds, path):
+    """Write the compile profiles of all compiled builds into a JSON file"""
+    profiles = [{'directory': build.target_directory, 'cmake': build.cmake_cmd, **build.profile.asDict()} for build in builds if getattr(build, 'profile', None)]
+    if not profiles:
+        return
+    try:
+        with open(path, 'w') as f:
+            json.dump(profiles, f, indent=1)
+    except OSError as e:
+        print(tools.yellow("Could not write the compile profile [%s] (%s)" % (path, e)))
@@ -0,0 +1,120 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import shutil
+import subprocess
+
+from reggie import tools
+
+# compiler launchers that are used with --compiler-launcher auto (in this order)
+LAUNCHERS = ('ccache', 'sccache')
+
+# languages for which CMAKE_<LANG>_COMPILER_LAUNCHER is set
+LANGUAGES = ('Fortran', 'C', 'CXX')
+
+# statistics ids of the ccache stats log that mark a compilation as hit or miss (a compilation increments several ids, e.g.,
+# direct_cache_miss, preprocessed_cache_miss and cache_miss, or direct_cache_hit and local_storage_hit)
+CCACHE_HITS = ('direct_cache_hit', 'preprocessed_cache_hit')
+CCACHE_MISSES = ('cache_miss',)
+
+
+def getLauncher(launcher):
+    """Path of the compiler launcher selected via --compiler-launcher ('auto': the first of LAUNCHERS that is found, 'none': None)"""
+    if launcher is None or launcher == 'none':
+        return None
+    if launcher == 'auto':
+        for name in LAUNCHERS:
+            path = shutil.which(name)
+            if path:
+                return path
+        return None
+    path = shutil.which(launcher)
+    if not path:
+        print(tools.red("Compiler launcher '%s' not found. Supply 'auto', 'none' or the name/path of a launcher, e.g., ccache." % launcher))
+        exit(1)
+    return os.path.abspath(path)
+
+
+class CompilerCacheStats:
+    """
+    Hits and misses of the compiler cache during the compilation of a single build
+
+    ccache: the results of all compilations are written to [build directory]/ccache.log (stats_log, CCACHE_STATSLOG, ccache >= 4.4),
+            which is only used by this build, hence, the numbers are exact also for builds that are compiled at the same time.
+    sccache: difference of the statistics of the sccache server before and after the compilation, which also contains the
+             compilations of other builds when the builds are compiled at the same time (--pipeline-builds).
+    """
+
+    def __init__(self, launcher, directory):
+        self.launcher = launcher
+        self.name = os.path.basename(launcher)
+        self.log = os.path.abspath(os.path.join(directory, 'ccache.log'))
+        self.hits = None
+        self.misses = None
+        self.before = None
+
+    def environment(self):
+        """Environment of the build command"""
+        if self.name.startswith('ccache'):
+            return dict(os.environ, CCACHE_STATSLOG=self.log)
+        return None
+
+    def start(self):
+        if os.path.exists(self.log):
+            os.remove(self.log)
+        if self.name.startswith('sccache'):
+            self.before = getSccacheStats(self.launcher)
+
+    def stop(self):
+        if self.name.startswith('ccache'):
+            try:
+                with open(self.log) as f:
+                    compilations = readStatsLog(f)
+            except OSError:
+                return  # stats_log is not supported by this ccache version
+            self.hits = sum(1 for ids in compilations if any(i in CCACHE_HITS for i in ids))
+            self.misses = sum(1 for ids in compilations if any(i in CCACHE_MISSES for i in ids))
+        elif self.before is not None:
+            after = getSccacheStats(self.launcher)
+            if after is not None:
+                self.hits = after[0] - self.before[0]
+                self.misses = after[1] - self.before[1]
+
+    def __str__(self):
+        if self.hits is None:
+            return "%s: no statistics" % self.name
+        total = self.hits + self.misses
+        return "%s: %s hits, %s misses, %.0f%% hit rate" % (self.name, self.hits, self.misses, 100.0 * self.hits / total if total > 0 else 0.0)
+
+
+def readStatsLog(f):
+    """Statistics ids of each compilation in a ccache stats log (a block '# <source file>' followed by one id per line)"""
+    compilations = []
+    for line in f:
+        line = line.strip()
+        if line.startswith('#'):
+            compilations.append([])
+        elif line and compilations:
+            compilations[-1].append(line)
+    return compilations
+
+
+def getSccacheStats(launcher):
+    """Total number of cache hits and misses of the sccache server (or None)"""
+    try:
+        result = subprocess.run([launcher, '--show-stats', '--stats-format=json'], capture_output=True, text=True)
+        stats = json.loads(result.stdout)['stats']
+        return (sum(stats['cache_hits']['counts'].values()), sum(stats['cache_misses']['counts'].values()))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
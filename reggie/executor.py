@@ -0,0 +1,302 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import time
+import socket
+import shlex
+import signal
+import logging
+import contextlib
+import subprocess
+import threading
+from types import SimpleNamespace
+from timeit import default_timer as timer
+
+from reggie import tools
+
+
+class LocalExecutor:
+    """
+    Execute the runs and externals as child processes of reggie (default). Each command reserves its cores from the core budget while
+    it is running.
+    """
+
+    local = True
+
+    def __init__(self, budget=None):
+        self.budget = budget
+
+    def execute(self, command, cmd, directory, cores, name="std", string_info=None):
+        """Execute 'cmd' in 'directory' via command.execute_cmd() and return the return code"""
+        with self.budget.reserve(cores) if self.budget else contextlib.nullcontext():
+            return command.execute_cmd(cmd, directory, name=name, string_info=string_info)
+
+    def cancel_all(self):
+        pass  # the local commands are killed by ExternalCommand.cancel_all()
+
+    def close(self):
+        pass
+
+
+class BatchExecutor:
+    """
+    Submit each run and external as a job to a batch system and poll for its completion, hence, the concurrently executed commands
+    (--jobs) are spread across the nodes of the cluster instead of sharing the cores of the node on which reggie is running.
+
+    The job script executes the command in its directory, writes the std and err output directly into [name].out and [name].err (as
+    with --redirect-output) and finally writes the return code into [name].exit, which is polled for by reggie. The directory must
+    therefore be on a file system that is shared with the compute nodes.
+
+    Derived classes implement submit() (returns the job id or None), is_queued() and cancel() for a specific batch system.
+    """
+
+    local = False
+
+    def __init__(self, options="", poll_interval=5.0):
+        self.options = shlex.split(options or "")
+        self.poll_interval = max(0.01, poll_interval)
+        self.active = {}  # submitted jobs that have not finished yet (job id: command)
+        self.active_lock = threading.Lock()
+
+    def execute(self, command, cmd, directory, cores, name="std", string_info=None):
+        """Execute 'cmd' in 'directory' as a batch job, fill the result of command (like execute_cmd()) and return the return code"""
+        log = logging.getLogger('logger')
+        (cmd, workingDir) = command.prepare(cmd, directory, name, string_info, log)
+        if command.cancelling:
+            return command.set_cancelled()
+        exit_filename = os.path.join(workingDir, name + ".exit")
+        if os.path.exists(exit_filename):
+            os.remove(exit_filename)
+
+        # job script: the return code is written to a temporary file first, which is renamed, because the rename is atomic
+        script = os.path.join(workingDir, name + ".job.sh")
+        with open(script, 'w') as f:
+            f.write("#!/bin/sh\n")
+            f.write("cd %s\n" % shlex.quote(workingDir))
+            stdout_filename = os.path.abspath(command.stdout_filename)
+            stderr_filename = os.path.abspath(command.stderr_filename)
+            f.write("%s > %s 2> %s\n" % (" ".join(shlex.quote(c) for c in cmd), shlex.quote(stdout_filename), shlex.quote(stderr_filename)))
+            f.write("return_code=$?\n")
+            f.write("echo $return_code > %s.tmp && mv %s.tmp %s\n" % ((shlex.quote(exit_filename),) * 3))
+            f.write("exit $return_code\n")
+
+        start = timer()
+        with self.active_lock:
+            job = None if command.cancelling else self.submit(script, workingDir, cores, name)
+            if job is not None:
+                self.active[job] = command
+        if job is None:
+            command.return_code = -1
+            command.cancelled = command.cancelling
+        else:
+            log.debug("submitted job %s: %s" % (job, script))
+            command.return_code = self.wait(job, exit_filename, command)
+            with self.active_lock:
+                del self.active[job]
+        command.walltime = timer() - start
+
+        # the output files are missing if the job has not been started at all
+        for filename in (command.stdout_filename, command.stderr_filename):
+            if not os.path.exists(filename):
+                open(filename, 'w').close()
+        command.finish(string_info, True, log, redirected=True)
+
+        return command.return_code
+
+    def wait(self, job, exit_filename, command):
+        """Poll for the exit file of the job and return the return code (-1 if the job has left the queue without writing it)"""
+        gone = False
+        while not os.path.exists(exit_filename):
+            if gone:
+                if command.cancelled:
+                    return -1
+                print(tools.red("Job %s has left the queue without writing its return code to [%s]" % (job, exit_filename)))
+                return -1
+            # check the exit file once more after the job has left the queue (the file might only appear with a delay on the shared file system)
+            gone = not self.is_queued(job)
+            time.sleep(self.poll_interval)
+        with open(exit_filename) as f:
+            try:
+                return int(f.read().strip())
+            except ValueError:
+                return -1
+
+    def submit(self, script, directory, cores, name):
+        raise NotImplementedError
+
+    def is_queued(self, job):
+        raise NotImplementedError
+
+    def cancel(self, job):
+        raise NotImplementedError
+
+    def cancel_all(self):
+        """Cancel all submitted jobs that have not finished yet (no further jobs are submitted after ExternalCommand.cancel_all())"""
+        with self.active_lock:
+            for job, command in self.active.items():
+                command.cancelled = True
+                self.cancel(job)
+
+    def close(self):
+        """Called after all runs have finished"""
+        pass
+
+
+class SlurmExecutor(BatchExecutor):
+    """Submit the jobs via sbatch (one task per core of the command) and poll the queue via squeue"""
+
+    def submit(self, script, directory, cores, name):
+        # fmt: off
+        cmd = ["sbatch", "--parsable",
+                         "--job-name=reggie-%s" % name,
+                         "--ntasks=%s" % max(1, cores),
+                         "--output=/dev/null",
+                         "--chdir=%s" % directory] + self.options + [script]
+        # fmt: on
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as e:
+            print(tools.red("Could not submit the job [%s]: %s" % (" ".join(cmd), e)))
+            return None
+        if result.returncode != 0:
+            print(tools.red("Could not submit the job [%s]: %s" % (" ".join(cmd), result.stderr.strip())))
+            return None
+        # --parsable prints "jobid" or "jobid;cluster"
+        return result.stdout.strip().split(';')[0]
+
+    def is_queued(self, job):
+        result = subprocess.run(["squeue", "--noheader", "--jobs=%s" % job, "--format=%T"], capture_output=True, text=True)
+        return result.returncode == 0 and result.stdout.strip() != ""
+
+    def cancel(self, job):
+        subprocess.run(["scancel", job], capture_output=True)
+
+
+class FakeBatchExecutor(BatchExecutor):
+    """
+    Local stand-in for a batch system: the job scripts are started as detached background processes (in their own session) and
+    reggie polls for their exit files exactly as for a real batch system. Used for testing the batch executor without a cluster.
+    """
+
+    def __init__(self, options="", poll_interval=5.0):
+        super().__init__(options, poll_interval)
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, script, directory, cores, name):  # noqa: ARG002
+        process = subprocess.Popen(["sh", script], cwd=directory, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        with self.lock:
+            self.jobs[str(process.pid)] = process
+        return str(process.pid)
+
+    def is_queued(self, job):
+        with self.lock:
+            return self.jobs[job].poll() is None
+
+    def cancel(self, job):
+        with self.lock:
+            process = self.jobs[job]
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGTERM)
+
+
+class QueueExecutor(BatchExecutor):
+    """
+    Coordinator of a job queue on a shared file system (reggie --coordinator DIR): the job scripts are put into DIR/queue, from where
+    they are pulled by worker processes on other nodes (reggie --worker DIR, see reggie/worker.py), which share the checkout and the
+    output directory with the coordinator. The builds, analyses and the summary are performed by the coordinator.
+
+    Layout of the queue directory (see also getQueuePaths()):
+        queue/[job].json     : job waiting for a worker (script, directory and number of cores)
+        running/[job].json   : job claimed by a worker (the claim is an atomic rename from queue/)
+        running/[job].worker : name of the worker that executes the job
+        running/[job].cancel : request to kill the job (written by cancel())
+        workers/[worker]     : heartbeat of a worker (touched regularly), a job of a worker without heartbeat is considered lost
+        stop                 : written by the coordinator when it has finished, the workers exit when the queue is empty
+    """
+
+    def __init__(self, directory, poll_interval=5.0):
+        super().__init__("", poll_interval)
+        self.paths = getQueuePaths(directory)
+        self.lock = threading.Lock()
+        self.number_of_jobs = 0
+        for path in (self.paths.queue, self.paths.running, self.paths.cancelled, self.paths.workers):
+            tools.create_folder(path)
+        if os.path.exists(self.paths.stop):
+            os.remove(self.paths.stop)
+
+    def submit(self, script, directory, cores, name):
+        with self.lock:
+            self.number_of_jobs += 1
+            job = "%s-%s-%06d" % (socket.gethostname(), os.getpid(), self.number_of_jobs)
+        # write the job under a hidden name first, which is ignored by the workers, and rename it (atomic)
+        tmp = os.path.join(self.paths.queue, ".%s.tmp" % job)
+        with open(tmp, 'w') as f:
+            json.dump({'script': script, 'directory': directory, 'cores': max(1, cores), 'name': name}, f)
+        os.replace(tmp, os.path.join(self.paths.queue, job + ".json"))
+        return job
+
+    def is_queued(self, job):
+        if os.path.exists(os.path.join(self.paths.queue, job + ".json")):
+            return True
+        if not os.path.exists(os.path.join(self.paths.running, job + ".json")):
+            return False
+        try:
+            with open(os.path.join(self.paths.running, job + ".worker")) as f:
+                worker = f.read().strip()
+        except FileNotFoundError:
+            return True  # the job has just been claimed
+        return isAlive(self.paths, worker, self.poll_interval)
+
+    def cancel(self, job):
+        try:
+            os.rename(os.path.join(self.paths.queue, job + ".json"), os.path.join(self.paths.cancelled, job + ".json"))
+        except FileNotFoundError:
+            open(os.path.join(self.paths.running, job + ".cancel"), 'w').close()
+
+    def close(self):
+        open(self.paths.stop, 'w').close()
+
+
+def getQueuePaths(directory):
+    """Paths of the job queue on the shared file system (reggie --coordinator/--worker)"""
+    directory = os.path.abspath(directory)
+    # fmt: off
+    return SimpleNamespace(directory = directory,
+                           queue     = os.path.join(directory, 'queue'),
+                           running   = os.path.join(directory, 'running'),
+                           cancelled = os.path.join(directory, 'cancelled'),
+                           workers   = os.path.join(directory, 'workers'),
+                           stop      = os.path.join(directory, 'stop'))
+    # fmt: on
+
+
+def isAlive(paths, worker, poll_interval):
+    """Check the heartbeat of a worker (touched every poll_interval seconds by the worker)"""
+    try:
+        age = time.time() - os.path.getmtime(os.path.join(paths.workers, worker))
+    except FileNotFoundError:
+        return False
+    return age < max(60.0, 10.0 * poll_interval)
+
+
+def getExecutor(args, budget):
+    """Create the executor of the runs and externals selected via --executor (or --coordinator)"""
+    if args.coordinator:
+        return QueueExecutor(args.coordinator, args.batch_poll_interval)
+    if args.executor == 'slurm':
+        return SlurmExecutor(args.batch_options, args.batch_poll_interval)
+    if args.executor == 'fake-batch':
+        return FakeBatchExecutor(args.batch_options, args.batch_poll_interval)
+    return LocalExecutor(budget)
@@ -0,0 +1,146 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import functools
+from contextlib import contextmanager
+
+from reggie import tools
+from reggie.buildcache import getSize, evict
+
+
+class ExternalCache:
+    """
+    Persistent, content-addressed cache of the output files of the (pre) externals that generate meshes (e.g. hopr and pyhope), which is
+    shared by all examples and reggie executions on a machine (--external-cache).
+
+    outputs : dictionary with the name of the external and the ending of its output files, e.g., {'pyhope': '_mesh.h5', 'hopr': '_mesh.h5'}
+
+    The entries are stored under [path]/entries/[key], where the key is a hash of the contents of the external binary, the generated
+    parameter file, the input files that are referenced in the parameter file and the command line suffix (see getKey()). The output files
+    of an entry are hard-linked into the directory of the external (symlinked if the cache is on another file system). The least recently
+    used entries are removed when the total size exceeds max_size. As for the build cache, the cache is locked via flock() on [path]/lock.
+    """
+
+    def __init__(self, path, max_size, outputs):
+        self.path = os.path.abspath(path)
+        self.entries = os.path.join(self.path, 'entries')
+        self.max_size = max_size
+        self.outputs = outputs
+        tools.create_folder(self.entries)
+
+    @contextmanager
+    def lock(self, operation):
+        with open(os.path.join(self.path, 'lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def getOutputEnding(self, binary_path):
+        """Ending of the output files if the binary is an external whose outputs are cached, otherwise None"""
+        name = os.path.basename(binary_path)
+        return next((ending for generator, ending in self.outputs.items() if generator in name), None)
+
+    def getKey(self, binary_path, parameter_path, parameters, cmd_suffix):
+        """Hash of the contents of the binary, the parameter file and the input files referenced in the parameter file (None if unknown)"""
+        binary = shutil.which(binary_path) or binary_path
+        if not os.path.isfile(binary):
+            return None
+        directory = os.path.dirname(parameter_path)
+        inputs = {}
+        for value in parameters.values():
+            for item in value if isinstance(value, list) else [value]:
+                path = os.path.join(directory, str(item))
+                if os.path.isfile(path) and os.path.abspath(path) != os.path.abspath(parameter_path):
+                    inputs[str(item)] = getFileHash(os.path.realpath(path))
+        data = {'binary': getFileHash(os.path.realpath(binary)), 'parameters': getFileHash(parameter_path), 'inputs': inputs, 'cmd_suffix': cmd_suffix}
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:32]
+
+    def getOutputs(self, directory, ending):
+        """Output files in the directory with their modification times"""
+        return {f: os.path.getmtime(os.path.join(directory, f)) for f in os.listdir(directory) if f.endswith(ending) and os.path.isfile(os.path.join(directory, f))}
+
+    def unlinkOutputs(self, directory, ending):
+        """Remove the linked output files (e.g. restored for a previous external run), which must not be overwritten by the external"""
+        for f in os.listdir(directory):
+            path = os.path.join(directory, f)
+            if f.endswith(ending) and (os.path.islink(path) or (os.path.isfile(path) and os.stat(path).st_nlink > 1)):
+                os.remove(path)
+
+    def restore(self, key, directory):
+        """Link the output files of the entry into the directory, returns True if the entry exists"""
+        entry = os.path.join(self.entries, key)
+        with self.lock(fcntl.LOCK_SH):
+            if not os.path.isdir(os.path.join(entry, 'outputs')):
+                return False
+            for f in os.listdir(os.path.join(entry, 'outputs')):
+                target = os.path.join(directory, f)
+                if os.path.lexists(target):
+                    os.remove(target)
+                link(os.path.join(entry, 'outputs', f), target)
+            os.utime(os.path.join(entry, 'meta.json'))  # last use for the LRU eviction
+        return True
+
+    def store(self, key, directory, ending, before):
+        """Copy the output files that have been created or modified by the external (compared with 'before') into the cache"""
+        entry = os.path.join(self.entries, key)
+        outputs = [f for f, mtime in self.getOutputs(directory, ending).items() if before.get(f) != mtime]
+        if not outputs or os.path.exists(entry):
+            return
+        # copy into a temporary directory first, which is renamed (atomic) while the cache is locked
+        tmp = os.path.join(self.path, 'tmp-%s' % uuid.uuid4().hex)
+        try:
+            os.makedirs(os.path.join(tmp, 'outputs'))
+            for f in outputs:
+                shutil.copyfile(os.path.join(directory, f), os.path.join(tmp, 'outputs', f))
+                os.chmod(os.path.join(tmp, 'outputs', f), 0o444)  # the linked files must not be modified by the runs
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'outputs': outputs, 'size': getSize(tmp), 'created': time.time()}, f, indent=1)
+            with self.lock(fcntl.LOCK_EX):
+                if not os.path.exists(entry):
+                    os.rename(tmp, entry)
+                evict(self.entries, self.max_size)
+        except OSError as e:
+            print(tools.yellow("Could not store the output of the external in the external cache [%s] (%s)" % (self.path, e)))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def link(src, dst):
+    """Hard-link a cached file (it stays valid if the entry is evicted), or symlink it if the cache is on another file system"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        os.symlink(src, dst)
+
+
+@functools.lru_cache(maxsize=None)
+def getCachedFileHash(path, size, mtime_ns):  # noqa: ARG001 size and modification time are part of the key of the lru_cache
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, 2**20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def getFileHash(path):
+    """Hash of the contents of a file (the hashes of unchanged files, e.g. the binary, are only computed once)"""
+    stat = os.stat(path)
+    return getCachedFileHash(path, stat.st_size, stat.st_mtime_ns)
@@ -12,13 +12,19 @@
 # ==================================================================================================================================
 import os
 import sys
+import signal
+import contextlib
+import asyncio
 import glob
 import subprocess
 import logging
-import select
+import selectors
+import codecs
+import threading
 from timeit import default_timer as timer
 
 from reggie import tools
+from reggie import resources
 
 
 def replace_wild_cards_recursive(cmd, workingDir):
@@ -37,7 +43,98 @@ def replace_wild_cards_recursive(cmd, workingDir):
     return cmd
 
 
+def read_head_and_tail(path, head, tail):
+    """
+    Read the first 'head' and the last 'tail' lines of a (possibly very large) file without reading the lines in between.
+
+    Returns the list of lines (each ending with a line break). If the file has less than head+tail lines, all lines are returned.
+    """
+    lines = []
+    with open(path, 'rb') as f:
+        # first lines
+        for line in f:
+            lines.append(line)
+            if len(lines) >= head:
+                break
+        head_end = f.tell()
+
+        # last lines: read blocks from the end of the file until enough line breaks are found (or the end of the first lines is reached)
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > head_end and data.count(b'\n') <= tail:
+            step = min(65536, position - head_end)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+        if position > head_end:
+            data = data[data.index(b'\n') + 1 :]  # skip the incomplete first line of the block
+        lines.extend(data.splitlines(keepends=True)[-tail:])
+
+    return [line.decode('utf-8', 'ignore').rstrip('\n') + '\n' for line in lines]
+
+
+class OutputStream:
+    """
+    Split the data of the std.out or err.out stream of a child into lines, which are stored in 'lines' and displayed by 'logger'.
+
+    When a file is supplied (--redirect-output), the data is written to the file and the lines are only displayed by the logger.
+    """
+
+    def __init__(self, lines, logger, file=None):
+        self.lines = lines
+        self.logger = logger
+        self.file = file
+        self.decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+        self.buf = ""
+
+    def feed(self, data):
+        """Process a chunk of data (an empty chunk marks the end-of-file)"""
+        if self.file:
+            self.file.write(data)
+        tmp = (self.buf + self.decoder.decode(data, final=not data)).split('\n')
+        for line in tmp[:-1]:
+            self.add(line)
+        self.buf = tmp[-1]
+
+    def close(self):
+        """Keep the last line if it does not end with a line break"""
+        if self.buf:
+            self.add(self.buf)
+            self.buf = ""
+
+    def add(self, line):
+        if not self.file:
+            self.lines.append(line + '\n')
+        self.logger(line)
+
+
+async def read_stream(reader, stream):
+    """Read the std.out or err.out of a child started by asyncio in chunks of up to 64 KB until end-of-file"""
+    while True:
+        data = await reader.read(65536)
+        stream.feed(data)
+        if not data:
+            break
+    stream.close()
+
+
 class ExternalCommand:
+    # When commands are executed concurrently (reggie --jobs), the info string and the result are printed in a single line after
+    # the command has finished, because moving the cursor to the previous line would overwrite the output of other commands
+    concurrent = False
+    output_lock = threading.Lock()
+    # When the output is redirected (reggie --redirect-output), the child writes directly into [name].out and [name].err and only the
+    # first head_lines and the last tail_lines lines are kept in memory (for the analyses and the display of failures)
+    redirect = False
+    head_lines = 1000
+    tail_lines = 5000
+    # The running commands are registered, so that they can be killed by cancel_all(), e.g., when stopping on the first error (-p, --stop).
+    # Each command is started in its own session, hence, kill() terminates the whole process group (e.g. mpirun and its ranks)
+    cancelling = False
+    running = set()
+    running_lock = threading.Lock()
+
     def __init__(self):
         self.stdout = []
         self.stderr = []
@@ -46,6 +143,8 @@ class ExternalCommand:
         self.return_code = 0
         self.result = ""
         self.walltime = 0
+        self.peak_rss = None  # peak resident set size of the last command and its descendants (bytes), only known for execute_cmd()
+        self.cancelled = False
 
         # Check ENV variable for args.gitlab_ci, which is either set externally via "export REGGIE_GITLAB_CI=1" or commandline "reggie... --gitlab-ci"
         gitlab_ci_env = os.getenv('REGGIE_GITLAB_CI')
@@ -66,8 +165,80 @@ class ExternalCommand:
         environment (optional, default=None)      : run cmd command with environment variables as given by environment=os.environ (and possibly modified)
         displayOnFailure (optional, default=True) : Display error information if the code has failed to run: the last 15 lines of std.out and the last 15 lines of std.err
         """
+        log = logging.getLogger('logger')
+        (cmd, workingDir) = self.prepare(cmd, target_directory, name, string_info, log)
+        if ExternalCommand.cancelling:
+            return self.set_cancelled()
+        start = timer()
+
+        # With redirected output, the child writes directly into the files, which are only read by reggie when the output is also
+        # displayed by the logger (-d2), otherwise the std and err output is read from pipes
+        if ExternalCommand.redirect:
+            files = {'out': open(self.stdout_filename, 'wb'), 'err': open(self.stderr_filename, 'wb')}
+        if ExternalCommand.redirect and log.getEffectiveLevel() != logging.DEBUG:
+            (pipeOut_r, pipeOut_w) = (None, files['out'].fileno())
+            (pipeErr_r, pipeErr_w) = (None, files['err'].fileno())
+        else:
+            (pipeOut_r, pipeOut_w) = os.pipe()
+            (pipeErr_r, pipeErr_w) = os.pipe()
+
+        # Check if an environment is used and load it into the subprocess if required
+        # fmt: off
+        if environment is None :
+            self.process = subprocess.Popen(cmd, \
+                                            stdout             = pipeOut_w, \
+                                            stderr             = pipeErr_w, \
+                                            universal_newlines = True, \
+                                            start_new_session  = True, \
+                                            cwd                = workingDir)
+        else :
+            self.process = subprocess.Popen(cmd, \
+                                            stdout             = pipeOut_w, \
+                                            stderr             = pipeErr_w, \
+                                            universal_newlines = True, \
+                                            start_new_session  = True, \
+                                            cwd                = workingDir, \
+                                            env                = environment)
+        # fmt: on
+        self.register()
+
+        if pipeOut_r is not None:
+            # the write ends belong to the child now: closing them in reggie is required for reading end-of-file once the child has exited
+            os.close(pipeOut_w)
+            os.close(pipeErr_w)
+
+            if ExternalCommand.redirect:
+                self.read_output(pipeOut_r, pipeErr_r, log, files={pipeOut_r: files['out'], pipeErr_r: files['err']})
+            else:
+                self.read_output(pipeOut_r, pipeErr_r, log)
+
+            os.close(pipeOut_r)
+            os.close(pipeErr_r)
+        # wait4() returns the resource usage of this child (and of its descendants it has waited for, e.g. the compiler processes of make)
+        # instead of the usage of all children of reggie, which includes the other commands
+        _, status, rusage = os.wait4(self.process.pid, 0)
+        self.process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        self.peak_rss = resources.getPeakRSS(rusage)
+        self.unregister()
+
+        self.return_code = self.process.returncode
+        self.walltime = timer() - start
+
+        if ExternalCommand.redirect:
+            for f in files.values():
+                f.close()
+        self.finish(string_info, displayOnFailure, log, ExternalCommand.redirect)
+
+        return self.return_code
+
+    def prepare(self, cmd, target_directory, name, string_info, log):
+        """
+        Display the info string, check the command and set the names of the output files (shared by execute_cmd() and execute_cmd_async()).
+
+        Returns the command with replaced wild cards and the absolute path of the working directory.
+        """
         # Display string_info
-        if string_info is not None:
+        if string_info is not None and not ExternalCommand.concurrent:
             if self.gitlab_ci:
                 print(string_info, end=' ')  # skip line break
             else:
@@ -79,114 +250,215 @@ class ExternalCommand:
             exit(1)
 
         sys.stdout.flush()  # flush output here, because the subprocess will force buffering until it is finished
-        log = logging.getLogger('logger')
 
         workingDir = os.path.abspath(target_directory)
         log.debug(workingDir)
         log.debug(cmd)
-        start = timer()
-        (pipeOut_r, pipeOut_w) = os.pipe()
-        (pipeErr_r, pipeErr_w) = os.pipe()
 
         self.stdout = []
         self.stderr = []
-
-        bufOut = ""
-        bufErr = ""
+        self.stdout_filename = os.path.join(target_directory, name + ".out")
+        self.stderr_filename = os.path.join(target_directory, name + ".err")
 
         # Replace possible wild chards (*) with the globbed entries because the subprocess.Popen takes "*" literally, except when
         # called with shell=True (which however uses the /bin/sh by default)
         cmd = replace_wild_cards_recursive(cmd, workingDir)
 
-        # Check if an environment is used and load it into the subprocess if required
-        # fmt: off
-        if environment is None :
-            self.process = subprocess.Popen(cmd, \
-                                            stdout             = pipeOut_w, \
-                                            stderr             = pipeErr_w, \
-                                            universal_newlines = True, \
-                                            cwd                = workingDir)
-        else :
-            self.process = subprocess.Popen(cmd, \
-                                            stdout             = pipeOut_w, \
-                                            stderr             = pipeErr_w, \
-                                            universal_newlines = True, \
-                                            cwd                = workingDir, \
-                                            env                = environment)
-        # fmt: on
+        return (cmd, workingDir)
+
+    def finish(self, string_info, displayOnFailure, log, redirected):
+        """
+        Write (or read back) the output files, set the result and display it after the command has finished (shared by execute_cmd(),
+        execute_cmd_async() and the batch executors). With redirected=True the child has written its output directly into the files.
+        """
+        if redirected:
+            # read the first and last lines of std.out and err.out
+            self.stdout = read_head_and_tail(self.stdout_filename, ExternalCommand.head_lines, ExternalCommand.tail_lines)
+            self.stderr = read_head_and_tail(self.stderr_filename, ExternalCommand.head_lines, ExternalCommand.tail_lines)
+            if self.return_code != 0:
+                self.result = tools.red("Failed")
+            else:
+                self.result = tools.blue("Successful")
+                os.remove(self.stderr_filename)  # err.out is only kept for failed commands
+        else:
+            # write std.out and err.out to disk
+            with open(self.stdout_filename, 'w') as f:
+                for line in self.stdout:
+                    f.write(line)
+            if self.return_code != 0:
+                self.result = tools.red("Failed")
+                with open(self.stderr_filename, 'w') as f:
+                    for line in self.stderr:
+                        f.write(line)
+            else:
+                self.result = tools.blue("Successful")
+        if self.cancelled:
+            self.result = tools.yellow("Cancelled")
+
+        # Display result (Successful or Failed), the lock keeps the output of concurrently executed commands together
+        with ExternalCommand.output_lock:
+            if string_info is not None and ExternalCommand.concurrent:
+                print(string_info + " " + str(self.result) + " [%.2f sec]" % self.walltime)
+            elif string_info is not None and not self.gitlab_ci:
+                # display result and wall time in previous line and shift the text by ncols columns to the right
+                # Note that f-strings in print statements, e.g. print(f"...."), only work in python 3
+                # print(f"\033[F\033[{ncols}G "+str(self.result)+" [%.2f sec]" % self.walltime)
+                ncols = len(string_info) + 1
+                print("\033[F\033[%sG " % ncols + str(self.result) + " [%.2f sec]" % self.walltime)
+            else:
+                print(self.result + " [%.2f sec]" % self.walltime)
 
-        # .poll() is None means that the child is still running
-        while self.process.poll() is None:
-            # Loop as long as the select mechanism indicates there is data to be read from the buffer
-
-            # 1.   std.out
-            while len(select.select([pipeOut_r], [], [], 0)[0]) == 1:
-                # Read up to a 1 KB chunk of data
-                out_s = os.read(pipeOut_r, 1024)
-                if not isinstance(out_s, str):
-                    out_s = out_s.decode("utf-8", 'ignore')
-                bufOut = bufOut + out_s
-                tmp = bufOut.split('\n')
-                for line in tmp[:-1]:
-                    self.stdout.append(line + '\n')
-                    log.debug(line)
-                bufOut = tmp[-1]
-
-            # 1.   err.out
-            while len(select.select([pipeErr_r], [], [], 0)[0]) == 1:
-                # Read up to a 1 KB chunk of data
-                out_s = os.read(pipeErr_r, 1024)
-                if not isinstance(out_s, str):
-                    out_s = out_s.decode("utf-8", 'ignore')
-                bufErr = bufErr + out_s
-                tmp = bufErr.split('\n')
-                for line in tmp[:-1]:
-                    self.stderr.append(line + '\n')
-                    log.info(line)
-                bufErr = tmp[-1]
-
-        os.close(pipeOut_w)
-        os.close(pipeOut_r)
-        os.close(pipeErr_w)
-        os.close(pipeErr_r)
+            # Display error information if the code has failed to run: the last 15 lines of std.out and the last 15 lines of std.err
+            if log.getEffectiveLevel() != logging.DEBUG and displayOnFailure and self.return_code != 0 and not self.cancelled:
+                for line in self.stdout[-15:]:
+                    print(tools.red("%s" % line.strip()))
+                for line in self.stderr[-15:]:
+                    print(tools.red("%s" % line.strip()))
 
-        self.return_code = self.process.returncode
+    def read_output(self, pipeOut_r, pipeErr_r, log, files=None):
+        """
+        Read std.out and err.out of the running child line by line until both pipes are closed.
 
-        end = timer()
-        self.walltime = end - start
+        When files are supplied for the pipes (--redirect-output), the data is written to the files as soon as it is read and the lines are
+        only displayed by the logger instead of being stored in self.stdout and self.stderr.
 
-        # write std.out and err.out to disk
-        self.stdout_filename = os.path.join(target_directory, name + ".out")
-        with open(self.stdout_filename, 'w') as f:
-            for line in self.stdout:
-                f.write(line)
-        if self.return_code != 0:
-            self.result = tools.red("Failed")
-            self.stderr_filename = os.path.join(target_directory, name + ".err")
-            with open(self.stderr_filename, 'w') as f:
-                for line in self.stderr:
-                    f.write(line)
-        else:
-            self.result = tools.blue("Successful")
-
-        # Display result (Successful or Failed)
-        if string_info is not None and not self.gitlab_ci:
-            # display result and wall time in previous line and shift the text by ncols columns to the right
-            # Note that f-strings in print statements, e.g. print(f"...."), only work in python 3
-            # print(f"\033[F\033[{ncols}G "+str(self.result)+" [%.2f sec]" % self.walltime)
-            ncols = len(string_info) + 1
-            print("\033[F\033[%sG " % ncols + str(self.result) + " [%.2f sec]" % self.walltime)
+        Instead of polling, the loop blocks until data is available or the child exits (via a pidfd on Linux, otherwise the exit is
+        checked every second), hence, reggie does not occupy a core while waiting. After the child has exited, the data left in the pipes
+        is read. Pipes that are kept open by processes that were started by the child (e.g. daemons) are not waited for.
+        """
+        files = files or {}
+        streams = {pipeOut_r: OutputStream(self.stdout, log.debug, files.get(pipeOut_r)), pipeErr_r: OutputStream(self.stderr, log.info, files.get(pipeErr_r))}
+
+        selector = selectors.DefaultSelector()
+        for pipe in streams:
+            selector.register(pipe, selectors.EVENT_READ)
+
+        # Get notified when the child exits (Linux >= 5.3)
+        try:
+            pidfd = os.pidfd_open(self.process.pid)
+            selector.register(pidfd, selectors.EVENT_READ)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        open_pipes = set(streams)
+        exited = False
+        while open_pipes:
+            if exited:
+                # only read the data that is left in the pipes
+                events = selector.select(timeout=0)
+                if not events:
+                    break
+            else:
+                # sleep until data is available or the child exits
+                events = selector.select(timeout=None if pidfd is not None else 1.0)
+                if pidfd is None:
+                    exited = self.process.poll() is not None
+
+            for key, _ in events:
+                if key.fd == pidfd:
+                    selector.unregister(pidfd)
+                    exited = True
+                    continue
+                # Read up to a 64 KB chunk of data
+                data = os.read(key.fd, 65536)
+                if not data:  # end-of-file: the pipe has been closed
+                    selector.unregister(key.fd)
+                    open_pipes.discard(key.fd)
+                streams[key.fd].feed(data)
+
+        # keep the last line if it does not end with a line break
+        for stream in streams.values():
+            stream.close()
+
+        selector.close()
+        if pidfd is not None:
+            os.close(pidfd)
+
+    async def execute_cmd_async(self, cmd, target_directory, name="std", string_info=None, environment=None, displayOnFailure=True):
+        """
+        Coroutine variant of execute_cmd() with the same arguments, output files and result (return_code, walltime, stdout, stderr).
+
+        The child is started and waited for by the running asyncio event loop, hence, many commands can be executed concurrently by a
+        single thread, e.g., via asyncio.gather().
+        """
+        log = logging.getLogger('logger')
+        (cmd, workingDir) = self.prepare(cmd, target_directory, name, string_info, log)
+        if ExternalCommand.cancelling:
+            return self.set_cancelled()
+        start = timer()
+
+        # see execute_cmd(): with redirected output the child writes directly into the files (read from pipes only with -d2)
+        files = {}
+        if ExternalCommand.redirect:
+            files = {'out': open(self.stdout_filename, 'wb'), 'err': open(self.stderr_filename, 'wb')}
+        if ExternalCommand.redirect and log.getEffectiveLevel() != logging.DEBUG:
+            (stdout, stderr) = (files['out'], files['err'])
         else:
-            print(self.result + " [%.2f sec]" % self.walltime)
+            (stdout, stderr) = (asyncio.subprocess.PIPE, asyncio.subprocess.PIPE)
 
-        # Display error information if the code has failed to run: the last 15 lines of std.out and the last 15 lines of std.err
-        if log.getEffectiveLevel() != logging.DEBUG and displayOnFailure and self.return_code != 0:
-            for line in self.stdout[-15:]:
-                print(tools.red("%s" % line.strip()))
-            for line in self.stderr[-15:]:
-                print(tools.red("%s" % line.strip()))
+        self.process = await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr, cwd=workingDir, env=environment, start_new_session=True)
+        self.register()
+
+        if stdout == asyncio.subprocess.PIPE:
+            await asyncio.gather(
+                read_stream(self.process.stdout, OutputStream(self.stdout, log.debug, files.get('out'))),
+                read_stream(self.process.stderr, OutputStream(self.stderr, log.info, files.get('err'))),
+            )
+        await self.process.wait()
+        self.unregister()
+
+        self.return_code = self.process.returncode
+        self.walltime = timer() - start
+
+        for f in files.values():
+            f.close()
+        self.finish(string_info, displayOnFailure, log, ExternalCommand.redirect)
 
         return self.return_code
 
     def kill(self):
-        self.process.kill()
+        """Kill the process group of the command (the command and all processes started by it)"""
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(self.process.pid, signal.SIGKILL)
+
+    def register(self):
+        with ExternalCommand.running_lock:
+            if ExternalCommand.cancelling:
+                self.cancelled = True
+                self.kill()
+            else:
+                ExternalCommand.running.add(self)
+
+    def unregister(self):
+        with ExternalCommand.running_lock:
+            ExternalCommand.running.discard(self)
+
+    def set_cancelled(self):
+        """Mark a command as cancelled, which has not been started because the execution is cancelled"""
+        self.cancelled = True
+        self.return_code = -1
+        self.result = tools.yellow("Cancelled")
+        return self.return_code
+
+    @staticmethod
+    def cancel_all():
+        """Kill all running commands and do not start any further commands (their result is 'Cancelled')"""
+        with ExternalCommand.running_lock:
+            ExternalCommand.cancelling = True
+            for command in ExternalCommand.running:
+                command.cancelled = True
+                command.kill()
+
+
+async def run_async(cmd, cwd, env=None, name="std", string_info=None, displayOnFailure=True):
+    """
+    Execute the external program 'cmd' in the directory 'cwd' without blocking the asyncio event loop, e.g.,
+
+        command  = await run_async(cmd, cwd)
+        commands = await asyncio.gather(run_async(cmd1, cwd1), run_async(cmd2, cwd2))
+
+    Returns the ExternalCommand with return_code, walltime, stdout_filename and stderr_filename (and the lines in stdout and stderr).
+    """
+    command = ExternalCommand()
+    await command.execute_cmd_async(cmd, cwd, name=name, string_info=string_info, environment=env, displayOnFailure=displayOnFailure)
+    return command
@@ -0,0 +1,85 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import tempfile
+import threading
+
+from reggie import tools
+
+
+class WalltimeHistory:
+    """
+    Wall times of runs (including their externals) and builds of previous reggie executions, which are stored in a JSON file.
+
+    The entries are used to predict the duration of the runs and to pack them into the core budget (longest first). The file is
+    re-read before writing, hence, the entries of other reggie executions that use the same file are kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.read() if self.path else {}
+        self.updates = {}
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError("expected a dictionary")
+            return entries
+        except (OSError, ValueError) as e:
+            print(tools.yellow("Could not read the wall time history file [%s] (%s), starting with an empty history" % (self.path, e)))
+            return {}
+
+    def get(self, key):
+        """Return the entry of a previous execution (or None)"""
+        return self.entries.get(key)
+
+    def set(self, key, entry):
+        """Store the entry of the current execution (written to the file by write())"""
+        with self.lock:
+            self.updates[key] = entry
+
+    def write(self):
+        """Merge the entries of the current execution into the history file (written atomically via a temporary file)"""
+        if not self.path or not self.updates:
+            return
+        with self.lock:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                tools.create_folder(directory)
+                entries = self.read()
+                entries.update(self.updates)
+                with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.walltimes', delete=False) as f:
+                    json.dump(entries, f, indent=1, sort_keys=True)
+                os.replace(f.name, self.path)
+            except OSError as e:
+                print(tools.yellow("Could not write the wall time history file [%s] (%s)" % (self.path, e)))
+
+
+def getBuildKey(build):
+    """Key of a build: name of the binary and the CMake configuration"""
+    configuration = " ".join("%s=%s" % item for item in sorted(build.configuration.items()))
+    return "build:%s:%s" % (os.path.basename(build.binary_path), configuration)
+
+
+def getRunKey(build, example, command_line, run):
+    """Key of a run: build, example (check/example), command line options and the parameter combination"""
+    name = os.path.join(os.path.basename(os.path.dirname(example.source_directory)), os.path.basename(example.source_directory))
+    command_line_options = " ".join("%s=%s" % item for item in sorted(command_line.parameters.items()))
+    parameters = " ".join("%s=%s" % item for item in sorted(run.parameters.items()))
+    return "run:%s:%s:%s:%s" % (getBuildKey(build)[len("build:") :], name, command_line_options, parameters)
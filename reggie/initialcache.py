@@ -0,0 +1,110 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import re
+import json
+import hashlib
+import functools
+import subprocess
+import threading
+
+from reggie import tools
+from reggie import buildcache
+
+# cache entries that are reused: the results of find_program/find_library/find_path (FILEPATH, PATH) and of the compiler and library
+# checks (INTERNAL entries such as HAVE_*, MPI_RESULT_*), which do not depend on the options of a build combination
+SEED_TYPES = ('FILEPATH', 'PATH')
+SEED_INTERNAL = re.compile(r'^HAVE_|_RESULT_|_WORKS$|^COMPILER_SUPPORTS_')
+
+# environment variables that change the results of the compiler checks and library lookups
+TOOLCHAIN_VARIABLES = ('PATH', 'LD_LIBRARY_PATH', 'CPATH', 'LIBRARY_PATH', 'CMAKE_PREFIX_PATH', 'PKG_CONFIG_PATH', 'MPI_HOME', 'HDF5_DIR', 'HDF5_ROOT', 'PETSC_DIR', 'PETSC_ARCH', 'CMAKE_GENERATOR')
+
+# line of a CMakeCache.txt: KEY:TYPE=VALUE (the key is quoted if it contains a colon)
+CACHE_ENTRY = re.compile(r'^("?)(?P<key>[^"]+?)\1:(?P<type>[A-Z]+)=(?P<value>.*)$')
+
+
+class InitialCache:
+    """
+    Initial cache (cmake -C) that is shared by the build combinations and by subsequent executions (--initial-cache): the first build
+    that is configured with a toolchain writes the results of its compiler checks and library lookups (see SEED_TYPES and
+    SEED_INTERNAL) from its CMakeCache.txt into [directory]/[toolchain key].cmake, with which the following builds are configured.
+    A build with a different toolchain (compilers, cmake version or environment variables, see getToolchainKey()) writes its own
+    initial cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        tools.create_folder(self.directory)
+
+    def getFile(self, build):
+        """Path to the initial cache for the toolchain of the build (or None if no build with this toolchain has been configured yet)"""
+        path = os.path.join(self.directory, getToolchainKey(build) + '.cmake')
+        return os.path.abspath(path) if os.path.exists(path) else None
+
+    def store(self, build, directory, options):
+        """
+        Write the initial cache from the CMakeCache.txt of a build that was configured without an initial cache. The options of the
+        build (set via -D) are not written, they are given by the build combinations.
+        """
+        path = os.path.join(self.directory, getToolchainKey(build) + '.cmake')
+        options = set(options)
+        build_directory = os.path.abspath(directory)
+        lines = []
+        for key, entry_type, value in readCMakeCache(os.path.join(directory, 'CMakeCache.txt')):
+            if key in options or value.endswith('-NOTFOUND') or build_directory in value:
+                continue
+            if entry_type in SEED_TYPES or (entry_type == 'INTERNAL' and SEED_INTERNAL.search(key)):
+                lines.append('set(%s "%s" CACHE %s "initial cache of reggie")\n' % (key, escape(value), entry_type))
+        with self.lock:
+            if os.path.exists(path):
+                return
+            tmp = "%s.%s.tmp" % (path, os.getpid())  # the directory can be shared by concurrent reggie executions
+            with open(tmp, 'w') as f:
+                f.write("# initial cache written by reggie from [%s]\n" % build_directory)
+                f.writelines(lines)
+            os.replace(tmp, path)
+
+
+def readCMakeCache(path):
+    entries = []
+    try:
+        with open(path) as f:
+            for line in f:
+                match = CACHE_ENTRY.match(line.rstrip('\n'))
+                if match and not line.startswith(('#', '//')):
+                    entries.append((match.group('key'), match.group('type'), match.group('value')))
+    except OSError:
+        pass
+    return entries
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+
+
+@functools.lru_cache(maxsize=None)
+def getCMakeVersion():
+    try:
+        return subprocess.run(['cmake', '--version'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def getToolchainKey(build):
+    """
+    Hash of the compilers (path, size and modification time), the cmake version and the environment variables of the toolchain. The
+    source directory is included, because the lookups depend on the project.
+    """
+    toolchain = {'basedir': os.path.abspath(build.basedir), 'compilers': buildcache.getCompilers(build), 'cmake': getCMakeVersion(), 'environment': {variable: os.getenv(variable) for variable in TOOLCHAIN_VARIABLES}}
+    return hashlib.sha256(json.dumps(toolchain, sort_keys=True).encode()).hexdigest()[:32]
@@ -16,6 +16,7 @@ from reggie import tools
 from reggie import check
 from reggie import args_parser
 from reggie import summary
+from reggie import worker
 import sys
 
 """
@@ -53,6 +54,11 @@ def main():
     tools.setup_logger(args.debug)
     log = logging.getLogger('logger')
 
+    # worker mode (--worker): execute the jobs of a coordinator (reggie --coordinator) on this node until the coordinator has finished
+    if args.worker:
+        worker.Worker(args.worker, args.jobs, args.CoreBudget, args.batch_poll_interval).main()
+        return
+
     # 3.  perform the regression check by a) building executables
     #                                     b) running the code
     #                                     c) performing the defined analyzes
@@ -0,0 +1,110 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import sys
+import math
+
+# memory of a single compile job when no peak memory of a previous build is known (Fortran compilers easily need 1 GB per file)
+DEFAULT_COMPILE_RSS = 1024**3
+
+# share of the available memory that is kept free while compiling
+MEMORY_RESERVE = 0.1
+
+
+def readFile(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def getCgroupCpuQuota():
+    """CPU quota of the cgroup (e.g. of a container or CI runner) in number of CPUs, or None if the CPU time is not limited"""
+    # cgroup v2: "[quota] [period]" or "max [period]"
+    try:
+        quota, period = readFile('/sys/fs/cgroup/cpu.max').split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    # cgroup v1: the quota is -1 if not limited
+    try:
+        quota = int(readFile('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'))
+        period = int(readFile('/sys/fs/cgroup/cpu/cpu.cfs_period_us'))
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def getCpuLimit():
+    """Number of CPUs that can be used: the CPU affinity of reggie, limited by the CPU quota of the cgroup"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = getCgroupCpuQuota()
+    if quota:
+        cpus = min(cpus, max(1, int(math.ceil(quota))))
+    return cpus
+
+
+def getAvailableMemory():
+    """Memory in bytes that is available for new processes (MemAvailable, limited by the unused memory of the cgroup), or None if unknown"""
+    available = None
+    try:
+        for line in readFile('/proc/meminfo').splitlines():
+            if line.startswith('MemAvailable:'):
+                available = int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    # cgroup v2 and v1: memory.max is "max" and memory.limit_in_bytes is a huge number if the memory is not limited
+    for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'), ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+        try:
+            limit = int(readFile(limit_file))
+            usage = int(readFile(usage_file))
+        except (OSError, ValueError):
+            continue
+        if limit < 2**60:
+            free = max(0, limit - usage)
+            available = free if available is None else min(available, free)
+        break
+    return available
+
+
+def getPeakRSS(rusage):
+    """
+    Peak resident set size in bytes from the resource usage of a child process (os.wait4), which includes the descendants of the
+    child that it has waited for, e.g., the compiler processes started by make or ninja
+    """
+    return rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+
+
+def getBuildJobs(cores=0, peak_rss=None):
+    """
+    Number of parallel compile jobs for make/ninja (-j): the number of CPUs (cgroup quota or the cores that are reserved for compiling),
+    limited by the available memory divided by the peak memory of a compile job of a previous build (or DEFAULT_COMPILE_RSS).
+
+    The load limit (-l) lets make/ninja start fewer jobs while other processes (e.g. the runs of the previous build) are using the CPUs.
+    It is only used without a cgroup CPU quota, because the load average is not limited to the cgroup (it is the load of the host).
+
+    Returns the number of jobs, the load limit (or None) and a description of the limits.
+    """
+    cpus = getCpuLimit()
+    if cores > 0:
+        cpus = min(cpus, cores)
+    rss = peak_rss or DEFAULT_COMPILE_RSS
+    memory = getAvailableMemory()
+    jobs = cpus
+    info = "%s CPUs" % cpus
+    if memory is not None:
+        jobs = min(jobs, max(1, int(memory * (1.0 - MEMORY_RESERVE) / rss)))
+        info += ", %.1f GB available memory / %.1f GB per compile job" % (memory / 1e9, rss / 1e9)
+    load = None if getCgroupCpuQuota() else getCpuLimit()
+    return jobs, load, info
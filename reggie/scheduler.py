@@ -0,0 +1,267 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from reggie import tools
+
+
+class CoreBudget:
+    """
+    Counting semaphore over the CPU cores of the machine.
+
+    Every job reserves as many cores as it starts processes (e.g. the number of MPI ranks) and blocks until enough cores are free,
+    so that concurrently running jobs never oversubscribe the machine. A job that requests more cores than the total budget is
+    clamped to the total budget, i.e., it runs alone.
+    """
+
+    def __init__(self, total):
+        self.total = max(1, int(total))
+        self.free = self.total
+        self.condition = threading.Condition()
+
+    def clamp(self, cores):
+        return min(max(1, int(cores)), self.total)
+
+    def acquire(self, cores):
+        cores = self.clamp(cores)
+        with self.condition:
+            while self.free < cores:
+                self.condition.wait()
+            self.free -= cores
+        return cores
+
+    def try_acquire(self, cores):
+        """Reserve the cores if they are free without blocking, returns the reserved (clamped) number of cores or None"""
+        cores = self.clamp(cores)
+        with self.condition:
+            if self.free < cores:
+                return None
+            self.free -= cores
+        return cores
+
+    def release(self, cores):
+        with self.condition:
+            self.free += cores
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, cores):
+        cores = self.acquire(cores)
+        try:
+            yield cores
+        finally:
+            self.release(cores)
+
+
+def getJobs(jobs, cores):
+    """
+    Convert the value of the command line argument --jobs into the maximum number of concurrently executed jobs.
+
+    jobs  : string supplied via --jobs, either 'auto' (as many jobs as cores in the budget) or a positive integer
+    cores : total number of cores in the core budget
+    """
+    if str(jobs).lower() == 'auto':
+        return max(1, cores)
+    try:
+        number_of_jobs = int(jobs)
+    except ValueError:
+        number_of_jobs = 0
+    if number_of_jobs < 1:
+        print(tools.red("Invalid value for --jobs: '%s'. Use 'auto' or a positive integer." % jobs))
+        exit(1)
+    return number_of_jobs
+
+
+class Task:
+    """
+    Node of a TaskGraph: function() is called as soon as all dependencies are complete, a free slot is available and no other task
+    with the same exclusive key is running.
+
+    A task is complete when its function has returned and all tasks that were added while the function was running (its children)
+    are complete, i.e., depending on a task means depending on the whole sub-graph that it created.
+    """
+
+    def __init__(self, number, name, function, dependencies, slot, exclusive, parent, cores, duration):
+        # fmt: off
+        self.number           = number        # creation order, ready tasks are started first-in first-out
+        self.name             = name
+        self.function         = function
+        self.dependencies     = dependencies
+        self.slot             = slot
+        self.exclusive        = exclusive
+        self.parent           = parent
+        self.cores            = cores         # number of cores the task is expected to occupy (0: not considered for packing)
+        self.duration         = duration      # predicted duration in seconds (None: unknown)
+        self.pending_children = 0
+        self.returned         = False
+        self.complete         = False
+        # fmt: on
+
+    def __str__(self):
+        return "Task %s: %s" % (self.number, self.name)
+
+
+class TaskGraph:
+    """
+    Dependency graph of tasks, which are executed by a pool of threads as soon as their dependencies are complete.
+
+    slots : dictionary with the maximum number of concurrently running tasks per slot name, e.g., {'job': 4, 'compile': 1}
+    cores : total number of cores into which the tasks are packed (only used for order='longest')
+    order : 'fifo'    : ready tasks are started in the order in which they have been added, hence, with a single slot the execution
+                        order is the same as for the corresponding nested loops
+            'longest' : ready tasks with unknown duration are started first (in the order in which they have been added), followed by
+                        the ones with the longest predicted duration. A task is only started if its cores fit into the cores that are
+                        not occupied by running tasks, otherwise shorter tasks that fit are started instead (backfilling)
+
+    Tasks can be added before and while the graph is running (also from within running tasks).
+    When a task raises an exception (including SystemExit raised by exit()) or reggie is interrupted (Ctrl+C), the waiting tasks are
+    dropped (see 'dropped'), on_error() is called, e.g., for killing the commands of the running tasks, and the exception is re-raised
+    by run() after all running tasks have returned.
+    """
+
+    def __init__(self, slots, cores=1, order='fifo', on_error=None):
+        self.slots = dict(slots)
+        self.cores = max(1, cores)
+        self.free_cores = self.cores
+        self.order = order
+        self.running = {slot: 0 for slot in self.slots}
+        self.exclusive = set()
+        self.waiting = []
+        self.number_of_tasks = 0
+        self.number_of_running_tasks = 0
+        self.error = None
+        self.on_error = on_error
+        self.dropped = []
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    def add(self, name, function, dependencies=(), slot='job', exclusive=None, cores=0, duration=None):
+        """Add a task and return it (tasks added from within a running task become its children)"""
+        with self.condition:
+            parent = getattr(self.local, 'task', None)
+            self.number_of_tasks += 1
+            cores = min(cores, self.cores) if self.order == 'longest' else 0
+            task = Task(self.number_of_tasks, name, function, [d for d in dependencies if d is not None], slot, exclusive, parent, cores, duration)
+            if parent:
+                parent.pending_children += 1
+            if self.error is None:
+                self.waiting.append(task)
+            else:
+                self.dropped.append(task)
+            self.condition.notify_all()
+        return task
+
+    def is_ready(self, task):
+        if self.running[task.slot] >= self.slots[task.slot]:
+            return False
+        if task.exclusive is not None and task.exclusive in self.exclusive:
+            return False
+        if task.cores > self.free_cores:
+            return False
+        return all(dependency.complete for dependency in task.dependencies)
+
+    def set_complete(self, task):
+        while task:
+            task.complete = True
+            task = task.parent
+            if task:
+                task.pending_children -= 1
+                if not task.returned or task.pending_children > 0:
+                    break
+
+    def execute(self, task):
+        self.local.task = task
+        try:
+            task.function()
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            self.local.task = None
+            with self.condition:
+                task.returned = True
+                self.running[task.slot] -= 1
+                self.number_of_running_tasks -= 1
+                self.free_cores += task.cores
+                self.exclusive.discard(task.exclusive)
+                if task.pending_children == 0:
+                    self.set_complete(task)
+                self.condition.notify_all()
+
+    def fail(self, error):
+        """Record the first error, drop the waiting tasks and call on_error()"""
+        with self.condition:
+            if self.error is not None:
+                return
+            self.error = error
+            self.dropped.extend(self.waiting)
+            self.waiting = []
+            self.condition.notify_all()
+        if self.on_error:
+            self.on_error()
+
+    def run(self):
+        """Execute all tasks (including the ones added during the execution) and wait until all of them are complete"""
+        with ThreadPoolExecutor(max_workers=max(1, sum(self.slots.values()))) as pool:
+            with self.condition:
+                while self.number_of_running_tasks > 0 or (self.waiting and self.error is None):
+                    if self.error is None:
+                        if self.order == 'longest':
+                            self.waiting.sort(key=lambda task: (task.duration is not None, -(task.duration or 0.0), task.number))
+                        for task in [task for task in self.waiting if self.is_ready(task)]:
+                            # readiness changes with every started task (slots and exclusive keys)
+                            if not self.is_ready(task):
+                                continue
+                            self.waiting.remove(task)
+                            self.running[task.slot] += 1
+                            self.number_of_running_tasks += 1
+                            self.free_cores -= task.cores
+                            if task.exclusive is not None:
+                                self.exclusive.add(task.exclusive)
+                            pool.submit(self.execute, task)
+                        if self.waiting and self.number_of_running_tasks == 0 and self.error is None:
+                            raise Exception(tools.red("TaskGraph: no task can be started, check the dependencies of %s" % self.waiting[0]))
+                    try:
+                        self.condition.wait()
+                    except KeyboardInterrupt as e:
+                        self.fail(e)
+        if self.error is not None:
+            raise self.error
+
+
+def predict_makespan(jobs, cores, slots):
+    """
+    Predict the makespan of packing jobs into the cores by simulating the 'longest' order of the TaskGraph (without dependencies).
+
+    jobs  : list of (duration, cores) for each job
+    cores : total number of cores
+    slots : maximum number of concurrently running jobs (--jobs)
+    """
+    waiting = sorted(jobs, key=lambda job: -job[0])
+    running = []  # list of (end time, cores) of the running jobs
+    time = 0.0
+    free = max(1, cores)
+    while waiting or running:
+        # start all jobs that fit into the free cores (longest first, shorter ones are used for backfilling)
+        for job in list(waiting):
+            job_cores = min(max(1, job[1]), max(1, cores))
+            if len(running) < slots and job_cores <= free:
+                waiting.remove(job)
+                running.append((time + job[0], job_cores))
+                free -= job_cores
+        # advance the time to the end of the next job
+        running.sort()
+        time, job_cores = running.pop(0)
+        free += job_cores
+    return time
@@ -0,0 +1,72 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import fnmatch
+import shutil
+
+from reggie import combinations
+
+# files that are always copied back from the scratch directory: the output of the run and of the externals
+COPY_BACK = ('*.out', '*.err')
+
+# options in analyze.ini whose values are the files (or globs) in the run directory that are read by the analyses
+ANALYZE_FILE_KEYS = (
+    'analyze_l2_file',
+    'h5diff_file',
+    'h5diff_reference_file',
+    'vtudiff_file',
+    'vtudiff_reference_file',
+    'check_hdf5_file',
+    'compare_data_file_name',
+    'compare_data_file_reference',
+    'integrate_line_file',
+    'compare_column_file',
+    'compare_column_reference_file',
+    'compare_across_commands_file',
+)
+
+
+def getCopyBackPatterns(path):
+    """Globs of the files that are copied back from the scratch directory: the files referenced in analyze.ini and COPY_BACK"""
+    patterns = list(COPY_BACK)
+    if not os.path.exists(path):
+        return patterns
+    options, _, _ = combinations.readKeyValueFile(path)
+    for option in options:
+        if option.name.lower() in ANALYZE_FILE_KEYS:
+            patterns.extend(value for value in option.values if value)
+    return patterns
+
+
+def copyBack(scratch_directory, target_directory, patterns=None):
+    """
+    Copy the files from the scratch directory into the run directory in output_dir, whose paths relative to the scratch directory (or
+    file names) match one of the patterns (all files if patterns is None). Returns the number of copied bytes.
+    """
+    size = 0
+    for root, _, files in os.walk(scratch_directory):
+        for name in files:
+            src = os.path.join(root, name)
+            relpath = os.path.relpath(src, scratch_directory)
+            if patterns is not None and not any(fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            if os.path.islink(src) and not os.path.exists(src):
+                continue
+            dst = os.path.join(target_directory, relpath)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.islink(src):  # linked inputs (e.g. staging.ini, database) are linked again instead of copying the data
+                os.symlink(os.path.realpath(src), dst)
+            else:
+                shutil.copyfile(src, dst)
+                size += os.path.getsize(dst)
+    return size
@@ -0,0 +1,184 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import errno
+import fcntl
+import fnmatch
+import shutil
+import threading
+from timeit import default_timer as timer
+
+from reggie import tools
+from reggie import combinations
+
+# staging strategies (--staging), each one falls back to the next one if it is not supported by the file system
+STRATEGIES = ('reflink', 'hardlink', 'copy')
+
+# ioctl that clones the extents of a file (copy-on-write) on btrfs, xfs, bcachefs, ... (linux/fs.h)
+FICLONE = 0x40049409
+
+# the parameter files (*.ini) are rewritten by reggie and are never linked (also not via staging.ini)
+LINK_EXCLUDED = ('.ini',)
+
+# optional file in an example directory with the globs of the read-only inputs that are symlinked or hard-linked (--staging hardlink)
+# into the run directories and of the files that are modified by the runs and must be copied (not linked), e.g.
+#   symlink  = tables
+#   hardlink = *_mesh.h5
+#   copy     = restart_State_*.h5
+STAGING_FILE = 'staging.ini'
+KEYS = ('symlink', 'hardlink', 'copy')
+
+# errors that mean that a method is not supported by the file system (or between the two file systems)
+UNSUPPORTED = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.EMLINK)
+
+
+class Staging:
+    """
+    Copy the files of an example into the run directories (--staging):
+
+    reflink  : clone the files (copy-on-write, the data is shared until one of the copies is modified), otherwise copy them
+    hardlink : hard-link the files that are declared read-only via 'hardlink' in the staging.ini of the example, and clone or copy
+               the other files. A hard-linked file is shared with the example directory, hence, a run that modifies it in place
+               modifies the example for all following runs and builds
+    copy     : copy all files
+
+    The permission bits and modification times of cloned and copied files are preserved (as by shutil.copy2). The methods that fail
+    with an error listed in UNSUPPORTED are not tried again for the same source and target file system (device). The globs in the
+    staging.ini of an example (see STAGING_FILE) take precedence: matching files are symlinked ('symlink'), hard-linked ('hardlink')
+    or always cloned or copied ('copy'), where 'copy' wins over 'symlink', which wins over 'hardlink'. The number of bytes and the time
+    that has been spent are collected for the summary.
+    """
+
+    def __init__(self, strategy='reflink'):
+        self.strategy = strategy
+        self.unsupported = {}  # (source device, target device) -> set of methods that are not supported
+        self.rules = {}  # example directory -> globs of staging.ini
+        self.bytes = {method: 0 for method in ('symlink',) + STRATEGIES}
+        self.files = 0
+        self.time = 0.0
+        self.lock = threading.Lock()
+
+    def getRules(self, source_directory):
+        """Globs of the 'symlink' and 'copy' keys in the staging.ini of an example (read once per example)"""
+        with self.lock:
+            if source_directory not in self.rules:
+                self.rules[source_directory] = readStagingFile(os.path.join(source_directory, STAGING_FILE))
+            return self.rules[source_directory]
+
+    def getMethods(self, src, dst, action=None):
+        """Methods that are tried one after the other for a file (action: 'symlink', 'hardlink' or 'copy' from staging.ini)"""
+        if action == 'symlink':
+            methods = ['symlink']
+        elif self.strategy == 'copy':
+            methods = ['copy']
+        else:
+            methods = ['reflink', 'copy']
+            if self.strategy == 'hardlink' and action == 'hardlink':
+                methods.insert(0, 'hardlink')
+        devices = (os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev)
+        with self.lock:
+            unsupported = self.unsupported.setdefault(devices, set())
+            return devices, [method for method in methods if method not in unsupported]
+
+    def copyFile(self, src, dst, action=None):
+        """Stage a single file (symbolic links are followed), the signature is the one of shutil.copyfile for shutil.copytree()"""
+        start = timer()
+        devices, methods = self.getMethods(src, dst, action)
+        for method in methods:
+            try:
+                if method == 'symlink':
+                    os.symlink(os.path.realpath(src), dst)
+                elif method == 'reflink':
+                    reflink(src, dst)
+                    shutil.copystat(src, dst)
+                elif method == 'hardlink':
+                    os.link(src, dst)
+                else:
+                    shutil.copyfile(src, dst)
+                    shutil.copystat(src, dst)
+                break
+            except OSError as e:
+                if method in ('symlink', 'copy') or e.errno not in UNSUPPORTED:
+                    raise
+                with self.lock:
+                    self.unsupported[devices].add(method)
+        with self.lock:
+            self.bytes[method] += os.path.getsize(src) if os.path.isfile(src) else 0  # symlinked directories are not counted
+            self.files += 1
+            self.time += timer() - start
+        return dst
+
+    def stage(self, src, dst, source_directory):
+        """
+        Stage a file or directory of the example in source_directory, whose globs in staging.ini are matched against the relative path
+        (a glob that matches a directory applies to all files in the directory)
+        """
+        rules = self.getRules(source_directory)
+
+        def matches(relpath, key):
+            return any(fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(relpath, pattern.rstrip('/') + '/*') for pattern in rules.get(key, []))
+
+        def getAction(path):
+            relpath = os.path.relpath(path, source_directory)
+            if matches(relpath, 'copy'):
+                return 'copy'
+            if path.endswith(LINK_EXCLUDED):
+                return None
+            if matches(relpath, 'symlink'):
+                return 'symlink'
+            if matches(relpath, 'hardlink'):
+                return 'hardlink'
+            return None
+
+        if os.path.isdir(src):
+            # the whole directory is linked, unless it contains files that must be copied
+            if getAction(src) == 'symlink' and not any(getAction(os.path.join(root, f)) == 'copy' for root, _, files in os.walk(src) for f in files):
+                self.copyFile(src, dst, 'symlink')
+            else:
+                shutil.copytree(src, dst, copy_function=lambda s, d: self.copyFile(s, d, getAction(s)))
+        else:
+            self.copyFile(src, dst, getAction(src))
+
+    def __str__(self):
+        total = sum(self.bytes.values())
+        s = "%.2f GB in %s files [%.2f sec] (%s)" % (total / 1e9, self.files, self.time, self.strategy)
+        methods = ["%s: %.2f GB" % (method, size / 1e9) for method, size in self.bytes.items() if size > 0]
+        if methods:
+            s += ", " + ", ".join(methods)
+        return s
+
+
+def reflink(src, dst):
+    """Clone the data of a file via the FICLONE ioctl (without the metadata), the target file is removed if the file system does not support it"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def readStagingFile(path):
+    """Read the globs of the keys 'symlink', 'hardlink' and 'copy' from a staging.ini (empty if the file does not exist)"""
+    rules = {}
+    if not os.path.exists(path):
+        return rules
+    options, _, _ = combinations.readKeyValueFile(path)
+    for option in options:
+        key = option.name.lower()
+        if key not in KEYS:
+            print(tools.red("%s: unknown key [%s], only %s are allowed" % (path, option.name, ", ".join("'%s'" % k for k in KEYS))))
+            exit(1)
+        rules.setdefault(key, []).extend(value for value in option.values if value)
+    return rules
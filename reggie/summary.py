@@ -17,6 +17,7 @@ import collections
 
 from reggie import check
 from reggie import tools
+from reggie import scheduler
 from reggie.outputdirectory import OutputDirectory
 
 
@@ -46,6 +47,10 @@ def SummaryOfErrors(builds, args):
     3.2.3  print a line with following information:
              run.globalnumber, run.parameters[0] (the one not printed in 3.2.2), run.target_directory, MPI, run.walltime, run.result
     3.2.4  print the analyze results line by line
+    4. print the predicted and the actual makespan of the runs
+    5. list the builds that were dropped in the smoke tier
+    6. print the bytes and the time of staging the run directories
+    7. print the time of deleting the build and run directories in the background
     """
     # fmt: off
     param_str_old    = ""
@@ -139,14 +144,20 @@ def SummaryOfErrors(builds, args):
     print("")
 
     # 3. loop over alls builds
-    for build in builds:
+    for build_number, build in enumerate(builds, start=1):
         # 3.1 print cmake flags if no external binary was used for execution
         print('-' * 132)
         if isinstance(build, check.Standalone):
             print("Binary supplied externally under ", build.binary_path)
         elif isinstance(build, check.Build):
-            print("Build %d of %d (%s) compiled with in [%.2f sec]:" % (build.number, len(builds), build.result, build.walltime))
+            compiler_cache = " (%s)" % build.compiler_cache if build.compiler_cache else ""
+            print("Build %d of %d (%s) compiled with in [%.2f sec]%s:" % (build_number, len(builds), build.result, build.walltime, compiler_cache))
             print(" ".join(build.cmake_cmd_color))
+            if build.profile:
+                print(tools.indent(str(build.profile), 1))
+            if getattr(build, 'identical_build', None):
+                s = "same binary as build %d: the runs of %s examples have been executed once and are displayed for both builds"
+                print(tools.indent(tools.blue(s % (builds.index(build.identical_build) + 1, len(build.shared_examples))), 1))
             if build.return_code != 0:  # stop output as soon as a failed build in encountered
                 break
 
@@ -204,6 +215,89 @@ def SummaryOfErrors(builds, args):
                     if len(run.analyze_results) > 0 or len(run.externals_errors):
                         print("")
 
+    # 4. print the predicted and the actual makespan of the runs
+    SummaryOfMakespan(builds, args)
+
+    # 5. list the builds that were not compiled in the smoke tier
+    SummaryOfDroppedBuilds(args)
+
+    # 6. print the bytes and the time of copying the examples into the run directories
+    SummaryOfStaging()
+
+    # 7. print the time of deleting the folders in the background
+    SummaryOfDeletion()
+
+
+def SummaryOfDeletion():
+    """Display the time that has been spent deleting folders in the background (see tools.remove_folder) and waiting for the deletion"""
+    tools.background_deletion.wait()
+    if tools.background_deletion.folders == 0:
+        return
+    print('-' * 132)
+    print("Deletion of folders in the background: %s" % tools.background_deletion)
+
+
+def SummaryOfStaging():
+    """Display the amount of data that has been staged into the run directories, the time and the methods that were used (--staging)"""
+    if check.Run.staging.files == 0:
+        return
+    print('-' * 132)
+    print("Staging of the run directories: %s" % check.Run.staging)
+
+
+def SummaryOfDroppedBuilds(args):
+    """Display the build combinations that have been dropped in the smoke tier (--smoke), because their examples are executed with other builds"""
+    dropped = getattr(args, 'dropped_builds', [])
+    if len(dropped) == 0:
+        return
+    print('-' * 132)
+    print(tools.yellow("Smoke tier (--smoke): %s builds have been dropped, all examples have been executed with the builds above:" % len(dropped)))
+    for configuration in dropped:
+        print(tools.indent(configuration, 1))
+
+
+def SummaryOfMakespan(builds, args):
+    """
+    Display the makespan of the runs that was predicted from the wall time history (--history) and the actual makespan
+
+    The examples of a build are executed one after another (unless --concurrent-examples is used), hence, the makespan is the sum
+    over the makespans of all examples, for which the runs are packed into the core budget (longest first, at most --jobs at the same time)
+    """
+    predicted = 0.0
+    actual = 0.0
+    number_of_runs = 0
+    number_of_predicted_runs = 0
+    for build in builds:
+        examples = [example for example in getattr(build, 'examples', []) if example not in getattr(build, 'shared_examples', [])]
+        if args.concurrent_examples and args.jobs > 1:
+            groups = [examples]
+        else:
+            groups = [[example] for example in examples]
+        for group in groups:
+            runs = [run for example in group for command_line in getattr(example, 'command_lines', []) for run in command_line.runs if hasattr(run, 'finished')]
+            if len(runs) == 0:
+                continue
+            jobs = [(run.predicted_walltime, run.predicted_cores) for run in runs if run.predicted_walltime is not None]
+            # fmt: off
+            number_of_runs           += len(runs)
+            number_of_predicted_runs += len(jobs)
+            actual                   += max(run.finished for run in runs) - min(run.started for run in runs)
+            # fmt: on
+            if jobs:
+                predicted += scheduler.predict_makespan(jobs, args.CoreBudget, args.jobs)
+
+    if number_of_runs == 0:
+        return
+    print('-' * 132)
+    if number_of_predicted_runs == 0:
+        print("Makespan of the runs: actual [%.2f sec] (no wall times of previous executions available for predicting the makespan)" % actual)
+    else:
+        s = "Makespan of the runs: predicted [%.2f sec] (%s of %s runs with wall time history), actual [%.2f sec]" % (predicted, number_of_predicted_runs, number_of_runs, actual)
+        if number_of_predicted_runs == number_of_runs:
+            print(tools.blue(s))
+        else:
+            print(tools.yellow(s))
+
 
 def finalize(start, build_errors, run_errors, external_run_errors, analyze_errors, analyze_infos):
     """Display if regression check was successful or not and return the corresponding error code"""
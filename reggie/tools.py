@@ -12,9 +12,12 @@
 # ==================================================================================================================================
 from __future__ import print_function  # required for print() function with line break via "end=' '"
 import logging
+import threading
 import shutil
+import glob
+import uuid
 import os
-from timeit import default_timer as timer  # noqa: F401 imported but unused (kept for performance measurements)
+from timeit import default_timer as timer
 import time
 
 
@@ -75,6 +78,69 @@ def yellow(text):
     return bcolors.YELLOW + text + bcolors.ENDC
 
 
+class SharedCounter:
+    """
+    Integer counter that can be incremented from concurrently running threads.
+
+    The in-place addition "Class.counter += 1" is performed under a lock and returns the counter object itself, therefore the
+    class attribute is never replaced by a plain int. For printing and comparisons it behaves like an int.
+    """
+
+    def __init__(self, value=0):
+        self.value = value
+        self.lock = threading.Lock()
+
+    def __iadd__(self, other):
+        with self.lock:
+            self.value += int(other)
+        return self
+
+    def increment(self):
+        """Increment by one and return the new value (read and increment are atomic)"""
+        with self.lock:
+            self.value += 1
+            return self.value
+
+    def __int__(self):
+        return self.value
+
+    def __index__(self):
+        return self.value
+
+    def __add__(self, other):
+        return self.value + int(other)
+
+    def __radd__(self, other):
+        return int(other) + self.value
+
+    def __eq__(self, other):
+        return self.value == int(other)
+
+    def __ne__(self, other):
+        return self.value != int(other)
+
+    def __lt__(self, other):
+        return self.value < int(other)
+
+    def __le__(self, other):
+        return self.value <= int(other)
+
+    def __gt__(self, other):
+        return self.value > int(other)
+
+    def __ge__(self, other):
+        return self.value >= int(other)
+
+    def __hash__(self):
+        return id(self)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return "SharedCounter(%d)" % self.value
+
+
 def indent(text, amount, ch=' '):
     """Indent text line by amount times a white space"""
     padding = amount * 2 * ch
@@ -134,10 +200,74 @@ def find_basedir(basedir):
     return basedir
 
 
+class BackgroundDeletion:
+    """
+    Delete folders in background threads: the folder is renamed (atomic, in the same parent directory) and the renamed folder is
+    deleted by a thread, hence, the path can be re-created immediately. Folders that were renamed by a previous reggie execution,
+    which has been aborted before the deletion finished, are deleted as well. The threads are waited for in wait() at the end of the
+    reggie execution. The time spent deleting (summed over the threads) and waiting is collected for the summary.
+    """
+
+    SUFFIX = '.reggie_deleted_'
+
+    def __init__(self):
+        self.threads = []
+        self.scheduled = set()  # renamed folders that are deleted by the threads of this execution
+        self.folders = 0
+        self.time = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def remove(self, path):
+        path = os.path.abspath(path).rstrip(os.sep)
+        deleted = '%s%s%s' % (path, self.SUFFIX, uuid.uuid4().hex[:8])
+        try:
+            os.rename(path, deleted)
+        except FileNotFoundError:
+            pass
+        except OSError:  # e.g. busy or no permission for the parent directory: delete synchronously
+            shutil.rmtree(path, ignore_errors=True)
+        with self.lock:
+            paths = [p for p in glob.glob(glob.escape(path) + self.SUFFIX + '*') if p not in self.scheduled]
+            if not paths:
+                return
+            self.scheduled.update(paths)
+            thread = threading.Thread(target=self.delete, args=(paths,), name='delete %s' % path)
+            self.threads.append(thread)
+            thread.start()  # within the lock, otherwise wait() could miss the thread before it is alive
+
+    def delete(self, paths):
+        start = timer()
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        with self.lock:
+            self.folders += len(paths)
+            self.time += timer() - start
+
+    def wait(self):
+        """Wait for all deletions (also for the ones started while waiting)"""
+        start = timer()
+        while True:
+            with self.lock:
+                threads = [thread for thread in self.threads if thread.is_alive()]
+                self.threads = threads
+            if not threads:
+                break
+            for thread in threads:
+                thread.join()
+        self.waited += timer() - start
+
+    def __str__(self):
+        return "%s folders [%.2f sec], waited at the end [%.2f sec]" % (self.folders, self.time, self.waited)
+
+
+# folders removed via remove_folder() are deleted in the background, wait() is called at the end of PerformCheck.main()
+background_deletion = BackgroundDeletion()
+
+
 def remove_folder(path):
     print("deleting folder '%s'" % path)
-    shutil.rmtree(path, ignore_errors=True)
-    # shutil.rmtree(path)
+    background_deletion.remove(path)
 
 
 def create_folder(path):
@@ -0,0 +1,139 @@
+# ==================================================================================================================================
+# Copyright (c) 2017 - 2018 Stephen Copplestone and Matthias Sonntag
+#
+# This file is part of reggie2.0 (gitlab.com/reggie2.0/reggie2.0). reggie2.0 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+#
+# reggie2.0 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License v3.0 for more details.
+#
+# You should have received a copy of the GNU General Public License along with reggie2.0. If not, see <http://www.gnu.org/licenses/>.
+# ==================================================================================================================================
+import os
+import json
+import time
+import signal
+import socket
+import threading
+import contextlib
+import subprocess
+from timeit import default_timer as timer
+
+from reggie import tools
+from reggie import scheduler
+from reggie.executor import getQueuePaths
+
+
+class Worker:
+    """
+    Worker of a job queue on a shared file system (reggie --worker DIR): pulls the jobs that are submitted by the coordinator
+    (reggie --coordinator DIR, see executor.QueueExecutor) and executes their job scripts, until the coordinator has finished.
+
+    Up to 'jobs' jobs are executed at the same time, which reserve their cores from the core budget of the node. A job is only claimed
+    when its cores are free, hence, jobs that do not fit are left for other workers.
+    """
+
+    def __init__(self, directory, jobs, cores, poll_interval=5.0):
+        self.paths = getQueuePaths(directory)
+        self.jobs = jobs
+        self.budget = scheduler.CoreBudget(cores)
+        self.poll_interval = max(0.01, poll_interval)
+        self.name = "%s-%s" % (socket.gethostname(), os.getpid())
+        self.heartbeat = os.path.join(self.paths.workers, self.name)
+        self.lock = threading.Lock()
+        self.number_of_jobs = 0
+        self.stopped = threading.Event()
+
+    def main(self):
+        for path in (self.paths.queue, self.paths.running, self.paths.workers):
+            tools.create_folder(path)
+        print(tools.blue("Worker %s: executing the jobs in [%s] (%s jobs at the same time, %s cores)" % (self.name, self.paths.directory, self.jobs, self.budget.total)))
+
+        heartbeat = threading.Thread(target=self.beat, daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self.loop) for _ in range(self.jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stopped.set()
+        heartbeat.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.heartbeat)
+
+        print(tools.blue("Worker %s: the coordinator has finished, executed %s jobs" % (self.name, self.number_of_jobs)))
+
+    def beat(self):
+        """Touch the heartbeat file, which tells the coordinator that the jobs of this worker are still running"""
+        while not self.stopped.is_set():
+            with open(self.heartbeat, 'w') as f:
+                f.write("%s\n" % time.time())
+            self.stopped.wait(self.poll_interval)
+
+    def loop(self):
+        while True:
+            claimed = self.claim()
+            if claimed:
+                job, description, cores = claimed
+                try:
+                    self.execute(job, description)
+                finally:
+                    self.budget.release(cores)
+            elif os.path.exists(self.paths.stop) and not self.waiting():
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+    def waiting(self):
+        return [f for f in os.listdir(self.paths.queue) if f.endswith('.json')]
+
+    def claim(self):
+        """
+        Claim the first job in the queue whose cores are free (the rename fails if another worker has claimed the job before). The cores
+        are reserved before the rename, hence, the threads of this worker cannot claim more jobs than fit into the core budget. Returns
+        the job, its description and the reserved cores, which are released by the caller when the job is finished.
+        """
+        for filename in sorted(self.waiting()):
+            job = filename[: -len('.json')]
+            try:
+                with open(os.path.join(self.paths.queue, filename)) as f:
+                    description = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            cores = self.budget.try_acquire(description['cores'])
+            if cores is None:
+                continue
+            try:
+                os.rename(os.path.join(self.paths.queue, filename), os.path.join(self.paths.running, filename))
+            except FileNotFoundError:
+                self.budget.release(cores)
+                continue
+            with open(os.path.join(self.paths.running, job + ".worker"), 'w') as f:
+                f.write(self.name)
+            return (job, description, cores)
+        return None
+
+    def execute(self, job, description):
+        cancel = os.path.join(self.paths.running, job + ".cancel")
+        start = timer()
+        # the cores of the job have been reserved in claim()
+        # the job script writes the output and the return code into the directory of the run, which is read by the coordinator
+        process = subprocess.Popen(['sh', description['script']], cwd=description['directory'], stdin=subprocess.DEVNULL, start_new_session=True)
+        while True:
+            try:
+                process.wait(timeout=self.poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if os.path.exists(cancel):
+                    # kill the whole process group, e.g., mpirun and its ranks
+                    with contextlib.suppress(ProcessLookupError):
+                        os.killpg(process.pid, signal.SIGKILL)
+        for extension in ('.json', '.worker', '.cancel'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.paths.running, job + extension))
+
+        with self.lock:
+            self.number_of_jobs += 1
+            result = tools.blue("Successful") if process.returncode == 0 else tools.red("Failed")
+            print("Job %s [%s] %s [%.2f sec]" % (job, description['directory'], result, timer() - start))
@@ -0,0 +1,6 @@
+#include <stdio.h>
+double l2(void);
+int main(void) {
+  printf("L2 : %e\n", l2());
+  return 0;
+}
@@ -0,0 +1 @@
+double l2(void) { return 1.0e-10; }
@@ -0,0 +1,26 @@
+#!/bin/bash
+# Planning phase of gitlab_ci.py: two cases use the same build configuration (a binary linked against a shared library of the build
+# tree), which is compiled once in the planning phase; both cases must restore it from the build cache instead of compiling it
+# usage: tests/gitlab_ci_planning/run.sh
+set -u
+DIR=$(cd "$(dirname "$0")" && pwd)
+ROOT=$(cd "$DIR/../.." && pwd)
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"' EXIT
+# gitlab_ci.py expects reggie.py next to the gitlab_ci directory
+mkdir "$WORK/reggie2.0"
+cp -r "$ROOT/gitlab_ci" "$WORK/reggie2.0/"
+printf 'import sys\nsys.path.insert(0, "%s")\nfrom reggie.reggie import main\nmain()\n' "$ROOT" > "$WORK/reggie2.0/reggie.py"
+cp -r "$DIR/code" "$WORK/code"
+PYTHONPATH="$ROOT:$ROOT/reggie" python3 "$WORK/reggie2.0/gitlab_ci/gitlab_ci.py" "$WORK/code" > "$WORK/gitlab_ci.log" 2>&1
+return_code=$?
+cat "$WORK/gitlab_ci.log"
+if [ $return_code -ne 0 ]; then echo "gitlab_ci_planning: expected return code 0, got $return_code"; exit 1; fi
+if ! grep -q "Planning: compiled 1 unique builds" "$WORK/gitlab_ci.log"; then echo "gitlab_ci_planning: the build has not been compiled in the planning phase"; exit 1; fi
+for case in 1 2; do
+  if ! grep -q "restored from the build cache" "$WORK/code/output_dir_gitlab_tool/std-$case.out"; then
+    cat "$WORK/code/output_dir_gitlab_tool/std-$case.out"
+    echo "gitlab_ci_planning: case $case has not restored its build from the build cache"; exit 1
+  fi
+done
+echo "gitlab_ci_planning: successful"
@@ -0,0 +1,19 @@
+#!/bin/bash
+# Stop on first error (-p) with several examples: the first example fails and reggie must display the summary of the runs so far
+# and exit with return code 1 (the other examples are not started)
+# usage: tests/stop_on_first_error/run.sh [reggie command, default: reggie]
+set -u
+DIR=$(cd "$(dirname "$0")" && pwd)
+REGGIE=${1:-reggie}
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"' EXIT
+cd "$WORK" || exit 1
+$REGGIE -i -p -e "$DIR/fake" --history "" "$DIR/checks" > reggie.log 2>&1
+return_code=$?
+cat reggie.log
+if [ $return_code -ne 1 ]; then echo "stop_on_first_error: expected return code 1, got $return_code"; exit 1; fi
+for pattern in "Summary of Errors" "Stop on first error" "2 examples have not been started"; do
+  if ! grep -q "$pattern" reggie.log; then echo "stop_on_first_error: '$pattern' is missing in the output"; exit 1; fi
+done
+if grep -q "Traceback" reggie.log; then echo "stop_on_first_error: reggie raised an exception"; exit 1; fi
+echo "stop_on_first_error: successful"
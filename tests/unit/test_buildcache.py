@@ -0,0 +1,95 @@
+"""Unit tests of the build cache: least recently used eviction and the stability of the keys"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from reggie import buildcache
+from reggie.buildcache import BuildCache
+
+
+class TestEvict(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def addEntry(self, key, size, last_used):
+        os.makedirs(os.path.join(self.directory, key))
+        meta = os.path.join(self.directory, key, 'meta.json')
+        with open(meta, 'w') as f:
+            json.dump({'size': size}, f)
+        os.utime(meta, (last_used, last_used))
+
+    def test_least_recently_used_entries_are_removed(self):
+        self.addEntry('old', 40, 1000)
+        self.addEntry('new', 40, 3000)
+        self.addEntry('middle', 40, 2000)
+        buildcache.evict(self.directory, 100)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['middle', 'new'])
+        buildcache.evict(self.directory, 40)
+        self.assertEqual(os.listdir(self.directory), ['new'])
+
+    def test_nothing_is_removed_below_the_limit(self):
+        self.addEntry('a', 40, 1000)
+        self.addEntry('b', 40, 2000)
+        buildcache.evict(self.directory, 80)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a', 'b'])
+
+    def test_incomplete_entries_are_removed(self):
+        self.addEntry('complete', 40, 1000)
+        os.makedirs(os.path.join(self.directory, 'incomplete'))
+        buildcache.evict(self.directory, 100)
+        self.assertEqual(os.listdir(self.directory), ['complete'])
+
+
+class TestKey(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'code')
+        os.makedirs(os.path.join(self.basedir, 'src'))
+        with open(os.path.join(self.basedir, 'src', 'main.f90'), 'w') as f:
+            f.write("program main\nend program main\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def getBuild(self, options, target_directory='output_dir/build_0001'):
+        configuration = dict(option.split('=') for option in options)
+        cmake_cmd = ['cmake'] + ['-D%s' % option for option in options] + [self.basedir]
+        return SimpleNamespace(basedir=self.basedir, configuration=configuration, cmake_cmd=cmake_cmd, target_directory=target_directory, binary_path=os.path.join(target_directory, 'bin', 'code'))
+
+    def getKey(self, build):
+        return BuildCache(os.path.join(self.directory, 'cache'), 1e9).getKey(build)
+
+    def test_key_is_stable(self):
+        key = self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release', 'CODE_MPI=ON']))
+        # the order of the options and the build directory (e.g. another check directory) do not change the key
+        self.assertEqual(self.getKey(self.getBuild(['CODE_MPI=ON', 'CMAKE_BUILD_TYPE=Release'])), key)
+        self.assertEqual(self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release', 'CODE_MPI=ON'], 'other/build_0007')), key)
+
+    def test_key_changes_with_the_options(self):
+        key = self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release']))
+        self.assertNotEqual(self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Debug'])), key)
+
+    def test_key_changes_with_the_sources(self):
+        key = self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release']))
+        with open(os.path.join(self.basedir, 'src', 'main.f90'), 'a') as f:
+            f.write("! modified\n")
+        self.assertNotEqual(self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release'])), key)
+
+    def test_build_directories_do_not_change_the_key(self):
+        key = self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release']))
+        os.makedirs(os.path.join(self.basedir, 'build'))
+        for name in ('CMakeCache.txt', 'main.o'):
+            with open(os.path.join(self.basedir, 'build', name), 'w') as f:
+                f.write(name)
+        self.assertEqual(self.getKey(self.getBuild(['CMAKE_BUILD_TYPE=Release'])), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
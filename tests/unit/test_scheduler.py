@@ -0,0 +1,171 @@
+"""Unit tests of the TaskGraph (slots, exclusive keys, core packing, failures) and of predict_makespan()"""
+
+import time
+import threading
+import unittest
+
+from reggie.scheduler import CoreBudget, TaskGraph, predict_makespan
+
+
+class Recorder:
+    """Functions for the tasks of a graph that record the start order and the maximum number of concurrently running tasks/cores"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.order = []
+        self.running = 0
+        self.cores = 0
+        self.max_running = 0
+        self.max_cores = 0
+
+    def task(self, name, cores=0, seconds=0.05):
+        def function():
+            with self.lock:
+                self.order.append(name)
+                self.running += 1
+                self.cores += cores
+                self.max_running = max(self.max_running, self.running)
+                self.max_cores = max(self.max_cores, self.cores)
+            time.sleep(seconds)
+            with self.lock:
+                self.running -= 1
+                self.cores -= cores
+
+        return function
+
+
+class TestTaskGraph(unittest.TestCase):
+    def test_fifo_single_slot_keeps_the_order(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 1})
+        for name in 'abcde':
+            graph.add(name, recorder.task(name, seconds=0.0))
+        graph.run()
+        self.assertEqual(recorder.order, list('abcde'))
+        self.assertEqual(recorder.max_running, 1)
+
+    def test_slots_limit_the_concurrent_tasks(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 2, 'compile': 1})
+        for i in range(6):
+            graph.add('job%s' % i, recorder.task('job%s' % i))
+        graph.run()
+        self.assertEqual(len(recorder.order), 6)
+        self.assertEqual(recorder.max_running, 2)
+
+    def test_exclusive_tasks_do_not_overlap(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 4})
+        for i in range(4):
+            graph.add('job%s' % i, recorder.task('job%s' % i), exclusive='example')
+        graph.run()
+        self.assertEqual(recorder.max_running, 1)
+
+    def test_dependencies_include_the_children(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 4})
+
+        def parent():
+            graph.add('child', recorder.task('child', seconds=0.1))
+
+        first = graph.add('parent', parent)
+        graph.add('after', recorder.task('after', seconds=0.0), [first])
+        graph.run()
+        self.assertEqual(recorder.order, ['child', 'after'])
+
+    def test_longest_order(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 1}, cores=4, order='longest')
+        graph.add('short', recorder.task('short', seconds=0.0), cores=1, duration=1.0)
+        graph.add('long', recorder.task('long', seconds=0.0), cores=1, duration=10.0)
+        graph.add('unknown', recorder.task('unknown', seconds=0.0), cores=1, duration=None)
+        graph.add('medium', recorder.task('medium', seconds=0.0), cores=1, duration=5.0)
+        graph.run()
+        # unknown durations first, then the longest ones
+        self.assertEqual(recorder.order, ['unknown', 'long', 'medium', 'short'])
+
+    def test_core_packing_with_backfilling(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 4}, cores=4, order='longest')
+        graph.add('short', recorder.task('short', 1), cores=1, duration=1.0)
+        graph.add('long', recorder.task('long', 3), cores=3, duration=10.0)
+        graph.add('unknown', recorder.task('unknown', 2), cores=2, duration=None)
+        graph.add('medium', recorder.task('medium', 2), cores=2, duration=5.0)
+        graph.run()
+        # the long task does not fit next to the unknown one, the medium task is started instead
+        self.assertEqual(set(recorder.order[:2]), {'unknown', 'medium'})
+        self.assertEqual(set(recorder.order[2:]), {'long', 'short'})
+        self.assertLessEqual(recorder.max_cores, 4)
+
+    def test_cores_are_clamped_to_the_graph(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 2}, cores=2, order='longest')
+        graph.add('huge', recorder.task('huge', 2), cores=64, duration=1.0)
+        graph.add('small', recorder.task('small', 1), cores=1, duration=0.5)
+        graph.run()
+        self.assertEqual(recorder.order, ['huge', 'small'])
+        self.assertEqual(recorder.max_running, 1)
+
+    def test_failure_drops_the_waiting_tasks(self):
+        recorder = Recorder()
+        errors = []
+        graph = TaskGraph({'job': 1}, on_error=lambda: errors.append('on_error'))
+
+        def fail():
+            raise ValueError('task failed')
+
+        failed = graph.add('fail', fail)
+        graph.add('dependent', recorder.task('dependent'), [failed])
+        graph.add('independent', recorder.task('independent'))
+        with self.assertRaises(ValueError):
+            graph.run()
+        self.assertEqual(recorder.order, [])
+        self.assertEqual(sorted(task.name for task in graph.dropped), ['dependent', 'independent'])
+        self.assertEqual(errors, ['on_error'])
+
+    def test_exit_is_raised_after_the_running_tasks_returned(self):
+        recorder = Recorder()
+        graph = TaskGraph({'job': 2})
+        graph.add('running', recorder.task('running', seconds=0.1))
+        graph.add('exit', lambda: exit(1))
+        with self.assertRaises(SystemExit):
+            graph.run()
+        self.assertEqual(recorder.order, ['running'])
+        self.assertEqual(recorder.running, 0)
+
+    def test_tasks_added_after_a_failure_are_dropped(self):
+        graph = TaskGraph({'job': 1})
+        graph.fail(RuntimeError('failed'))
+        graph.add('late', lambda: None)
+        self.assertEqual([task.name for task in graph.dropped], ['late'])
+        with self.assertRaises(RuntimeError):
+            graph.run()
+
+
+class TestCoreBudget(unittest.TestCase):
+    def test_try_acquire(self):
+        budget = CoreBudget(4)
+        self.assertEqual(budget.try_acquire(3), 3)
+        self.assertIsNone(budget.try_acquire(2))
+        self.assertEqual(budget.try_acquire(1), 1)
+        budget.release(4)
+        self.assertEqual(budget.try_acquire(16), 4)  # clamped to the total budget
+
+
+class TestPredictMakespan(unittest.TestCase):
+    def test_packing_into_the_cores(self):
+        self.assertEqual(predict_makespan([(4.0, 2), (2.0, 2), (2.0, 2)], 4, 4), 4.0)
+
+    def test_slots_limit_the_concurrent_jobs(self):
+        self.assertEqual(predict_makespan([(1.0, 1)] * 4, 4, 2), 2.0)
+
+    def test_backfilling(self):
+        # the 3-core job runs with the 1-core jobs, the 4-core job waits until all of them have finished
+        self.assertEqual(predict_makespan([(10.0, 3), (9.0, 4), (5.0, 1), (5.0, 1)], 4, 4), 19.0)
+
+    def test_jobs_larger_than_the_machine_run_alone(self):
+        self.assertEqual(predict_makespan([(3.0, 64), (1.0, 1)], 4, 4), 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
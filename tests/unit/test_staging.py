@@ -0,0 +1,120 @@
+"""Unit tests of the staging of the run directories: precedence of the staging.ini rules and the fallback order of the methods"""
+
+import os
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from reggie import staging
+from reggie.staging import Staging
+
+
+class StagingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.example = os.path.join(self.directory, 'example')
+        os.makedirs(os.path.join(self.example, 'tables'))
+        for name in ('parameter.ini', 'mesh_mesh.h5', 'restart_State_1.h5', 'tables/a.dat', 'tables/b.dat', 'other.dat'):
+            with open(os.path.join(self.example, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def writeStagingFile(self, *lines):
+        with open(os.path.join(self.example, staging.STAGING_FILE), 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+    def stage(self, strategy):
+        stage = Staging(strategy)
+        run = os.path.join(self.directory, 'run')
+        os.makedirs(run)
+        for name in os.listdir(self.example):  # as Run.stage()
+            stage.stage(os.path.join(self.example, name), os.path.join(run, name), self.example)
+        return stage, run
+
+    def assertLinked(self, path, linked):
+        self.assertEqual(os.path.samefile(os.path.join(self.example, path), os.path.join(self.directory, 'run', path)), linked, path)
+
+
+class TestRules(StagingTestCase):
+    def test_precedence_copy_symlink_hardlink(self):
+        self.writeStagingFile('hardlink = *.h5, *.ini', 'symlink = mesh_*.h5', 'copy = restart_*.h5')
+        _, run = self.stage('hardlink')
+        # 'copy' wins over 'hardlink', 'symlink' wins over 'hardlink'
+        self.assertFalse(os.path.islink(os.path.join(run, 'restart_State_1.h5')))
+        self.assertLinked('restart_State_1.h5', False)
+        self.assertTrue(os.path.islink(os.path.join(run, 'mesh_mesh.h5')))
+        # the parameter files are rewritten by reggie and never linked
+        self.assertLinked('parameter.ini', False)
+        self.assertLinked('other.dat', False)
+
+    def test_copy_wins_over_symlink(self):
+        self.writeStagingFile('symlink = *.h5', 'copy = restart_*.h5')
+        _, run = self.stage('reflink')
+        self.assertTrue(os.path.islink(os.path.join(run, 'mesh_mesh.h5')))
+        self.assertFalse(os.path.islink(os.path.join(run, 'restart_State_1.h5')))
+
+    def test_symlinked_directory(self):
+        self.writeStagingFile('symlink = tables')
+        _, run = self.stage('copy')
+        self.assertTrue(os.path.islink(os.path.join(run, 'tables')))
+        self.assertEqual(os.path.realpath(os.path.join(run, 'tables')), os.path.realpath(os.path.join(self.example, 'tables')))
+
+    def test_copy_inside_a_symlinked_directory(self):
+        self.writeStagingFile('symlink = tables', 'copy = tables/b.dat')
+        _, run = self.stage('copy')
+        self.assertFalse(os.path.islink(os.path.join(run, 'tables')))
+        self.assertTrue(os.path.islink(os.path.join(run, 'tables', 'a.dat')))
+        self.assertFalse(os.path.islink(os.path.join(run, 'tables', 'b.dat')))
+
+    def test_hardlink_requires_the_hardlink_strategy(self):
+        self.writeStagingFile('hardlink = *.h5')
+        self.stage('reflink')
+        self.assertLinked('mesh_mesh.h5', False)
+
+    def test_hardlink_strategy(self):
+        self.writeStagingFile('hardlink = *.h5')
+        self.stage('hardlink')
+        self.assertLinked('mesh_mesh.h5', True)
+        self.assertLinked('other.dat', False)
+
+
+class TestFallback(StagingTestCase):
+    def test_methods(self):
+        stage = Staging('hardlink')
+        src, dst = os.path.join(self.example, 'mesh_mesh.h5'), os.path.join(self.directory, 'mesh_mesh.h5')
+        self.assertEqual(stage.getMethods(src, dst, 'hardlink')[1], ['hardlink', 'reflink', 'copy'])
+        self.assertEqual(stage.getMethods(src, dst)[1], ['reflink', 'copy'])
+        self.assertEqual(stage.getMethods(src, dst, 'symlink')[1], ['symlink'])
+        self.assertEqual(Staging('copy').getMethods(src, dst, 'hardlink')[1], ['copy'])
+
+    def test_unsupported_method_is_not_tried_again(self):
+        stage = Staging('reflink')
+        src = os.path.join(self.example, 'other.dat')
+        with mock.patch.object(staging, 'reflink', side_effect=OSError(errno.EOPNOTSUPP, 'not supported')) as reflink:
+            stage.copyFile(src, os.path.join(self.directory, 'copy1.dat'))
+            stage.copyFile(src, os.path.join(self.directory, 'copy2.dat'))
+        self.assertEqual(reflink.call_count, 1)
+        self.assertEqual(stage.bytes['copy'], 2 * os.path.getsize(src))
+        with open(os.path.join(self.directory, 'copy2.dat')) as f:
+            self.assertEqual(f.read(), 'other.dat')
+
+    def test_hardlink_falls_back_to_copy(self):
+        stage = Staging('hardlink')
+        src = os.path.join(self.example, 'mesh_mesh.h5')
+        with mock.patch.object(staging.os, 'link', side_effect=OSError(errno.EXDEV, 'cross-device link')), mock.patch.object(staging, 'reflink', side_effect=OSError(errno.EOPNOTSUPP, 'not supported')):
+            stage.copyFile(src, os.path.join(self.directory, 'mesh.h5'), 'hardlink')
+        self.assertEqual(stage.bytes['copy'], os.path.getsize(src))
+        self.assertEqual(stage.bytes['hardlink'], 0)
+
+    def test_other_errors_are_raised(self):
+        stage = Staging('reflink')
+        with mock.patch.object(staging, 'reflink', side_effect=OSError(errno.ENOSPC, 'no space left on device')), self.assertRaises(OSError):
+            stage.copyFile(os.path.join(self.example, 'other.dat'), os.path.join(self.directory, 'copy.dat'))
+
+
+if __name__ == '__main__':
+    unittest.main()